@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import optparse
+import sys
+
+from opencenter.benchmark import DEFAULT_SIZES, SCENARIOS, run_benchmarks
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--scenario', action='append',
+                      choices=sorted(SCENARIOS),
+                      help='scenario to run, may be repeated (default all)')
+    parser.add_option('-n', '--nodes', action='append', type='int',
+                      help='cluster size, may be repeated (default %s)' %
+                      ', '.join(str(size) for size in DEFAULT_SIZES))
+    parser.add_option('--latency', type='float', default=0.0,
+                      help='seconds of simulated latency per request')
+    parser.add_option('--task-duration', type='float', default=0.01,
+                      help='seconds every simulated task runs for')
+    parser.add_option('--timeout', type='int', default=3600,
+                      help='seconds before a run is killed and reported '
+                           'as an error [%default]')
+    parser.add_option('-o', '--output', default='benchmark.json',
+                      help='file to write the json results to')
+    options, args = parser.parse_args()
+
+    report = run_benchmarks(options.scenario, options.nodes, options.latency,
+                            options.task_duration, options.timeout)
+    with open(options.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+
+    failed = False
+    for result in report['results']:
+        if 'error' in result:
+            failed = True
+            print '%-12s %5d nodes  ERROR %s' % (result['scenario'],
+                                                 result['nodes'],
+                                                 result['error'])
+            continue
+        failed = failed or result['failures'] or result['errors']
+        print ('%-12s %5d nodes %8.2fs %6d requests %10d bytes %8d KB '
+               '(server %d KB)' %
+               (result['scenario'], result['nodes'], result['wall_time'],
+                result['requests'],
+                result['bytes_in'] + result['bytes_out'],
+                result['peak_rss_kb'], result['server_peak_rss_kb']))
+    sys.exit(1 if failed else 0)
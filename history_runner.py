@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import optparse
+import sys
+import time
+
+from opencenter.history import History, find_regressions, format_regressions
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--db', metavar='FILE',
+                      help='history database (default history_db from the '
+                           'opencenter config)')
+    parser.add_option('-t', '--test', help='only this test id')
+    parser.add_option('-c', '--cluster', help='only this cluster')
+    parser.add_option('-w', '--window', type='int', default=14,
+                      help='earlier runs to compare against [%default]')
+    parser.add_option('--threshold', type='float', default=0.3,
+                      help='slowdown that counts, 0.3 is 30%% [%default]')
+    parser.add_option('--min-z', type='float', default=3.0,
+                      help='robust z-score a slowdown needs [%default]')
+    parser.add_option('--min-delta', type='float', default=1.0,
+                      help='seconds a slowdown needs [%default]')
+    parser.add_option('--min-runs', type='int', default=5,
+                      help='earlier runs needed to judge [%default]')
+    parser.add_option('--by-node', action='store_true',
+                      help='compare each adventure per node')
+    parser.add_option('--runs', action='store_true',
+                      help='list the recorded runs instead')
+    parser.add_option('--json', action='store_true',
+                      help='print the regressions as json')
+    options, args = parser.parse_args()
+
+    path = options.db
+    if path is None:
+        from opencenter.config import get_config
+        path = get_config().opencenter.history_db
+    if not path:
+        parser.error('no --db given and no history_db configured')
+    history = History(path)
+
+    runs = history.runs(options.test, options.cluster)
+    if options.runs:
+        for run in runs:
+            print '%5d %s %-40s %-20s %8.1fs %s' % (
+                run['id'],
+                time.strftime('%Y-%m-%d %H:%M',
+                              time.localtime(run['started'])),
+                run['test'], run['cluster'], run['duration'] or 0,
+                'OK' if run['successful'] else 'FAIL')
+        sys.exit(0)
+
+    report = {}
+    for test, cluster in sorted(set((r['test'], r['cluster']) for r in runs)):
+        regressions = find_regressions(history, test, cluster,
+                                       window=options.window,
+                                       threshold=options.threshold,
+                                       min_z=options.min_z,
+                                       min_runs=options.min_runs,
+                                       min_delta=options.min_delta,
+                                       by_node=options.by_node)
+        if regressions:
+            report['%s %s' % (test, cluster)] = regressions
+            if not options.json:
+                print '%s on %s:' % (test, cluster)
+                print format_regressions(regressions)
+    if options.json:
+        print json.dumps(report, indent=2, sort_keys=True)
+    elif not report:
+        print 'No regressions found.'
+    sys.exit(1 if report else 0)
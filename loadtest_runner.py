@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import optparse
+import sys
+
+from opencenter.loadtest import HEARTBEAT_FACT, format_report, run_load
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-a', '--agents', type='int', default=10,
+                      help='simulated agents [%default]')
+    parser.add_option('-m', '--operators', type='int', default=2,
+                      help='simulated operators [%default]')
+    parser.add_option('-r', '--rate', type='float', default=50.0,
+                      help='target operations per second [%default]')
+    parser.add_option('-d', '--duration', type='float', default=60.0,
+                      help='seconds to run for [%default]')
+    parser.add_option('--adventure', metavar='NAME',
+                      help='adventure operators execute on agent nodes '
+                           '(default: no executes)')
+    parser.add_option('--execute-ratio', type='float', default=0.1,
+                      help='share of operator operations that execute '
+                           'the adventure [%default]')
+    parser.add_option('--write-facts', action='store_true', default=False,
+                      help='have agents write a %s fact to their '
+                           'node, which stays on the server' % HEARTBEAT_FACT)
+    parser.add_option('--progress', type='float', metavar='SECONDS',
+                      help='print running totals this often, for soak runs')
+    parser.add_option('--mock', type='int', metavar='NODES',
+                      help='run against a mock server with NODES agents '
+                           'instead of the configured endpoint')
+    parser.add_option('--max-error-rate', type='float', default=0.0,
+                      help='exit non-zero above this error rate [%default]')
+    parser.add_option('-o', '--output', default='loadtest.json',
+                      help='file to write the json report to')
+    options, args = parser.parse_args()
+    if options.agents < 0 or options.operators < 0:
+        parser.error('--agents and --operators cannot be negative')
+    if options.agents + options.operators == 0:
+        parser.error('need at least one agent or operator')
+    if options.rate <= 0:
+        parser.error('--rate must be positive')
+
+    server = None
+    if options.mock:
+        from opencenter.mockserver import MockOpenCenterServer
+        server = MockOpenCenterServer(node_count=options.mock).start()
+        endpoint_url, user, password = server.url, None, None
+    else:
+        from opencenter.config import get_config
+        opencenter_config = get_config().opencenter
+        endpoint_url = opencenter_config.endpoint_url
+        user = opencenter_config.user
+        password = opencenter_config.password
+
+    try:
+        report = run_load(endpoint_url, user, password,
+                          agents=options.agents,
+                          operators=options.operators,
+                          rate=options.rate,
+                          duration=options.duration,
+                          adventure=options.adventure,
+                          execute_ratio=options.execute_ratio,
+                          progress_interval=options.progress,
+                          write_facts=options.write_facts)
+    finally:
+        if server:
+            server.stop()
+    with open(options.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print format_report(report)
+    sys.exit(1 if report['error_rate'] > options.max_error_rate else 0)
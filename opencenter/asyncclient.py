@@ -0,0 +1,256 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import logging
+import Queue
+import sys
+import threading
+import time
+
+from opencenter.rest import RestClient
+from opencenter.tasks import TERMINAL_STATES, TaskTimeout, TaskUpdateFeed
+
+
+class Future(object):
+    """The eventual result of a call made through AsyncEndpoint.
+
+    A future is finished once; later attempts to set its outcome are
+    ignored. A done callback that raises is logged and doesn't affect
+    the future or the other callbacks."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exc_info):
+        self._finish(None, exc_info)
+
+    def _finish(self, result, exc_info):
+        with self._lock:
+            if self._done.is_set():
+                logging.getLogger(__name__).warning(
+                    "Ignoring a second outcome for a finished future")
+                return
+            self._result, self._exc_info = result, exc_info
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "Done callback %r failed" % (callback, ))
+
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timed out waiting for result')
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+def gather(futures, timeout=None):
+    """Wait for every future and return their results in order."""
+    deadline = None if timeout is None else time.time() + timeout
+    results = []
+    for future in futures:
+        remaining = None
+        if deadline is not None:
+            remaining = max(deadline - time.time(), 0)
+        results.append(future.result(remaining))
+    return results
+
+
+class AsyncEndpoint(object):
+    """Non-blocking facade over the opencenter REST API.
+
+    Every call returns a Future. Requests are run by a fixed pool of
+    `workers` threads sharing one keep-alive connection pool. Task waits
+    don't take a thread each: a single waiter thread follows the task
+    update feed (or polls with backoff) and checks all outstanding tasks
+    together, with one task listing once more than batch_threshold are
+    pending. Hundreds of waits therefore cost a handful of requests per
+    poll. A task that isn't finished task_timeout seconds after its wait
+    began, or can't be fetched at all, fails only its own waits.
+    Results are the decoded json objects from the server."""
+
+    def __init__(self, endpoint_url, user=None, password=None, workers=16,
+                 poll_interval=0.5, max_poll_interval=5.0, batch_threshold=10,
+                 task_timeout=3600):
+        self.rest = RestClient(endpoint_url, user, password,
+                               pool_size=workers)
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.batch_threshold = batch_threshold
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._waits = {}
+        self._waiter = None
+        self._feed = TaskUpdateFeed(self.rest)
+
+    # request pool
+
+    def submit(self, func, *args, **kwargs):
+        """Run func in the worker pool and return a Future for it."""
+        future = Future()
+        with self._lock:
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def _work(self):
+        while True:
+            future, func, args, kwargs = self._queue.get()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
+
+    def _call(self, method, path, key=None, data=None, expect=(200, )):
+        status, body = self.rest.request(method, path, data=data)
+        if status not in expect:
+            raise RuntimeError('%s %s returned %s: %s' %
+                               (method, path, status, body))
+        return body[key] if key else (status, body)
+
+    def nodes(self):
+        return self.submit(self._call, 'GET', 'nodes/', 'nodes')
+
+    def node(self, node_id):
+        return self.submit(self._call, 'GET', 'nodes/%s' % node_id, 'node')
+
+    def node_tasks(self, node_id):
+        return self.submit(self._call, 'GET', 'nodes/%s/tasks' % node_id,
+                           'tasks')
+
+    def adventures(self):
+        return self.submit(self._call, 'GET', 'adventures/', 'adventures')
+
+    def task(self, task_id):
+        return self.submit(self._call, 'GET', 'tasks/%s' % task_id, 'task')
+
+    def create_fact(self, node_id, key, value):
+        """Future of (status, body); body holds the task on a 202."""
+        return self.submit(self._call, 'POST', 'facts/',
+                           data={'node_id': node_id, 'key': key,
+                                 'value': value},
+                           expect=(200, 201, 202))
+
+    def execute(self, adventure_id, node_id, plan_args=None):
+        """Future of (status, body); body holds the task on a 202."""
+        data = {'node': node_id}
+        if plan_args is not None:
+            data['plan_args'] = plan_args
+        return self.submit(self._call, 'POST',
+                           'adventures/%s/execute' % adventure_id,
+                           data=data, expect=(202, 409))
+
+    # task waits
+
+    def wait_for_task(self, task_id, timeout=None):
+        """Future resolving to the task dict once it is in a terminal
+        state, or failing with TaskTimeout after timeout seconds
+        (task_timeout by default)."""
+        future = Future()
+        deadline = time.time() + (timeout or self.task_timeout)
+        with self._lock:
+            self._waits.setdefault(task_id, []).append((future, deadline))
+            if self._waiter is None or not self._waiter.is_alive():
+                self._waiter = threading.Thread(target=self._wait_loop)
+                self._waiter.daemon = True
+                self._waiter.start()
+        return future
+
+    def wait_for_tasks(self, task_ids):
+        return [self.wait_for_task(task_id) for task_id in task_ids]
+
+    def _wait_loop(self):
+        txid = 0
+        interval = self.poll_interval
+        while True:
+            with self._lock:
+                pending = list(self._waits)
+                if not pending:
+                    self._waiter = None
+                    return
+            states, errors = self._task_states(pending)
+
+            finished, failed = [], []
+            now = time.time()
+            with self._lock:
+                for task_id, task in states.items():
+                    if task['state'] in TERMINAL_STATES:
+                        finished.append((task, self._waits.pop(task_id, [])))
+                for task_id, exc_info in errors.items():
+                    failed.extend((future, exc_info) for future, _
+                                  in self._waits.pop(task_id, []))
+                for task_id, waits in self._waits.items():
+                    expired = [(future, deadline) for future, deadline
+                               in waits if deadline <= now]
+                    for future, deadline in expired:
+                        waits.remove((future, deadline))
+                        failed.append((future, (TaskTimeout, TaskTimeout(
+                            'task %s did not finish in time' % task_id),
+                            None)))
+                    if not waits:
+                        del self._waits[task_id]
+            for task, waits in finished:
+                for future, _ in waits:
+                    future.set_result(task)
+            for future, exc_info in failed:
+                future.set_exception(exc_info)
+
+            if finished:
+                interval = self.poll_interval
+            else:
+                interval = min(interval * 2, self.max_poll_interval)
+            txid = self._feed.wait(txid, interval)
+
+    def _task_states(self, task_ids):
+        """({task id: task}, {task id: exc_info}) for task_ids. Tasks the
+        listing leaves out, or all of them if it fails, are fetched one
+        by one, and a failed fetch only affects that task."""
+        states = {}
+        if len(task_ids) > self.batch_threshold:
+            try:
+                tasks = self._call('GET', 'tasks/', 'tasks')
+            except Exception:
+                tasks = []
+            wanted = set(task_ids)
+            states = dict((t['id'], t) for t in tasks if t['id'] in wanted)
+        futures = [(task_id, self.task(task_id)) for task_id in task_ids
+                   if task_id not in states]
+        errors = {}
+        for task_id, future in futures:
+            try:
+                states[task_id] = future.result()
+            except Exception:
+                errors[task_id] = sys.exc_info()
+        return states, errors
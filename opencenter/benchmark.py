@@ -0,0 +1,241 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import ConfigParser
+import multiprocessing
+import os
+import platform
+import Queue
+import resource
+import shutil
+import StringIO
+import tempfile
+import time
+
+import unittest2
+
+from opencenter.mockserver import MockOpenCenterServer
+
+
+SCENARIOS = {
+    'happy_path': 'opencenter.tests.test_happy_path.OpenCenterTestCase',
+    'upgrade': 'opencenter.tests.test_package_upgrade.AdventureTest',
+}
+
+DEFAULT_SIZES = [5, 50, 500]
+
+# Harness settings used against the simulated endpoint, where tasks
+# finish in milliseconds
+MOCK_SETTINGS = {
+    'task_quiet_period': '0.2',
+    'task_poll_interval': '0.02',
+    'task_max_poll_interval': '0.2',
+    'node_cache_ttl': '5',
+    'reparent_workers': '8',
+    'scheduler_workers': '16',
+    'rollout_workers': '16',
+}
+
+
+def write_config(path, url, node_count):
+    """Write an opencenter config for a mock server with node_count
+    agents: agent1 is the chef server, agents 2 and 3 the controllers
+    and every other agent a compute."""
+    agents = ['opencenter-agent%d' % i for i in range(1, node_count + 1)]
+    config = ConfigParser.SafeConfigParser()
+    config.add_section('opencenter')
+    config.set('opencenter', 'endpoint_url', url)
+    config.set('opencenter', 'instance_server_hostname', 'opencenter-server')
+    config.set('opencenter', 'instance_chef_hostname', agents[0])
+    config.set('opencenter', 'instance_controller_hostname',
+               ','.join(agents[1:3]))
+    config.set('opencenter', 'instance_compute_hostname',
+               ','.join(agents[3:]))
+    for key, value in MOCK_SETTINGS.items():
+        config.set('opencenter', key, value)
+    config.add_section('cluster_data')
+    config.set('cluster_data', 'cluster_name', 'test_cluster')
+    config.add_section('vip_data')
+    config.set('vip_data', 'nova_api_vip', '10.0.0.100')
+    config.set('vip_data', 'nova_mysql_vip', '10.0.0.101')
+    config.set('vip_data', 'nova_rabbitmq_vip', '10.0.0.102')
+    with open(path, 'w') as conf_file:
+        config.write(conf_file)
+
+
+def _serve(conn, node_count, latency, task_duration):
+    """Body of a MockServerProcess: run a mock server and answer the
+    reset, stats and stop commands sent over conn."""
+    server = MockOpenCenterServer(node_count=node_count, latency=latency,
+                                  task_duration=task_duration).start()
+    conn.send(server.url)
+    try:
+        while True:
+            command = conn.recv()
+            if command == 'reset':
+                server.reset_stats()
+                conn.send(None)
+            elif command == 'stats':
+                stats = dict(server.stats)
+                stats['peak_rss_kb'] = resource.getrusage(
+                    resource.RUSAGE_SELF).ru_maxrss
+                conn.send(stats)
+            else:
+                break
+    finally:
+        server.stop()
+
+
+class MockServerProcess(object):
+    """A MockOpenCenterServer in a process of its own, so its memory
+    and CPU time don't count towards the harness being measured."""
+
+    def __init__(self, node_count, latency=0.0, task_duration=0.01,
+                 timeout=60):
+        self.args = (node_count, latency, task_duration)
+        self.timeout = timeout
+        self.process = None
+        self.conn = None
+        self.url = None
+
+    def start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve,
+                                               args=(child_conn, ) + self.args)
+        self.process.daemon = True
+        self.process.start()
+        self.url = self._receive()
+        return self
+
+    def _receive(self):
+        if not self.conn.poll(self.timeout):
+            raise RuntimeError('mock server process did not answer within '
+                               '%ds' % self.timeout)
+        return self.conn.recv()
+
+    def call(self, command):
+        self.conn.send(command)
+        return self._receive()
+
+    def stats(self):
+        """Request counts and bytes per route since the last reset, and
+        the server's peak_rss_kb."""
+        return self.call('stats')
+
+    def reset_stats(self):
+        self.call('reset')
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            try:
+                self.conn.send('stop')
+            except (IOError, OSError):
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.process.join()
+        self.process = None
+
+
+def run_scenario(scenario, node_count, latency=0.0, task_duration=0.01):
+    """Run one scenario against a fresh mock server and return its
+    measurements. Meant to run in its own process so the config
+    singleton and peak memory figures belong to this run only. The
+    mock server runs in a further process; its peak memory is reported
+    separately as server_peak_rss_kb."""
+    if node_count < 4:
+        raise ValueError('need at least 4 agents, got %d' % node_count)
+    conf_dir = tempfile.mkdtemp(prefix='opencenter-bench-')
+    server = MockServerProcess(node_count, latency, task_duration)
+    try:
+        server.start()
+        write_config(os.path.join(conf_dir, 'bench.conf'), server.url,
+                     node_count)
+        os.environ['OPENCENTER_CONFIG_DIR'] = conf_dir
+        os.environ['OPENCENTER_CONFIG'] = 'bench.conf'
+
+        tests = unittest2.TestLoader().loadTestsFromName(SCENARIOS[scenario])
+        stream = StringIO.StringIO()
+        server.reset_stats()
+        started = time.time()
+        result = unittest2.TextTestRunner(stream=stream).run(tests)
+        wall_time = time.time() - started
+        stats = server.stats()
+    finally:
+        server.stop()
+        shutil.rmtree(conf_dir, ignore_errors=True)
+
+    return {
+        'scenario': scenario,
+        'nodes': node_count,
+        'tests_run': result.testsRun,
+        'failures': len(result.failures),
+        'errors': len(result.errors),
+        'wall_time': round(wall_time, 3),
+        'requests': stats['requests'],
+        'bytes_in': stats['bytes_in'],
+        'bytes_out': stats['bytes_out'],
+        'routes': stats['routes'],
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'server_peak_rss_kb': stats['peak_rss_kb'],
+        'output': stream.getvalue() if not result.wasSuccessful() else '',
+    }
+
+
+def _run_in_child(queue, scenario, node_count, latency, task_duration):
+    try:
+        queue.put(run_scenario(scenario, node_count, latency, task_duration))
+    except Exception as e:
+        queue.put({'scenario': scenario, 'nodes': node_count,
+                   'error': '%s: %s' % (e.__class__.__name__, e)})
+
+
+def _child_result(queue, child, scenario, node_count, timeout):
+    """The result child puts on queue, or an error result if it dies
+    without one or runs past timeout seconds."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Queue.Empty:
+            pass
+        if not child.is_alive():
+            # a result put just before exiting may still be in flight
+            try:
+                return queue.get(timeout=1)
+            except Queue.Empty:
+                error = 'benchmark process died with exit code %s' % (
+                    child.exitcode, )
+                break
+        if time.time() > deadline:
+            child.terminate()
+            error = 'benchmark process still running after %ds' % timeout
+            break
+    return {'scenario': scenario, 'nodes': node_count, 'error': error}
+
+
+def run_benchmarks(scenarios=None, sizes=None, latency=0.0,
+                   task_duration=0.01, timeout=3600):
+    """Run every scenario at every size, each in a separate process,
+    and return a report dict suitable for json.dump. A run that crashes
+    or takes longer than timeout seconds is reported as an error."""
+    results = []
+    for scenario in scenarios or sorted(SCENARIOS):
+        for node_count in sizes or DEFAULT_SIZES:
+            queue = multiprocessing.Queue()
+            child = multiprocessing.Process(
+                target=_run_in_child,
+                args=(queue, scenario, node_count, latency, task_duration))
+            child.start()
+            results.append(_child_result(queue, child, scenario, node_count,
+                                         timeout))
+            child.join()
+    return {
+        'generated': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'latency': latency,
+        'task_duration': task_duration,
+        'results': results,
+    }
@@ -0,0 +1,300 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+"""
+Record and replay of opencenter-server API traffic.
+
+A RecordingProxy sits between the harness and a real server and writes
+every request and response into a cassette: gzipped json with an index
+from request to responses. A ReplayServer serves a cassette back, so a
+happy path or upgrade run can be repeated in seconds without hardware:
+
+    $ python -m opencenter.cassette record --target http://ocs:8080 \\
+          --port 8080 -o happy.cassette
+    $ python -m opencenter.cassette replay happy.cassette --port 8080
+
+Setting record_cassette or replay_cassette in [opencenter] does the
+same from inside the test run.
+
+Replay matches on method, path and request body. The n-th identical
+request gets the n-th recorded response, and the last one once the
+recording runs out, so polling converges on the final state. A request
+that matches nothing means the run has strayed from the recording: it
+is logged and answered with a 500, not a 404 that clients would take
+for a missing endpoint. Original response times are replayed divided
+by speed; speed 0 replays without delays.
+"""
+
+import abc
+import BaseHTTPServer
+import gzip
+import hashlib
+import json
+import logging
+import optparse
+import threading
+import time
+
+import requests
+
+from opencenter.mockserver import MockHTTPServer
+
+
+FORMAT_VERSION = 1
+
+# Request headers passed through to the recorded server
+FORWARD_HEADERS = ('Authorization', 'Content-Type', 'Accept')
+
+# Status replayed for requests the cassette has no response for
+MISS_STATUS = 500
+
+
+def request_key(method, path, body=''):
+    """Index key for a request; body is the raw request body."""
+    digest = '-'
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True)
+        except ValueError:
+            pass
+        digest = hashlib.sha1(body).hexdigest()[:16]
+    return '%s %s %s' % (method, path, digest)
+
+
+class Cassette(object):
+    """Recorded interactions, in the order they completed."""
+
+    def __init__(self, target=None, interactions=None):
+        self.target = target
+        self.interactions = interactions or []
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, method, path, body, status, content_type, response,
+               elapsed):
+        with self._lock:
+            self.interactions.append({
+                'key': request_key(method, path, body),
+                'at': round(time.time() - self.started, 4),
+                'elapsed': round(elapsed, 4),
+                'status': status,
+                'content_type': content_type,
+                'response': response,
+            })
+
+    def index(self):
+        """{request key: [interaction numbers]} in recorded order."""
+        index = {}
+        for number, interaction in enumerate(self.interactions):
+            index.setdefault(interaction['key'], []).append(number)
+        return index
+
+    def save(self, path):
+        with self._lock:
+            data = {'version': FORMAT_VERSION, 'target': self.target,
+                    'interactions': self.interactions,
+                    'index': self.index()}
+            cassette = gzip.open(path, 'wb')
+            try:
+                json.dump(data, cassette, separators=(',', ':'))
+            finally:
+                cassette.close()
+
+    @classmethod
+    def load(cls, path):
+        cassette = gzip.open(path, 'rb')
+        try:
+            data = json.load(cassette)
+        finally:
+            cassette.close()
+        if data.get('version') != FORMAT_VERSION:
+            raise RuntimeError('Unsupported cassette version %s in %s' %
+                               (data.get('version'), path))
+        return cls(data.get('target'), data['interactions'])
+
+
+class CassetteRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        length = int(self.headers.getheader('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+        headers = dict((name, self.headers.getheader(name))
+                       for name in FORWARD_HEADERS
+                       if self.headers.getheader(name))
+        status, content_type, data = self.server.app.handle(
+            method, self.path, headers, body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type or 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CassetteServer(object):
+    """Abstract base for the proxy and the replay server: runs handle()
+    behind a threaded HTTP server."""
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.httpd = None
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % (self.host, self.port)
+
+    def start(self):
+        self.httpd = MockHTTPServer((self.host, self.port),
+                                    CassetteRequestHandler)
+        self.httpd.app = self
+        self.port = self.httpd.server_address[1]
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @abc.abstractmethod
+    def handle(self, method, path, headers, body):
+        """Return (status, content type, response body)."""
+
+
+class RecordingProxy(CassetteServer):
+    """Forwards everything to target and records it into a Cassette,
+    written to path when the proxy stops."""
+
+    def __init__(self, target, path, host='127.0.0.1', port=0):
+        super(RecordingProxy, self).__init__(host, port)
+        if '://' not in target:
+            target = 'http://' + target
+        self.target = target.rstrip('/')
+        self.path = path
+        self.cassette = Cassette(self.target)
+        self.session = requests.session()
+
+    def handle(self, method, path, headers, body):
+        started = time.time()
+        try:
+            resp = self.session.request(method, self.target + path,
+                                        data=body or None, headers=headers)
+            status, data = resp.status_code, resp.content
+            content_type = resp.headers.get('content-type')
+        except requests.exceptions.RequestException as e:
+            status, content_type = 502, 'application/json'
+            data = json.dumps({'message': 'proxy error: %s' % e})
+        self.cassette.record(method, path, body, status, content_type, data,
+                             time.time() - started)
+        return status, content_type, data
+
+    def stop(self):
+        super(RecordingProxy, self).stop()
+        self.cassette.save(self.path)
+
+
+class ReplayServer(CassetteServer):
+    """Serves a Cassette back. misses lists the keys of requests that
+    matched nothing in the recording; each is logged and gets a
+    MISS_STATUS response."""
+
+    def __init__(self, cassette, speed=0.0, host='127.0.0.1', port=0):
+        super(ReplayServer, self).__init__(host, port)
+        self.cassette = cassette
+        self.speed = speed
+        self.index = cassette.index()
+        self.served = {}
+        self.misses = []
+        self._lock = threading.Lock()
+
+    def _next(self, key):
+        numbers = self.index.get(key)
+        if not numbers:
+            return None
+        position = self.served.get(key, 0)
+        self.served[key] = position + 1
+        return numbers[min(position, len(numbers) - 1)]
+
+    def handle(self, method, path, headers, body):
+        key = request_key(method, path, body)
+        with self._lock:
+            number = self._next(key)
+            if number is None:
+                self.misses.append(key)
+        if number is None:
+            logging.getLogger(__name__).warning(
+                'Request not in cassette: %s %s %s', method, path, body)
+            return (MISS_STATUS, 'application/json',
+                    json.dumps({'message': 'not in cassette: %s' % key}))
+        interaction = self.cassette.interactions[number]
+        if self.speed:
+            time.sleep(interaction['elapsed'] / self.speed)
+        response = interaction['response']
+        if isinstance(response, unicode):
+            response = response.encode('utf-8')
+        return (interaction['status'], interaction['content_type'],
+                response)
+
+
+def main():
+    parser = optparse.OptionParser(
+        usage='%prog record --target URL -o FILE | replay FILE')
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--target', help='server to record')
+    parser.add_option('-o', '--output', help='cassette to record into')
+    parser.add_option('--speed', type='float', default=0.0,
+                      help='replay at this multiple of the recorded '
+                           'response times, 0 for no delays [%default]')
+    options, args = parser.parse_args()
+    if args[:1] == ['record'] and options.target and options.output:
+        server = RecordingProxy(options.target, options.output,
+                                options.host, options.port)
+        what = 'Recording %s into %s' % (options.target, options.output)
+    elif args[:1] == ['replay'] and len(args) == 2:
+        server = ReplayServer(Cassette.load(args[1]), options.speed,
+                              options.host, options.port)
+        what = 'Replaying %s' % args[1]
+    else:
+        parser.error('need record --target URL -o FILE, or replay FILE')
+    server.start()
+    print '%s on %s' % (what, server.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+        if isinstance(server, ReplayServer) and server.misses:
+            print '%d requests were not in the cassette' % len(server.misses)
+
+
+if __name__ == '__main__':
+    main()
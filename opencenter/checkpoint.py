@@ -0,0 +1,56 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import logging
+import os
+import threading
+
+
+class Checkpoint(object):
+    """Progress of a deployment, persisted to a local json file.
+
+    Each completed phase is recorded by name. The state belongs to one
+    endpoint and cluster; a file left by a run against anything else is
+    ignored and overwritten."""
+
+    def __init__(self, path, endpoint_url, cluster_name):
+        self.path = path
+        self.key = {'endpoint_url': endpoint_url,
+                    'cluster_name': cluster_name}
+        self.log = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.completed = []
+        if os.path.exists(path):
+            with open(path) as state_file:
+                try:
+                    state = json.load(state_file)
+                except ValueError:
+                    state = {}
+            if state.get('key') == self.key:
+                self.completed = state.get('completed', [])
+            else:
+                self.log.info("Ignoring checkpoint %s from another run" % path)
+
+    def done(self, phase):
+        with self._lock:
+            return phase in self.completed
+
+    def mark(self, phase):
+        with self._lock:
+            if phase not in self.completed:
+                self.completed.append(phase)
+                self._save()
+
+    def clear(self):
+        """Forget all progress, once a run has finished successfully."""
+        with self._lock:
+            self.completed = []
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as state_file:
+            json.dump({'key': self.key, 'completed': self.completed},
+                      state_file, indent=2)
+        os.rename(tmp_path, self.path)
@@ -18,28 +18,110 @@
 import ConfigParser
 import logging
 import os
+import socket
+
+
+class Snapshot(object):
+    """Read only set of resolved config values, read as attributes.
+    Snapshots pickle cheaply, so they can be handed to worker processes
+    instead of each worker parsing the config files again."""
+
+    def __init__(self, section, values):
+        self.__dict__['_section'] = section
+        self.__dict__['_values'] = dict(values)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError("No config value %s in %s" %
+                                 (name, self._section))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Config snapshots are read only")
+
+    def __delattr__(self, name):
+        raise AttributeError("Config snapshots are read only")
+
+    def __reduce__(self):
+        return (Snapshot, (self._section, self._values))
+
+    def __repr__(self):
+        return '<Snapshot %s %r>' % (self._section, self._values)
+
+    def as_dict(self):
+        return dict(self._values)
+
+
+def validate_cidr(value):
+    """Return value if it is an IPv4 network in a.b.c.d/n notation,
+    otherwise raise ValueError."""
+    address, _, prefix = value.partition('/')
+    try:
+        if address.count('.') != 3 or not 0 <= int(prefix) <= 32:
+            raise ValueError
+        socket.inet_aton(address)
+    except (ValueError, socket.error):
+        raise ValueError("%r is not a valid CIDR" % value)
+    return value
 
 
 class BaseConfig(object):
 
     SECTION_NAME = None
 
+    # Comma separated values resolved to tuples in snapshots
+    LIST_FIELDS = ()
+
+    # Values that must be valid CIDRs
+    CIDR_FIELDS = ()
+
     def __init__(self, conf):
         self.conf = conf
 
+    def env_name(self, item_name):
+        return 'OPENCENTER_%s_%s' % (self.SECTION_NAME.upper(),
+                                     item_name.upper())
+
     def get(self, item_name, default_value=None):
-        if item_name in os.environ:
-            return os.environ[item_name]
+        # OPENCENTER_<SECTION>_<ITEM> first, the bare item name is still
+        # honoured for existing job definitions
+        for name in (self.env_name(item_name), item_name):
+            if name in os.environ:
+                return os.environ[name]
         try:
             return self.conf.get(self.SECTION_NAME, item_name, raw=True)
         except (ConfigParser.NoSectionError, ConfigParser.NoOptionError):
             return default_value
 
+    def snapshot(self):
+        """Resolve every property of this section into a Snapshot."""
+        values = {}
+        for name in dir(type(self)):
+            if not isinstance(getattr(type(self), name), property):
+                continue
+            value = getattr(self, name)
+            if name in self.LIST_FIELDS and value is not None:
+                value = tuple(item.strip() for item in value.split(',')
+                              if item.strip())
+            if name in self.CIDR_FIELDS and value is not None:
+                try:
+                    validate_cidr(value)
+                except ValueError as e:
+                    raise RuntimeError("[%s] %s: %s" %
+                                       (self.SECTION_NAME, name, e))
+            values[name] = value
+        return Snapshot(self.SECTION_NAME, values)
+
 
 
 
 class OpenCenterConfig(BaseConfig):
     SECTION_NAME = "opencenter"
+    LIST_FIELDS = ("instance_controller_hostname",
+                   "instance_compute_hostname")
 
     @property
     def endpoint_url(self):
@@ -68,6 +150,95 @@ class OpenCenterConfig(BaseConfig):
     @property
     def password(self):
         return self.get("password", None)
+
+    @property
+    def reparent_workers(self):
+        return int(self.get("reparent_workers", 1))
+
+    @property
+    def scheduler_workers(self):
+        return int(self.get("scheduler_workers", 1))
+
+    @property
+    def task_quiet_period(self):
+        return float(self.get("task_quiet_period", 5))
+
+    @property
+    def task_poll_interval(self):
+        return float(self.get("task_poll_interval", 0.5))
+
+    @property
+    def task_max_poll_interval(self):
+        return float(self.get("task_max_poll_interval", 10))
+
+    @property
+    def node_cache_ttl(self):
+        return float(self.get("node_cache_ttl", 30))
+
+    @property
+    def rollout_workers(self):
+        return int(self.get("rollout_workers", 10))
+
+    @property
+    def rollout_batch_size(self):
+        return int(self.get("rollout_batch_size", 0))
+
+    @property
+    def rollout_canary_size(self):
+        return int(self.get("rollout_canary_size", 0))
+
+    @property
+    def async_workers(self):
+        return int(self.get("async_workers", 16))
+
+    @property
+    def timeline_dir(self):
+        return self.get("timeline_dir", None)
+
+    @property
+    def checkpoint_file(self):
+        return self.get("checkpoint_file", None)
+
+    @property
+    def task_log_dir(self):
+        return self.get("task_log_dir", None)
+
+    @property
+    def task_log_keep(self):
+        return int(self.get("task_log_keep", 0))
+
+    @property
+    def history_db(self):
+        return self.get("history_db", None)
+
+    @property
+    def parallel_ha(self):
+        return self.get("parallel_ha", "false").lower() in ("1", "true",
+                                                             "yes", "on")
+
+    @property
+    def task_timeout(self):
+        return float(self.get("task_timeout", 3600))
+
+    @property
+    def task_timeout_factor(self):
+        return float(self.get("task_timeout_factor", 3))
+
+    @property
+    def task_timeout_min(self):
+        return float(self.get("task_timeout_min", 60))
+
+    @property
+    def record_cassette(self):
+        return self.get("record_cassette", None)
+
+    @property
+    def replay_cassette(self):
+        return self.get("replay_cassette", None)
+
+    @property
+    def replay_speed(self):
+        return float(self.get("replay_speed", 0))
     
     
    
@@ -79,6 +250,8 @@ class OpenCenterConfig(BaseConfig):
     
 class ClusterDataConfig(BaseConfig):
     SECTION_NAME = "cluster_data"
+    CIDR_FIELDS = ("osops_public", "osops_mgmt", "osops_nova",
+                   "nova_dmz_cidr", "nova_vm_fixed_range")
 
     @property
     def libvirt_type(self):
@@ -143,6 +316,45 @@ class VipDataConfig(BaseConfig):
         return self.get("nova_rabbitmq_vip")    
     
 
+class TaskTimeoutConfig(BaseConfig):
+    SECTION_NAME = "task_timeouts"
+
+    @property
+    def overrides(self):
+        """Timeouts in seconds keyed by lower cased adventure name."""
+        try:
+            return dict((name, float(value)) for name, value in
+                        self.conf.items(self.SECTION_NAME, raw=True))
+        except ConfigParser.NoSectionError:
+            return {}
+
+
+class TopologyConfig(BaseConfig):
+    SECTION_NAME = "topology"
+    LIST_FIELDS = ("availability_zones",)
+
+    @property
+    def controllers(self):
+        controllers = self.get("controllers", None)
+        return int(controllers) if controllers else None
+
+    @property
+    def availability_zones(self):
+        return self.get("availability_zones", "nova")
+
+    @property
+    def computes_per_az(self):
+        return int(self.get("computes_per_az", 0))
+
+    @property
+    def agent_pattern(self):
+        return self.get("agent_pattern", None)
+
+    @property
+    def wave_size(self):
+        return int(self.get("wave_size", 50))
+
+
 def singleton(cls):
     """Simple wrapper for classes that should only have a single instance"""
     instances = {}
@@ -154,15 +366,20 @@ def singleton(cls):
     return getinstance
 
 
+DEFAULT_CONFIG_DIR = os.path.join(
+    os.path.abspath(
+      os.path.dirname(
+        os.path.dirname(__file__))),
+    "etc")
+
+DEFAULT_TARGETS_FILE = "opencenter-targets.conf"
+
+
 @singleton
 class OpenCenterConfiguration:
     """Provides OpenStack configuration information."""
 
-    DEFAULT_CONFIG_DIR = os.path.join(
-        os.path.abspath(
-          os.path.dirname(
-            os.path.dirname(__file__))),
-        "etc")
+    DEFAULT_CONFIG_DIR = DEFAULT_CONFIG_DIR
 
     DEFAULT_CONFIG_FILE = "opencenter.conf"
 
@@ -180,11 +397,21 @@ class OpenCenterConfiguration:
         if not os.path.exists(path):
             msg = "**** Config file %(path)s NOT FOUND ****" % locals()
             raise RuntimeError(msg)
+        self.path = path
         self.conf = self.load_config(path)
 
         self.opencenter_config = OpenCenterConfig(self.conf)
         self.cluster_data = ClusterDataConfig(self.conf)
         self.vip_data = VipDataConfig(self.conf)
+        self.task_timeouts = TaskTimeoutConfig(self.conf)
+        self.topology = TopologyConfig(self.conf)
+        self._snapshot = None
+
+    def snapshot(self):
+        """Every section resolved once into a read only Snapshot."""
+        if self._snapshot is None:
+            self._snapshot = build_snapshot(self.conf, self.path)
+        return self._snapshot
         
 
     def load_config(self, path):
@@ -198,7 +425,73 @@ class OpenCenterConfiguration:
             return self.conf.get(section, item_name, raw=True)
         except (ConfigParser.NoSectionError, ConfigParser.NoOptionError):
             return default_value
-        
-        
-        
 
+
+def build_snapshot(conf, path=None):
+    return Snapshot(None, {
+        'path': path,
+        'opencenter': OpenCenterConfig(conf).snapshot(),
+        'cluster_data': ClusterDataConfig(conf).snapshot(),
+        'vip_data': VipDataConfig(conf).snapshot(),
+        'task_timeouts': TaskTimeoutConfig(conf).snapshot(),
+        'topology': TopologyConfig(conf).snapshot(),
+    })
+
+
+def load_snapshot(path):
+    """Snapshot of the config file at path, without touching the
+    process wide OpenCenterConfiguration."""
+    if not os.path.exists(path):
+        raise RuntimeError("**** Config file %s NOT FOUND ****" % path)
+    config = ConfigParser.SafeConfigParser()
+    config.read(path)
+    return build_snapshot(config, path)
+
+
+_snapshot = None
+
+
+def use_snapshot(snapshot):
+    """Make get_config return snapshot, e.g. in a worker process that
+    was handed its target's config."""
+    global _snapshot
+    _snapshot = snapshot
+
+
+def get_config():
+    """The config snapshot for this process: the one given to
+    use_snapshot, otherwise OpenCenterConfiguration's."""
+    if _snapshot is None:
+        use_snapshot(OpenCenterConfiguration().snapshot())
+    return _snapshot
+
+
+def load_targets(path=None):
+    """Read the named test targets.
+
+    The [targets] section of the targets file maps a target name to the
+    config file describing that endpoint and cluster, relative to the
+    targets file. The file defaults to OPENCENTER_TARGETS, or
+    opencenter-targets.conf in the config directory. Returns a list of
+    (name, absolute config path) in file order."""
+    if path is None:
+        conf_dir = os.environ.get('OPENCENTER_CONFIG_DIR', DEFAULT_CONFIG_DIR)
+        path = os.path.join(conf_dir, os.environ.get('OPENCENTER_TARGETS',
+                                                     DEFAULT_TARGETS_FILE))
+    if not os.path.exists(path):
+        raise RuntimeError("**** Targets file %s NOT FOUND ****" % path)
+    config = ConfigParser.SafeConfigParser()
+    # keep target names as written rather than lower casing them
+    config.optionxform = str
+    config.read(path)
+    if not config.has_section('targets'):
+        raise RuntimeError("No [targets] section in %s" % path)
+    base = os.path.dirname(os.path.abspath(path))
+    targets = []
+    for name, conf_file in config.items('targets', raw=True):
+        conf_path = os.path.join(base, conf_file.strip())
+        if not os.path.exists(conf_path):
+            raise RuntimeError("Config file %s for target %s NOT FOUND" %
+                               (conf_path, name))
+        targets.append((name, conf_path))
+    return targets
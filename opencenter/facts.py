@@ -0,0 +1,71 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import time
+
+from opencenter.parallel import run_parallel
+from opencenter.tasks import TaskGroup, UNSUPPORTED_STATUS
+
+
+class FactWriter(object):
+    """Writes a set of facts together and returns the tasks they start
+    as one TaskGroup.
+
+    The whole set goes to the server's facts/bulk endpoint in a single
+    request where there is one. Otherwise, or once the server has shown
+    it has none, each fact is posted separately with up to `workers`
+    requests in flight. wrap, if given, is applied to the posting
+    function before it goes to the worker threads (e.g. Timeline.wrap)."""
+
+    BULK_PATH = 'facts/bulk'
+
+    def __init__(self, rest, workers=10, poll_interval=0.5,
+                 max_poll_interval=10.0, sleep=time.sleep, wrap=None):
+        self.rest = rest
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.sleep = sleep
+        self.wrap = wrap or (lambda func: func)
+        self.bulk_supported = True
+
+    def write(self, changes):
+        """Write (node_id, key, value) changes and return a TaskGroup of
+        the tasks the server started for them."""
+        facts = [{'node_id': node_id, 'key': key, 'value': value}
+                 for node_id, key, value in changes]
+        tasks = None
+        if self.bulk_supported and facts:
+            tasks = self._write_bulk(facts)
+        if tasks is None:
+            # Facts the server simply stored start no task to wait for
+            tasks = [task for task in
+                     run_parallel(self.wrap(self._write_one), facts,
+                                  self.workers)
+                     if task]
+        return TaskGroup(self.rest, tasks, self.poll_interval,
+                         self.max_poll_interval, sleep=self.sleep)
+
+    def _write_bulk(self, facts):
+        status, body = self.rest.post(self.BULK_PATH, {'facts': facts})
+        if status in UNSUPPORTED_STATUS:
+            self.bulk_supported = False
+            return None
+        if status not in (200, 201, 202):
+            raise RuntimeError('Bulk fact write returned %s: %s' %
+                               (status, body))
+        return (body or {}).get('tasks', [])
+
+    def _write_one(self, fact):
+        status, body = self.rest.post('facts/', fact)
+        if status not in (200, 201, 202):
+            raise RuntimeError('Writing %s=%s on node %s returned %s: %s' %
+                               (fact['key'], fact['value'], fact['node_id'],
+                                status, body))
+        task = (body or {}).get('task')
+        if status == 202 and not task:
+            # Accepted for solving, yet there is no task to wait on
+            raise RuntimeError('Writing %s=%s on node %s returned 202 '
+                               'without a task: %s' %
+                               (fact['key'], fact['value'], fact['node_id'],
+                                body))
+        return task
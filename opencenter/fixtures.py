@@ -0,0 +1,150 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import atexit
+import sys
+import threading
+
+from opencenter.asyncclient import AsyncEndpoint
+from opencenter.cassette import Cassette, RecordingProxy, ReplayServer
+from opencenter.config import get_config
+from opencenter.facts import FactWriter
+from opencenter.nodes import NodeRegistry
+from opencenter.rest import RestClient
+from opencenter.tasklogs import TaskLogTailer
+from opencenter.tasks import TaskGroup, TaskTracker
+from opencenter.timeline import get_timeline
+from opencenterclient.client import OpenCenterEndpoint
+
+
+class EndpointSession(object):
+    """Connections and lookups shared by every test talking to one
+    opencenter endpoint. Built once per process by get_session so test
+    setUp methods don't reconnect or re-query the adventure catalogue.
+    endpoint_url overrides the configured one, for the cassette proxy and
+    replay server."""
+
+    def __init__(self, opencenter_config, endpoint_url=None):
+        self.endpoint_url = endpoint_url or opencenter_config.endpoint_url
+        self.user = opencenter_config.user
+        self.password = opencenter_config.password
+        if self.user:
+            self.ep = OpenCenterEndpoint(self.endpoint_url, user=self.user,
+                                         password=self.password)
+        else:
+            self.ep = OpenCenterEndpoint(self.endpoint_url)
+        self.admin_ep = OpenCenterEndpoint(self.endpoint_url + '/admin',
+                                           user=self.user,
+                                           password=self.password)
+        self.rest = RestClient(self.endpoint_url, self.user, self.password)
+        self.nodes = NodeRegistry(self.ep,
+                                  ttl=opencenter_config.node_cache_ttl)
+        self.task_tracker = TaskTracker(
+            self.ep,
+            rest=self.rest,
+            quiet_period=opencenter_config.task_quiet_period,
+            poll_interval=opencenter_config.task_poll_interval,
+            max_poll_interval=opencenter_config.task_max_poll_interval,
+            sleep=get_timeline().sleep)
+        self.fact_writer = FactWriter(
+            self.rest,
+            workers=opencenter_config.reparent_workers,
+            poll_interval=opencenter_config.task_poll_interval,
+            max_poll_interval=opencenter_config.task_max_poll_interval,
+            sleep=get_timeline().sleep,
+            wrap=get_timeline().wrap)
+        self.task_logs = None
+        if opencenter_config.task_log_dir:
+            self.task_logs = TaskLogTailer(
+                self.rest, opencenter_config.task_log_dir,
+                keep_successful=opencenter_config.task_log_keep,
+                interval=max(opencenter_config.task_poll_interval, 1.0),
+                prefix=opencenter_config.endpoint_url.split('://')[-1],
+                wrap=get_timeline().wrap)
+        self.poll_interval = opencenter_config.task_poll_interval
+        self.max_poll_interval = opencenter_config.task_max_poll_interval
+        self.async_workers = opencenter_config.async_workers
+        self.task_timeout = opencenter_config.task_timeout
+        self._async_endpoint = None
+        self._adventures = None
+        self._lock = threading.Lock()
+
+    def task_group(self, tasks):
+        """TaskGroup over task dicts polling at the configured rates."""
+        return TaskGroup(self.rest, tasks, self.poll_interval,
+                         self.max_poll_interval, sleep=get_timeline().sleep)
+
+    @property
+    def async_endpoint(self):
+        """AsyncEndpoint sharing this session's endpoint and credentials,
+        created the first time it is used."""
+        with self._lock:
+            if self._async_endpoint is None:
+                self._async_endpoint = AsyncEndpoint(
+                    self.endpoint_url, self.user, self.password,
+                    workers=self.async_workers,
+                    task_timeout=self.task_timeout)
+            return self._async_endpoint
+
+    @property
+    def adventures(self):
+        """All adventures on the server indexed by name, fetched in a
+        single request the first time they are needed."""
+        with self._lock:
+            if self._adventures is None:
+                self.ep._refresh('adventures', 'fixture_catalogue')
+                self._adventures = dict((a.name, a)
+                                        for a in self.ep.adventures)
+            return self._adventures
+
+    def adventure(self, name):
+        """Look up an adventure by name, None if the server lacks it."""
+        return self.adventures.get(name)
+
+    def reload_adventures(self):
+        with self._lock:
+            self._adventures = None
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def start_cassette(opencenter_config):
+    """Start the replay server or recording proxy opencenter_config asks
+    for and return the url to talk to instead of endpoint_url, or None.
+    The server stops, and a recording is written, at exit. Requests a
+    replayed cassette has no response for are listed then, too."""
+    if opencenter_config.replay_cassette:
+        server = ReplayServer(Cassette.load(opencenter_config.replay_cassette),
+                              opencenter_config.replay_speed)
+        atexit.register(_report_misses, server)
+    elif opencenter_config.record_cassette:
+        server = RecordingProxy(opencenter_config.endpoint_url,
+                                opencenter_config.record_cassette)
+    else:
+        return None
+    server.start()
+    atexit.register(server.stop)
+    return server.url
+
+
+def _report_misses(server):
+    if server.misses:
+        print >>sys.stderr, '%d requests were not in the cassette:' % \
+            len(server.misses)
+        for key in server.misses:
+            print >>sys.stderr, '  ' + key
+
+
+def get_session(opencenter_config=None):
+    """Return the process wide EndpointSession for opencenter_config,
+    defaulting to the [opencenter] section of the process config."""
+    if opencenter_config is None:
+        opencenter_config = get_config().opencenter
+    key = (opencenter_config.endpoint_url, opencenter_config.user,
+           opencenter_config.password)
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = EndpointSession(
+                opencenter_config, start_cassette(opencenter_config))
+        return _sessions[key]
@@ -0,0 +1,221 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+"""
+History of run timings, kept in a local SQLite database.
+
+Each run of a test stores one row in runs and one row in timings per
+adventure run on a node. find_regressions() compares the latest run of
+a test on a cluster against the runs before it and flags adventures (or
+adventure and node pairs) that got significantly slower.
+"""
+
+import contextlib
+import sqlite3
+import threading
+import time
+
+from opencenter.stats import median
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    test TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    endpoint TEXT,
+    started REAL NOT NULL,
+    duration REAL,
+    successful INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_cluster
+    ON runs (test, cluster, started);
+CREATE TABLE IF NOT EXISTS timings (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    cluster TEXT NOT NULL,
+    adventure TEXT NOT NULL,
+    node TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS timings_by_adventure
+    ON timings (cluster, adventure, started);
+CREATE INDEX IF NOT EXISTS timings_by_run ON timings (run_id);
+"""
+
+
+class RunTimings(object):
+    """Timings collected during one run, from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.entries = []
+
+    def add(self, adventure, node, duration, ok=True):
+        with self._lock:
+            self.entries.append((adventure, node, time.time() - duration,
+                                 duration, ok))
+
+    @contextlib.contextmanager
+    def measure(self, adventure, node):
+        """Time the with block as adventure on node; an exception counts
+        as not ok and is re-raised."""
+        started = time.time()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.add(adventure, node, time.time() - started, ok)
+
+
+class History(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def save_run(self, test, cluster, endpoint, timings, successful):
+        """Store a finished run and its RunTimings, returning the run id."""
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO runs (test, cluster, endpoint, started, '
+                'duration, successful) VALUES (?, ?, ?, ?, ?, ?)',
+                (test, cluster, endpoint, timings.started,
+                 time.time() - timings.started, int(bool(successful))))
+            run_id = cursor.lastrowid
+            self.db.executemany(
+                'INSERT INTO timings (run_id, cluster, adventure, node, '
+                'started, duration, ok) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, cluster, adventure, node, started, duration,
+                  int(bool(ok)))
+                 for adventure, node, started, duration, ok
+                 in timings.entries])
+        return run_id
+
+    def runs(self, test=None, cluster=None, limit=None, successful=None):
+        """Runs newest first, as dicts."""
+        query = 'SELECT id, test, cluster, endpoint, started, duration, ' \
+                'successful FROM runs'
+        terms, args = [], []
+        for column, value in (('test', test), ('cluster', cluster)):
+            if value is not None:
+                terms.append('%s = ?' % column)
+                args.append(value)
+        if successful is not None:
+            terms.append('successful = ?')
+            args.append(int(bool(successful)))
+        if terms:
+            query += ' WHERE ' + ' AND '.join(terms)
+        query += ' ORDER BY started DESC, id DESC'
+        if limit:
+            query += ' LIMIT %d' % int(limit)
+        columns = ('id', 'test', 'cluster', 'endpoint', 'started',
+                   'duration', 'successful')
+        return [dict(zip(columns, row))
+                for row in self.db.execute(query, args)]
+
+    def timings(self, run_ids, by_node=False):
+        """{key: {run_id: [durations]}} for successful timings, keyed by
+        adventure or by (adventure, node)."""
+        found = {}
+        if not run_ids:
+            return found
+        rows = self.db.execute(
+            'SELECT run_id, adventure, node, duration FROM timings '
+            'WHERE ok = 1 AND run_id IN (%s)' %
+            ','.join('?' * len(run_ids)), list(run_ids))
+        for run_id, adventure, node, duration in rows:
+            key = (adventure, node) if by_node else adventure
+            found.setdefault(key, {}).setdefault(run_id, []).append(duration)
+        return found
+
+    def durations(self, cluster, adventure, limit=50):
+        """The most recent successful durations of adventure on cluster."""
+        rows = self.db.execute(
+            'SELECT duration FROM timings WHERE cluster = ? AND '
+            'adventure = ? AND ok = 1 ORDER BY started DESC LIMIT ?',
+            (cluster, adventure, limit))
+        return [row[0] for row in rows]
+
+
+def save_run(path, test, cluster, endpoint, timings, successful):
+    """Append a run to the history database at path."""
+    history = History(path)
+    try:
+        return history.save_run(test, cluster, endpoint, timings, successful)
+    finally:
+        history.close()
+
+
+def robust_z(value, baseline):
+    """How many robust standard deviations (1.4826 x median absolute
+    deviation) value lies above the median of baseline."""
+    center = median(baseline)
+    mad = median([abs(b - center) for b in baseline]) * 1.4826
+    if mad == 0:
+        return float('inf') if value > center else 0.0
+    return (value - center) / mad
+
+
+def find_regressions(history, test, cluster, window=14, threshold=0.3,
+                     min_z=3.0, min_runs=5, min_delta=1.0, by_node=False):
+    """Compare the latest successful run of test on cluster with the
+    `window` successful runs before it.
+
+    For every adventure (or adventure and node) the p50 of the latest
+    run is compared with the p50s of the baseline runs. It is flagged
+    when it is more than `threshold` and min_delta seconds slower than
+    their median and at least min_z robust standard deviations above
+    it, so ordinary noise between runs isn't reported. Keys with fewer
+    than min_runs baseline runs are left out. Returns a list of dicts,
+    worst first."""
+    runs = history.runs(test, cluster, limit=window + 1, successful=True)
+    if len(runs) < 2:
+        return []
+    latest, baseline_runs = runs[0], runs[1:]
+    timings = history.timings([run['id'] for run in runs], by_node)
+    regressions = []
+    for key, per_run in timings.items():
+        if latest['id'] not in per_run:
+            continue
+        current = median(per_run[latest['id']])
+        baseline = [median(per_run[run['id']]) for run in baseline_runs
+                    if run['id'] in per_run]
+        if len(baseline) < min_runs:
+            continue
+        reference = median(baseline)
+        if reference <= 0:
+            continue
+        change = current / reference - 1
+        z = robust_z(current, baseline)
+        if (change > threshold and z >= min_z and
+                current - reference >= min_delta):
+            regressions.append({
+                'key': key,
+                'run_id': latest['id'],
+                'p50': round(current, 3),
+                'baseline_p50': round(reference, 3),
+                'change': round(change, 3),
+                'z': round(z, 2) if z != float('inf') else None,
+                'baseline_runs': len(baseline),
+            })
+    regressions.sort(key=lambda r: r['change'], reverse=True)
+    return regressions
+
+
+def format_regressions(regressions):
+    lines = []
+    for regression in regressions:
+        key = regression['key']
+        if isinstance(key, tuple):
+            key = '%s on %s' % key
+        lines.append('%-50s p50 %8.1fs  was %8.1fs  %+6.0f%% over %d runs' % (
+            key, regression['p50'], regression['baseline_p50'],
+            regression['change'] * 100, regression['baseline_runs']))
+    return '\n'.join(lines)
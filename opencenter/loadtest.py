@@ -0,0 +1,307 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+"""
+Load and soak testing against an opencenter-server.
+
+Simulates `agents` agents and `operators` operators, each a thread with
+its own OpenCenterEndpoint. Agents poll their node's tasks and, only
+with write_facts, write a heartbeat fact; operators list nodes and, if
+given an adventure, execute it on random agent nodes. Together they
+issue `rate` operations a second for `duration` seconds, and the report
+gives throughput, latency percentiles and error rates per operation.
+"""
+
+import random
+import sys
+import threading
+import time
+
+from opencenter.stats import percentile
+from opencenterclient.client import OpenCenterEndpoint
+
+
+PERCENTILES = (50, 90, 99)
+
+# Latencies kept per operation for the percentiles, so a soak run's
+# memory stays flat however long it goes on
+RESERVOIR_SIZE = 10000
+
+HEARTBEAT_FACT = 'loadtest_heartbeat'
+
+
+class LoadStats(object):
+    """Latencies and errors per operation, shared by every actor.
+
+    Counts and the maximum are exact. Percentiles come from a uniform
+    sample of at most reservoir_size latencies per operation."""
+
+    def __init__(self, reservoir_size=RESERVOIR_SIZE):
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.reservoir_size = reservoir_size
+        self.counts = {}
+        self.max_latency = {}
+        self.latencies = {}
+        self.errors = {}
+        self.late = 0
+        self.started = time.time()
+
+    def record(self, op, duration, error=None):
+        with self._lock:
+            count = self.counts.get(op, 0) + 1
+            self.counts[op] = count
+            self.max_latency[op] = max(self.max_latency.get(op, 0), duration)
+            sample = self.latencies.setdefault(op, [])
+            if len(sample) < self.reservoir_size:
+                sample.append(duration)
+            else:
+                # Reservoir sampling: the count-th latency replaces a
+                # random one with probability reservoir_size / count
+                index = self._random.randint(0, count - 1)
+                if index < self.reservoir_size:
+                    sample[index] = duration
+            if error is not None:
+                errors = self.errors.setdefault(op, {})
+                errors[error] = errors.get(error, 0) + 1
+
+    def record_late(self):
+        with self._lock:
+            self.late += 1
+
+    def report(self):
+        # Copy under the lock and do the sorting outside it, so actors
+        # aren't held up while a report is made
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-6)
+            counts = dict(self.counts)
+            max_latency = dict(self.max_latency)
+            samples = dict((op, list(sample))
+                           for op, sample in self.latencies.items())
+            reasons = dict((op, dict(errors))
+                           for op, errors in self.errors.items())
+            late = self.late
+        ops = {}
+        for op, count in counts.items():
+            latencies = sorted(samples[op])
+            errors = sum(reasons.get(op, {}).values())
+            summary = {
+                'count': count,
+                'throughput': round(count / elapsed, 2),
+                'errors': errors,
+                'error_rate': round(errors / float(count), 4),
+                'error_reasons': reasons.get(op, {}),
+                'max_ms': round(max_latency[op] * 1000, 1),
+            }
+            for pct in PERCENTILES:
+                summary['p%d_ms' % pct] = round(
+                    percentile(latencies, pct) * 1000, 1)
+            ops[op] = summary
+        total = sum(op['count'] for op in ops.values())
+        errors = sum(op['errors'] for op in ops.values())
+        return {
+            'elapsed': round(elapsed, 3),
+            'operations': ops,
+            'total': total,
+            'throughput': round(total / elapsed, 2),
+            'errors': errors,
+            'error_rate': round(errors / float(total), 4) if total else 0,
+            'late': late,
+        }
+
+
+class Actor(threading.Thread):
+    """Issues operations at a fixed rate until stop is set. An actor
+    that falls behind its schedule runs the next operation at once and
+    counts it as late rather than silently lowering the rate.
+    Subclasses define operation(), returning the (name, callable) to
+    run next."""
+
+    def __init__(self, endpoint, stats, rate, stop):
+        super(Actor, self).__init__()
+        self.daemon = True
+        self.endpoint = endpoint
+        self.stats = stats
+        self.period = 1.0 / rate
+        self.stop = stop
+
+    def run(self):
+        # Stagger actors so they don't all fire on the same tick
+        next_at = time.time() + random.random() * self.period
+        while not self.stop.is_set():
+            delay = next_at - time.time()
+            if delay > 0:
+                if self.stop.wait(delay):
+                    return
+            elif delay < -self.period:
+                self.stats.record_late()
+            next_at = max(next_at + self.period, time.time() - self.period)
+            self.timed(*self.operation())
+
+    def timed(self, op, func):
+        started = time.time()
+        error = None
+        try:
+            func()
+        except Exception as e:
+            error = '%s: %s' % (e.__class__.__name__, str(e)[:80])
+        self.stats.record(op, time.time() - started, error)
+
+
+def check_status(resp, expect=(200, 201, 202)):
+    if resp.status_code not in expect:
+        raise RuntimeError('status %s' % resp.status_code)
+
+
+class Agent(Actor):
+    """An agent polling its node's tasks and, with write_facts, reporting
+    a heartbeat fact every heartbeat_every operations. Heartbeats are
+    real facts on real nodes, so they are off unless asked for."""
+
+    def __init__(self, endpoint, stats, rate, stop, node_id,
+                 heartbeat_every=5, write_facts=False):
+        super(Agent, self).__init__(endpoint, stats, rate, stop)
+        self.node_id = node_id
+        self.heartbeat_every = heartbeat_every
+        self.write_facts = write_facts
+        self.count = 0
+
+    def operation(self):
+        self.count += 1
+        if self.write_facts and self.count % self.heartbeat_every == 0:
+            return 'write fact', self.write_fact
+        return 'poll tasks', self.poll_tasks
+
+    def poll_tasks(self):
+        list(self.endpoint.nodes[self.node_id].tasks)
+
+    def write_fact(self):
+        fact = self.endpoint.facts.create(node_id=self.node_id,
+                                          key=HEARTBEAT_FACT,
+                                          value=int(time.time()))
+        check_status(fact.save())
+
+
+class Operator(Actor):
+    """An operator listing nodes and, when given an adventure, executing
+    it on random agent nodes for execute_ratio of its operations."""
+
+    def __init__(self, endpoint, stats, rate, stop, node_ids,
+                 adventure_id=None, execute_ratio=0.1):
+        super(Operator, self).__init__(endpoint, stats, rate, stop)
+        self.node_ids = node_ids
+        self.adventure_id = adventure_id
+        self.execute_ratio = execute_ratio
+
+    def operation(self):
+        if (self.adventure_id is not None and
+                random.random() < self.execute_ratio):
+            return 'execute adventure', self.execute
+        return 'list nodes', self.list_nodes
+
+    def list_nodes(self):
+        self.endpoint._refresh('nodes', 'loadtest')
+        list(self.endpoint.nodes)
+
+    def execute(self):
+        resp = self.endpoint.adventures[self.adventure_id].execute(
+            node=random.choice(self.node_ids))
+        check_status(resp, (202, ))
+
+
+def make_endpoint(endpoint_url, user=None, password=None):
+    if user:
+        return OpenCenterEndpoint(endpoint_url, user=user, password=password)
+    return OpenCenterEndpoint(endpoint_url)
+
+
+def run_load(endpoint_url, user=None, password=None, agents=10, operators=2,
+             rate=50.0, duration=60.0, adventure=None, execute_ratio=0.1,
+             progress_interval=None, write_facts=False, out=sys.stdout):
+    """Run the load for duration seconds and return the report dict.
+    rate is the total operations per second, shared evenly between all
+    agents and operators. With progress_interval set a running total is
+    written to out that often, which is what soak runs watch."""
+    if agents < 0 or operators < 0 or agents + operators == 0:
+        raise ValueError('Need at least one agent or operator, not %d '
+                         'agents and %d operators' % (agents, operators))
+    if rate <= 0:
+        raise ValueError('rate must be positive, not %s' % rate)
+    ep = make_endpoint(endpoint_url, user, password)
+    agent_nodes = [node.id for node in ep.nodes
+                   if 'agent' in node.facts.get('backends', [])]
+    if not agent_nodes:
+        raise RuntimeError('No agent nodes on %s to simulate' % endpoint_url)
+    adventure_id = None
+    if adventure:
+        found = [a.id for a in ep.adventures if a.name == adventure]
+        if not found:
+            raise RuntimeError('No adventure named %s' % adventure)
+        adventure_id = found[0]
+
+    stats = LoadStats()
+    stop = threading.Event()
+    actor_rate = rate / float(agents + operators)
+    actors = []
+    for index in range(agents):
+        actors.append(Agent(make_endpoint(endpoint_url, user, password),
+                            stats, actor_rate, stop,
+                            agent_nodes[index % len(agent_nodes)],
+                            write_facts=write_facts))
+    for index in range(operators):
+        actors.append(Operator(make_endpoint(endpoint_url, user, password),
+                               stats, actor_rate, stop, agent_nodes,
+                               adventure_id, execute_ratio))
+
+    stats.started = time.time()
+    for actor in actors:
+        actor.start()
+    deadline = stats.started + duration
+    try:
+        while time.time() < deadline:
+            wait = deadline - time.time()
+            if progress_interval:
+                wait = min(wait, progress_interval)
+            time.sleep(max(wait, 0))
+            if progress_interval and time.time() < deadline:
+                report = stats.report()
+                print >>out, ('%7.0fs %8d ops %8.1f ops/s %6d errors '
+                              '%6d late' % (report['elapsed'],
+                                            report['total'],
+                                            report['throughput'],
+                                            report['errors'],
+                                            report['late']))
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join(5)
+
+    report = stats.report()
+    report.update({
+        'endpoint_url': endpoint_url,
+        'agents': agents,
+        'operators': operators,
+        'target_rate': rate,
+        'duration': duration,
+        'adventure': adventure,
+        'write_facts': write_facts,
+    })
+    return report
+
+
+def format_report(report):
+    lines = ['%-20s %8s %8s %7s %8s %8s %8s %8s' % (
+        'operation', 'count', 'ops/s', 'errors', 'p50 ms', 'p90 ms',
+        'p99 ms', 'max ms')]
+    for op, summary in sorted(report['operations'].items()):
+        lines.append('%-20s %8d %8.1f %6.2f%% %8.1f %8.1f %8.1f %8.1f' % (
+            op, summary['count'], summary['throughput'],
+            summary['error_rate'] * 100, summary['p50_ms'],
+            summary['p90_ms'], summary['p99_ms'], summary['max_ms']))
+        for reason, count in sorted(summary['error_reasons'].items()):
+            lines.append('    %5d x %s' % (count, reason))
+    lines.append('%d operations in %.1fs, %.1f ops/s (target %.1f), '
+                 '%.2f%% errors, %d late' % (
+                     report['total'], report['elapsed'],
+                     report['throughput'], report['target_rate'],
+                     report['error_rate'] * 100, report['late']))
+    return '\n'.join(lines)
@@ -0,0 +1,614 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+"""
+In-process stand-in for opencenter-server.
+
+Implements the node, fact, adventure, task and task log endpoints used by
+OpenCenterEndpoint and the harness helpers, with synthetic agents and
+simulated task execution, so the suite can run offline:
+
+    $ python -m opencenter.mockserver --nodes 1000 --port 8080
+    $ OPENCENTER_CONFIG=opencenter-mock.conf ./run_tests.sh -N
+"""
+
+import BaseHTTPServer
+import heapq
+import json
+import optparse
+import re
+import socket
+import SocketServer
+import sys
+import threading
+import time
+import urlparse
+
+
+OBJECT_TYPES = {
+    'nodes': 'node',
+    'facts': 'fact',
+    'attrs': 'attr',
+    'adventures': 'adventure',
+    'tasks': 'task',
+    'primitives': 'primitive',
+    'filters': 'filter',
+}
+
+SCHEMAS = {
+    'nodes': ['id', 'name', 'task_id'],
+    'facts': ['id', 'node_id', 'key', 'value'],
+    'attrs': ['id', 'node_id', 'key', 'value'],
+    'adventures': ['id', 'name', 'dsl', 'criteria'],
+    'tasks': ['id', 'node_id', 'action', 'payload', 'state', 'parent_id',
+              'result', 'submitted', 'completed', 'expires'],
+    'primitives': ['id', 'name', 'args', 'constraints', 'consequences',
+                   'weight'],
+    'filters': ['id', 'name', 'filter_type', 'expr', 'full_expr'],
+}
+
+ADVENTURES = [
+    'Install Chef Server',
+    'Install Chef Client',
+    'Create Nova Cluster',
+    'Install Nova Controller',
+    'Install Nova Compute',
+    'Download Chef Cookbooks',
+    'Upload Initial Glance Images',
+    'Enable HA Infrastructure',
+    'Create Availability Zone',
+    'Update Agent',
+]
+
+FILTER_TERM = re.compile(r'\s*(\w+)\s*=\s*("[^"]*"|\'[^\']*\'|\S+)\s*')
+
+
+def parse_filter(expr):
+    """Parse the simple `key = value and key = value` filters the
+    harness sends. Returns a list of (key, value) pairs."""
+    terms = []
+    for part in re.split(r'\s+and\s+', expr.strip()):
+        match = FILTER_TERM.match(part)
+        if not match:
+            raise ValueError('Unsupported filter %r' % expr)
+        key, value = match.groups()
+        if value[0] in '"\'':
+            value = value[1:-1]
+        elif value.isdigit():
+            value = int(value)
+        terms.append((key, value))
+    return terms
+
+
+def parse_filters(expr):
+    """Parse filters joined with `or`, as in `id = 1 or id = 2`, into
+    a list of alternatives as returned by parse_filter."""
+    return [parse_filter(part) for part in re.split(r'\s+or\s+', expr)]
+
+
+class Task(object):
+
+    def __init__(self, task_id, node_id, action, payload, duration,
+                 effect=None, parent_id=None):
+        self.id = task_id
+        self.node_id = node_id
+        self.action = action
+        self.payload = payload
+        self.parent_id = parent_id
+        self.effect = effect
+        self.submitted = time.time()
+        self.completes = self.submitted + duration
+        self.state = 'pending'
+        self.result = {}
+        # False once the task is finished or its state was set by hand
+        self.active = True
+
+    def log(self, now=None):
+        """The log so far: a line per tenth of the task's run time."""
+        duration = self.completes - self.submitted
+        if self.state == 'done' or duration <= 0:
+            progress = 1.0
+        else:
+            progress = min((now or time.time()) - self.submitted,
+                           duration) / duration
+        lines = ['[task %d] %s step %d/10\n' % (self.id, self.action, step)
+                 for step in range(1, int(progress * 10) + 1)]
+        if self.state == 'done':
+            result = self.result.get('result_str')
+            lines.append('[task %d] %s\n' % (self.id, result))
+        return ''.join(lines)
+
+    def to_dict(self):
+        return {'id': self.id, 'node_id': self.node_id,
+                'action': self.action, 'payload': self.payload,
+                'state': self.state, 'parent_id': self.parent_id,
+                'result': self.result, 'submitted': int(self.submitted),
+                'completed': (int(self.completes)
+                              if self.state == 'done' else None),
+                'expires': int(self.submitted + 3600)}
+
+
+class MockState(object):
+    """The simulated server: nodes, facts, adventures and tasks.
+
+    Every request holds the one lock, so each keeps its work down to
+    what it touches: facts are indexed by node and key, tasks by node,
+    and running tasks are kept in order of completion."""
+
+    def __init__(self, node_count=5, task_duration=0.1, followup_tasks=1):
+        self.task_duration = task_duration
+        self.followup_tasks = followup_tasks
+        self.lock = threading.Condition()
+        self.closing = False
+        self.txid = 1
+        self.nodes = {}
+        self.facts = {}
+        self.fact_ids = {}
+        self.tasks = {}
+        self.node_tasks = {}
+        # tasks yet to start, and a heap of (completes, id) of the rest
+        self.starting = []
+        self.running = []
+        self.adventures = dict(
+            (i + 1, {'id': i + 1, 'name': name, 'dsl': [], 'criteria': ''})
+            for i, name in enumerate(ADVENTURES))
+        self._ids = {'nodes': 0, 'facts': 0, 'tasks': 0}
+
+        workspace = self.add_node('workspace', None, ['container', 'node'])
+        unprovisioned = self.add_node('unprovisioned', workspace,
+                                      ['container', 'node'])
+        support = self.add_node('support', workspace, ['container', 'node'])
+        self.add_node('opencenter-server', support,
+                      ['node', 'agent', 'server'])
+        for i in range(1, node_count + 1):
+            self.add_node('opencenter-agent%d' % i, unprovisioned,
+                          ['node', 'agent'])
+
+    def next_id(self, what):
+        self._ids[what] += 1
+        return self._ids[what]
+
+    def add_node(self, name, parent_id, backends):
+        node_id = self.next_id('nodes')
+        self.nodes[node_id] = {'id': node_id, 'name': name, 'attrs': {},
+                               'facts': {}, 'task_id': None}
+        self.set_fact(node_id, 'backends', backends)
+        if parent_id is not None:
+            self.set_fact(node_id, 'parent_id', parent_id)
+        return node_id
+
+    def set_fact(self, node_id, key, value):
+        fact_id = self.fact_ids.get((node_id, key))
+        if fact_id is not None:
+            fact = self.facts[fact_id]
+            fact['value'] = value
+        else:
+            fact_id = self.next_id('facts')
+            fact = {'id': fact_id, 'node_id': node_id, 'key': key,
+                    'value': value}
+            self.facts[fact_id] = fact
+            self.fact_ids[(node_id, key)] = fact_id
+        self.nodes[node_id]['facts'][key] = value
+        return fact
+
+    def add_task(self, node_id, action, payload=None, effect=None,
+                 parent_id=None):
+        task = Task(self.next_id('tasks'), node_id, action, payload or {},
+                    self.task_duration, effect, parent_id)
+        self.tasks[task.id] = task
+        self.node_tasks.setdefault(node_id, []).append(task)
+        self.starting.append(task)
+        heapq.heappush(self.running, (task.completes, task.id))
+        self.nodes[node_id]['task_id'] = task.id
+        self.bump()
+        return task
+
+    def bump(self):
+        self.txid += 1
+        self.lock.notify_all()
+
+    def advance(self):
+        """Move simulated tasks forward to the current time. Must be
+        called with the lock held."""
+        now = time.time()
+        starting, self.starting = self.starting, []
+        for task in starting:
+            if task.active and task.state == 'pending':
+                task.state = 'running'
+                self.bump()
+        while self.running and self.running[0][0] <= now:
+            task = self.tasks[heapq.heappop(self.running)[1]]
+            if not task.active:
+                continue
+            task.state = 'done'
+            task.result = {'result_code': 0, 'result_str': 'success',
+                           'result_data': {}}
+            task.active = False
+            if task.effect:
+                task.effect()
+            self.bump()
+
+    def find(self, what, alternatives):
+        """Objects matching any of the alternatives parse_filters
+        returns. Alternatives naming an id are looked up directly."""
+        found = {}
+        scan = []
+        for terms in alternatives:
+            obj_id = dict(terms).get('id')
+            if isinstance(obj_id, int):
+                obj = self.get(what, obj_id)
+                if obj is not None and all(obj.get(k) == v
+                                           for k, v in terms):
+                    found[obj_id] = obj
+            else:
+                scan.append(terms)
+        if scan:
+            for obj in self.list(what):
+                if any(all(obj.get(k) == v for k, v in terms)
+                       for terms in scan):
+                    found[obj['id']] = obj
+        return [found[obj_id] for obj_id in sorted(found)]
+
+    def list(self, what):
+        if what == 'tasks':
+            return [t.to_dict() for t in self.tasks.values()]
+        return getattr(self, what, {}).values() if what in (
+            'nodes', 'facts', 'adventures') else []
+
+    def get(self, what, obj_id):
+        if what == 'tasks':
+            task = self.tasks.get(obj_id)
+            return task.to_dict() if task else None
+        if what in ('nodes', 'facts', 'adventures'):
+            return getattr(self, what).get(obj_id)
+        return None
+
+    # adventure effects
+
+    def execute(self, adventure_id, node_id, plan_args):
+        name = self.adventures[adventure_id]['name']
+
+        def install_chef_server():
+            self._install_chef_server(node_id)
+
+        def create_cluster():
+            self._create_cluster(node_id, plan_args)
+
+        def enable_ha():
+            self._enable_ha(node_id, plan_args)
+
+        def create_zone():
+            self.add_node('AZ %s' % plan_args['nova_az'], node_id,
+                          ['container', 'nova'])
+
+        effect = {'Install Chef Server': install_chef_server,
+                  'Create Nova Cluster': create_cluster,
+                  'Enable HA Infrastructure': enable_ha,
+                  'Create Availability Zone': create_zone}.get(name)
+        return self.add_task(node_id, 'adventurate',
+                             {'adventure': adventure_id,
+                              'plan_args': plan_args}, effect)
+
+    def _install_chef_server(self, node_id):
+        backends = self.nodes[node_id]['facts']['backends']
+        self.set_fact(node_id, 'backends', backends + ['chef-server'])
+        name = self.nodes[node_id]['name']
+        self.set_fact(node_id, 'chef_server_client_name', 'admin')
+        self.set_fact(node_id, 'chef_server_client_pem', 'CLIENT PEM')
+        self.set_fact(node_id, 'chef_server_pem', 'VALIDATION PEM')
+        self.set_fact(node_id, 'chef_server_uri', 'http://%s:4000' % name)
+
+    def _create_cluster(self, parent_id, plan_args):
+        cluster = self.add_node(plan_args.get('cluster_name', 'test_cluster'),
+                                parent_id, ['container', 'nova'])
+        for key, value in plan_args.items():
+            self.set_fact(cluster, key, value)
+        self.add_node('Infrastructure', cluster, ['container', 'nova'])
+        compute = self.add_node('Compute', cluster, ['container', 'nova'])
+        self.add_node('AZ nova', compute, ['container', 'nova'])
+
+    def _enable_ha(self, node_id, plan_args):
+        self.set_fact(node_id, 'ha_infra', True)
+        for key, value in plan_args.items():
+            self.set_fact(node_id, key, value)
+
+    def reparent(self, node_id, parent_id):
+        """Start the chain of tasks a parent_id change kicks off. The
+        fact itself is only set once the first task completes."""
+        def followup(step):
+            if step < self.followup_tasks:
+                self.add_task(node_id, 'run_chef', {}, lambda:
+                              followup(step + 1), parent_id=task.id)
+
+        def effect():
+            self.set_fact(node_id, 'parent_id', parent_id)
+            followup(0)
+
+        task = self.add_task(node_id, 'reparent', {'parent_id': parent_id},
+                             effect)
+        return task
+
+
+class MockRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one write rather than a write per header;
+    # split writes stall on delayed ACKs with keep-alive connections
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        length = int(self.headers.getheader('content-length') or 0)
+        raw = self.rfile.read(length) if length else ''
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query, keep_blank_values=True)
+        parts = [p for p in url.path.split('/') if p]
+        if parts and parts[0] == 'admin':
+            parts = parts[1:]
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        server = self.server.mock
+        if server.latency:
+            time.sleep(server.latency)
+        try:
+            route, status, payload = server.handle(method, parts, query,
+                                                   body)
+        except (KeyError, ValueError) as e:
+            route, status, payload = ('error', 400,
+                                      {'message': 'bad request: %s' % e})
+        payload.setdefault('status', status)
+        data = json.dumps(payload)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        server.record(method, route, len(raw), len(data))
+
+
+class MockHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # Request threads are daemons; one still running as the
+        # interpreter exits finds module globals such as sys set to None
+        if sys is None or socket is None:
+            return
+        # Clients routinely hang up on long-polls they have stopped
+        # waiting for; that is not worth a traceback
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request,
+                                                   client_address)
+
+
+class MockOpenCenterServer(object):
+    """Runs a MockState behind a threaded HTTP server.
+
+    latency is added to every request, task_duration is how long every
+    simulated task runs and followup_tasks is the length of the task
+    chain that follows a reparent. With bulk_facts the server also
+    accepts a list of facts in one POST to facts/bulk. stats holds
+    request counts and bytes per route for benchmarking."""
+
+    def __init__(self, node_count=5, latency=0.0, task_duration=0.1,
+                 followup_tasks=1, host='127.0.0.1', port=0,
+                 poll_timeout=30.0, bulk_facts=True):
+        self.state = MockState(node_count, task_duration, followup_tasks)
+        self.latency = latency
+        self.bulk_facts = bulk_facts
+        self.poll_timeout = poll_timeout
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % (self.host, self.port)
+
+    def start(self):
+        self.httpd = MockHTTPServer((self.host, self.port),
+                                    MockRequestHandler)
+        self.httpd.mock = self
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.ticker = threading.Thread(target=self.tick)
+        self.ticker.daemon = True
+        self.ticker.start()
+        return self
+
+    def tick(self, interval=0.02):
+        """Keep simulated tasks moving even when nobody is polling."""
+        while self.httpd is not None:
+            with self.state.lock:
+                self.state.advance()
+            time.sleep(interval)
+
+    def stop(self):
+        if self.httpd:
+            # Let long-polls answer now rather than at their timeout
+            with self.state.lock:
+                self.state.closing = True
+                self.state.lock.notify_all()
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {'requests': 0, 'bytes_in': 0, 'bytes_out': 0,
+                          'routes': {}}
+
+    def record(self, method, route, bytes_in, bytes_out):
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_in'] += bytes_in
+            self.stats['bytes_out'] += bytes_out
+            key = '%s %s' % (method, route)
+            count = self.stats['routes'].setdefault(key, 0)
+            self.stats['routes'][key] = count + 1
+
+    def handle(self, method, parts, query, body):
+        """Returns (route name, status code, json payload)."""
+        state = self.state
+        with state.lock:
+            state.advance()
+            if not parts:
+                return '/', 200, {'message': 'mock opencenter'}
+            what = parts[0]
+            if what not in OBJECT_TYPES:
+                return what, 404, {'message': 'not found'}
+            single = OBJECT_TYPES[what]
+
+            if len(parts) == 1:
+                if method == 'GET':
+                    return what, 200, {what: state.list(what)}
+                if method == 'POST':
+                    return (what, ) + self.create(what, body)
+            elif parts[1] == 'schema':
+                schema = dict((field, {'type': 'TEXT',
+                                       'primary_key': field == 'id',
+                                       'unique': field == 'id',
+                                       'updatable': field != 'id',
+                                       'required': field != 'id'})
+                              for field in SCHEMAS[what])
+                return what + '/schema', 200, {'schema': schema}
+            elif parts[1] == 'filter':
+                expr = body.get('filter') or query.get('filter', [''])[0]
+                found = state.find(what, parse_filters(expr))
+                return what + '/filter', 200, {what: found}
+            elif what == 'facts' and parts[1] == 'bulk' and self.bulk_facts:
+                if method != 'POST':
+                    return 'facts/bulk', 405, {'message': 'not supported'}
+                results = [self.create(what, fact) for fact in body['facts']]
+                tasks = [result[1]['task'] for result in results
+                         if 'task' in result[1]]
+                facts = [result[1]['fact'] for result in results
+                         if 'fact' in result[1]]
+                return ('facts/bulk', 202 if tasks else 201,
+                        {'message': 'solving', 'tasks': tasks,
+                         'facts': facts})
+            elif what == 'tasks' and parts[1] == 'updates':
+                txid = int(parts[2]) if len(parts) > 2 else 0
+                if 'poll' in query:
+                    deadline = time.time() + self.poll_timeout
+                    while (state.txid <= txid and not state.closing and
+                           time.time() < deadline):
+                        state.lock.wait(deadline - time.time())
+                return ('tasks/updates', 200,
+                        {'transaction': {'txid': state.txid}})
+            elif len(parts) == 2:
+                if not parts[1].isdigit():
+                    return what + '/id', 404, {'message': 'not found'}
+                obj_id = int(parts[1])
+                obj = state.get(what, obj_id)
+                if obj is None:
+                    return what + '/id', 404, {'message': 'not found'}
+                if method == 'GET':
+                    return what + '/id', 200, {single: obj}
+                if method == 'PUT' and what == 'tasks':
+                    task = state.tasks[obj_id]
+                    task.state = body.get('state', task.state)
+                    if task.state != 'running':
+                        task.active = False
+                    state.bump()
+                    return what + '/id', 200, {single: task.to_dict()}
+                if method == 'PUT' and what == 'facts':
+                    return (what + '/id', ) + self.create(
+                        what, dict(obj, value=body.get('value')))
+            elif len(parts) == 3:
+                obj_id = int(parts[1])
+                if what == 'adventures' and parts[2] == 'execute':
+                    task = state.execute(obj_id, int(body['node']),
+                                         body.get('plan_args') or {})
+                    return ('adventures/id/execute', 202,
+                            {'message': 'adventure started',
+                             'task': task.to_dict()})
+                if what == 'nodes' and parts[2] == 'adventures':
+                    return ('nodes/id/adventures', 200,
+                            {'adventures': state.adventures.values()})
+                if what == 'tasks' and parts[2] == 'logs':
+                    task = state.tasks.get(obj_id)
+                    if task is None:
+                        return 'tasks/id/logs', 404, {'message': 'not found'}
+                    offset = int(query.get('offset', ['0'])[0] or 0)
+                    return ('tasks/id/logs', 200,
+                            {'log': task.log()[offset:]})
+                if what == 'nodes' and parts[2] == 'tasks':
+                    tasks = [t.to_dict()
+                             for t in state.node_tasks.get(obj_id, [])]
+                    return 'nodes/id/tasks', 200, {'tasks': tasks}
+            return '/'.join(parts[:1]), 405, {'message': 'not supported'}
+
+    def create(self, what, body):
+        state = self.state
+        if what != 'facts':
+            return 405, {'message': 'not supported'}
+        node_id = int(body['node_id'])
+        if body['key'] == 'parent_id':
+            task = state.reparent(node_id, int(body['value']))
+            return 202, {'message': 'solving', 'task': task.to_dict()}
+        fact = state.set_fact(node_id, body['key'], body['value'])
+        state.bump()
+        return 201, {'fact': fact}
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--nodes', type='int', default=5,
+                      help='number of synthetic agents')
+    parser.add_option('--latency', type='float', default=0.0,
+                      help='seconds added to every request')
+    parser.add_option('--task-duration', type='float', default=0.1,
+                      help='seconds every simulated task runs for')
+    parser.add_option('--followup-tasks', type='int', default=1,
+                      help='tasks that follow a reparent')
+    parser.add_option('--no-bulk-facts', dest='bulk_facts',
+                      action='store_false', default=True,
+                      help='act like a server without facts/bulk')
+    options, args = parser.parse_args()
+    server = MockOpenCenterServer(options.nodes, options.latency,
+                                  options.task_duration,
+                                  options.followup_tasks,
+                                  options.host, options.port,
+                                  bulk_facts=options.bulk_facts)
+    server.start()
+    print 'Mock opencenter-server with %d agents on %s' % (options.nodes,
+                                                           server.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
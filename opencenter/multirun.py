@@ -0,0 +1,239 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import multiprocessing
+import os
+import re
+import StringIO
+import time
+import traceback
+from xml.sax.saxutils import quoteattr, escape
+
+import unittest2
+
+from opencenter.config import Snapshot, load_snapshot, use_snapshot
+
+DEFAULT_TESTS = ['opencenter.tests.test_happy_path']
+
+ALL_TESTS = ['opencenter.tests.test_happy_path',
+             'opencenter.tests.test_package_upgrade']
+
+
+class RecordingResult(unittest2.TextTestResult):
+    """Text result that also keeps the outcome and duration of every
+    test, for the xunit report."""
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingResult, self).__init__(*args, **kwargs)
+        self.cases = []
+        self._started = None
+
+    def startTest(self, test):
+        self._started = time.time()
+        super(RecordingResult, self).startTest(test)
+
+    def _record(self, test, outcome, message=''):
+        self.cases.append({'id': test.id(), 'outcome': outcome,
+                           'message': message,
+                           'time': round(time.time() - (self._started or
+                                                        time.time()), 3)})
+
+    def addSuccess(self, test):
+        super(RecordingResult, self).addSuccess(test)
+        self._record(test, 'success')
+
+    def addFailure(self, test, err):
+        super(RecordingResult, self).addFailure(test, err)
+        self._record(test, 'failure', self.failures[-1][1])
+
+    def addError(self, test, err):
+        super(RecordingResult, self).addError(test, err)
+        self._record(test, 'error', self.errors[-1][1])
+
+    def addSkip(self, test, reason):
+        super(RecordingResult, self).addSkip(test, reason)
+        self._record(test, 'skipped', reason)
+
+
+def _test_report(result):
+    """Summarise a unittest result as plain data that pickles cleanly."""
+    return {
+        'tests_run': result.testsRun,
+        'failures': [(test.id(), tb) for test, tb in result.failures],
+        'errors': [(test.id(), tb) for test, tb in result.errors],
+        'skipped': [(test.id(), reason) for test, reason in result.skipped],
+        'cases': result.cases,
+        'successful': result.wasSuccessful(),
+    }
+
+
+def run_target(args):
+    """Run test_names against one target in the current process.
+
+    The target's config snapshot, resolved by the parent, becomes this
+    process's config; OPENCENTER_CONFIG is pointed at its file too for
+    anything reading OpenCenterConfiguration directly. This must run in
+    a fresh worker process per target."""
+    name, config_path, test_names, snapshot = args
+    os.environ['OPENCENTER_CONFIG'] = config_path
+    use_snapshot(snapshot)
+    stream = StringIO.StringIO()
+    started = time.time()
+    try:
+        tests = unittest2.TestLoader().loadTestsFromNames(test_names)
+        result = unittest2.TextTestRunner(stream=stream, verbosity=2,
+                                          resultclass=RecordingResult).run(
+            tests)
+        report = _test_report(result)
+    except Exception:
+        tb = traceback.format_exc()
+        report = {'tests_run': 0, 'failures': [], 'skipped': [],
+                  'errors': [('load', tb)],
+                  'cases': [{'id': 'load', 'outcome': 'error',
+                             'message': tb, 'time': 0}],
+                  'successful': False}
+    report.update({
+        'target': name,
+        'config': config_path,
+        'wall_time': round(time.time() - started, 3),
+        'output': stream.getvalue(),
+    })
+    return report
+
+
+def run_targets(targets, test_names=None, processes=None):
+    """Run test_names against every (name, config path) target at once,
+    each in its own worker process, and return the merged report."""
+    test_names = test_names or DEFAULT_TESTS
+    return _run_jobs([(name, path, test_names) for name, path in targets],
+                     processes)
+
+
+def dotted_name(name):
+    """Turn a nose style test path, opencenter/tests/test_x.py or
+    opencenter/tests/test_x.py:Class.method, into the dotted name
+    unittest2 loads. Dotted names are returned as they are."""
+    path, _, attr = name.partition(':')
+    if not path.endswith('.py'):
+        if '/' in name or ':' in name:
+            raise ValueError('%s is neither a test file nor a dotted '
+                             'test name' % name)
+        return name
+    module = os.path.normpath(path[:-3]).replace(os.sep, '.')
+    if module.startswith('.'):
+        raise ValueError('%s is outside the source tree' % name)
+    return '%s.%s' % (module, attr) if attr else module
+
+
+def test_classes(test_names):
+    """The dotted names of every test class in test_names, in order."""
+    classes = []
+
+    def collect(suite):
+        for test in suite:
+            if isinstance(test, unittest2.TestSuite):
+                collect(test)
+            else:
+                name = '%s.%s' % (test.__class__.__module__,
+                                  test.__class__.__name__)
+                if name not in classes:
+                    classes.append(name)
+    collect(unittest2.TestLoader().loadTestsFromNames(test_names))
+    return classes
+
+
+def shard_tests(targets, test_names=None, processes=None):
+    """Split the test classes in test_names across targets round robin
+    and run each target's shard in its own worker process, so adding
+    test modules spreads over the clusters instead of queueing up."""
+    classes = test_classes(test_names or ALL_TESTS)
+    shards = [(name, path, classes[index::len(targets)])
+              for index, (name, path) in enumerate(targets)]
+    return _run_jobs([shard for shard in shards if shard[2]], processes)
+
+
+def target_snapshot(name, snapshot):
+    """snapshot with its checkpoint_file suffixed with the target name,
+    so targets run at the same time don't overwrite each other's
+    progress even when their configs name the same file."""
+    opencenter = snapshot.opencenter.as_dict()
+    if not opencenter.get('checkpoint_file'):
+        return snapshot
+    root, ext = os.path.splitext(opencenter['checkpoint_file'])
+    opencenter['checkpoint_file'] = '%s-%s%s' % (
+        root, re.sub(r'[^\w.-]+', '_', name), ext)
+    values = snapshot.as_dict()
+    values['opencenter'] = Snapshot('opencenter', opencenter)
+    return Snapshot(None, values)
+
+
+def _run_jobs(jobs, processes=None):
+    if not jobs:
+        return merge_reports([])
+    # Config errors show up here, before any cluster is touched
+    jobs = [(name, path, test_names,
+             target_snapshot(name, load_snapshot(path)))
+            for name, path, test_names in jobs]
+    # maxtasksperchild=1 and chunksize=1 so every target gets a fresh
+    # worker and no worker ever reuses another target's config
+    pool = multiprocessing.Pool(processes or len(jobs), maxtasksperchild=1)
+    try:
+        reports = pool.map(run_target, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return merge_reports(reports)
+
+
+def merge_reports(reports):
+    return {
+        'targets': reports,
+        'tests_run': sum(r['tests_run'] for r in reports),
+        'failures': sum(len(r['failures']) for r in reports),
+        'errors': sum(len(r['errors']) for r in reports),
+        'skipped': sum(len(r['skipped']) for r in reports),
+        'successful': all(r['successful'] for r in reports),
+    }
+
+
+def format_summary(merged):
+    lines = []
+    for report in merged['targets']:
+        lines.append('%-20s %-4s %3d run %3d failed %3d errors %8.1fs' % (
+            report['target'], 'OK' if report['successful'] else 'FAIL',
+            report['tests_run'], len(report['failures']),
+            len(report['errors']), report['wall_time']))
+        for test_id, tb in report['failures'] + report['errors']:
+            lines.append('  %s\n%s' % (test_id, tb))
+    lines.append('%d targets, %d tests, %d failures, %d errors' % (
+        len(merged['targets']), merged['tests_run'], merged['failures'],
+        merged['errors']))
+    return '\n'.join(lines)
+
+
+def write_xunit(merged, path):
+    """Write the merged report as a single xunit file. Test class names
+    are prefixed with their target so shards stay distinguishable."""
+    cases = [(report['target'], case) for report in merged['targets']
+             for case in report['cases']]
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<testsuite name="opencenter" tests="%d" errors="%d" '
+             'failures="%d" skip="%d">' % (len(cases), merged['errors'],
+                                           merged['failures'],
+                                           merged['skipped'])]
+    for target, case in cases:
+        classname, _, name = case['id'].rpartition('.')
+        lines.append('<testcase classname=%s name=%s time="%.3f">' % (
+            quoteattr('%s.%s' % (target, classname)), quoteattr(name),
+            case['time']))
+        if case['outcome'] in ('failure', 'error'):
+            lines.append('<%s message=%s>%s</%s>' % (
+                case['outcome'],
+                quoteattr(case['message'].strip().splitlines()[-1]
+                          if case['message'].strip() else ''),
+                escape(case['message']), case['outcome']))
+        elif case['outcome'] == 'skipped':
+            lines.append('<skipped message=%s/>' % quoteattr(case['message']))
+        lines.append('</testcase>')
+    lines.append('</testsuite>')
+    with open(path, 'w') as xunit:
+        xunit.write('\n'.join(lines) + '\n')
@@ -0,0 +1,120 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import bisect
+import re
+import threading
+import time
+
+
+class NodeRegistry(object):
+    """Name index over the endpoint's node list.
+
+    The node list is downloaded at most once every ttl seconds. find()
+    returns the first node, in server order, whose name the partial name
+    matches as a regex, exactly like find_node used to; results are
+    remembered until the next refresh. find_exact() and find_prefix()
+    go straight to the name index instead, for names known in full or
+    up to a suffix. Anything that changes the node tree (reparenting,
+    creating a cluster) should call invalidate() so the next lookup
+    refetches."""
+
+    def __init__(self, ep, ttl=30.0):
+        self.ep = ep
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._fetched_at = None
+        self._nodes = []
+        self._by_name = {}
+        self._names = []
+        self._patterns = {}
+        self._matches = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = None
+
+    def refresh(self, reason='node_registry_refresh'):
+        with self._lock:
+            self.ep._refresh('nodes', reason)
+            self._nodes = list(self.ep.nodes)
+            by_name = {}
+            for node in self._nodes:
+                # keep the first node for duplicate names, like find_node
+                by_name.setdefault(node.name, node)
+            self._by_name = by_name
+            self._names = sorted(by_name)
+            self._matches = {}
+            self._fetched_at = time.time()
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if (self._fetched_at is None or
+                    time.time() - self._fetched_at > self.ttl):
+                self.refresh()
+
+    def _lookup_exact(self, name):
+        return self._by_name.get(name)
+
+    def _lookup_prefix(self, prefix):
+        # the first name in name order starting with prefix
+        index = bisect.bisect_left(self._names, prefix)
+        if index < len(self._names) and self._names[index].startswith(prefix):
+            return self._by_name[self._names[index]]
+        return None
+
+    def _lookup(self, partial_name):
+        name = partial_name.strip()
+        if name not in self._matches:
+            if name not in self._patterns:
+                self._patterns[name] = re.compile(name)
+            pattern = self._patterns[name]
+            self._matches[name] = None
+            for node in self._nodes:
+                if pattern.search(node.name):
+                    self._matches[name] = node
+                    break
+        return self._matches[name]
+
+    def names(self, backend=None):
+        """Names of all nodes in name order, or of the nodes that have
+        backend among their backends."""
+        with self._lock:
+            self._ensure_fresh()
+            return [name for name in self._names
+                    if backend is None or backend in
+                    self._by_name[name].facts.get('backends', [])]
+
+    def find(self, partial_name):
+        """Return the first node whose name partial_name matches as a
+        regex. Raises ValueError if no node matches."""
+        return self.find_many([partial_name])[0]
+
+    def find_exact(self, name):
+        """Return the node named name. Raises ValueError if there is
+        none."""
+        return self._find(self._lookup_exact, [name], 'named')[0]
+
+    def find_prefix(self, prefix):
+        """Return the node with the first name, in name order, starting
+        with prefix. Raises ValueError if no name does."""
+        return self._find(self._lookup_prefix, [prefix], 'with prefix')[0]
+
+    def find_many(self, partial_names):
+        """Resolve several partial names, like find(), against a single
+        node listing."""
+        return self._find(self._lookup, partial_names, 'for pattern')
+
+    def _find(self, lookup, names, what):
+        # A miss forces one refresh in case the node was created after
+        # the cached listing was taken
+        with self._lock:
+            self._ensure_fresh()
+            found = [lookup(name) for name in names]
+            if None in found:
+                self.refresh('node_registry_miss')
+                found = [lookup(name) for name in names]
+        missing = [name for name, node in zip(names, found) if node is None]
+        if missing:
+            raise ValueError('No nodes found %s %s' %
+                             (what, ', '.join(missing)))
+        return found
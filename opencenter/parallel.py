@@ -0,0 +1,69 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import Queue
+import sys
+import threading
+import traceback
+
+
+class ParallelError(Exception):
+    """Raised when one or more calls made by run_parallel failed.
+
+    failures is a list of (item, formatted traceback) tuples, one for
+    every item that raised, so a single report covers every node."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        super(ParallelError, self).__init__(
+            '%d of the parallel operations failed' % len(failures))
+
+    def __str__(self):
+        lines = [self.args[0]]
+        for item, tb in self.failures:
+            lines.append('--- %s ---' % (item,))
+            lines.append(tb.rstrip())
+        return '\n'.join(lines)
+
+
+def run_parallel(func, items, workers=1):
+    """Call func(item) for every item using at most `workers` threads.
+
+    Returns the results in the same order as items. Every item is run
+    even if some fail; failures are collected and raised together as
+    a ParallelError once all calls have finished."""
+    items = list(items)
+    results = [None] * len(items)
+    failures = []
+    lock = threading.Lock()
+    work = Queue.Queue()
+    for index, item in enumerate(items):
+        work.put((index, item))
+
+    def worker():
+        while True:
+            try:
+                index, item = work.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            except Exception:
+                tb = ''.join(traceback.format_exception(*sys.exc_info()))
+                with lock:
+                    failures.append((index, item, tb))
+
+    workers = max(1, min(int(workers), len(items)))
+    if workers == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    if failures:
+        failures.sort(key=lambda failure: failure[0])
+        raise ParallelError([(item, tb) for _, item, tb in failures])
+    return results
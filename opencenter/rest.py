@@ -0,0 +1,69 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import logging
+
+import requests
+
+
+_warned = []
+
+
+def _warn_pool_size():
+    """Say once that this requests release can't size the pool."""
+    if not _warned:
+        _warned.append(True)
+        logging.getLogger(__name__).warning(
+            "requests %s has no transport adapters, pool_size is ignored "
+            "and its default connection pool is used" %
+            getattr(requests, '__version__', '?'))
+
+
+class RestClient(object):
+    """Thin JSON client for the parts of the opencenter-server API that
+    OpenCenterEndpoint does not expose. A single session is kept so
+    that requests share keep-alive connections; pool_size is how many
+    of those connections may be open at once. Releases of requests
+    without transport adapters (before 1.0) can't be told, and a
+    warning is logged instead."""
+
+    def __init__(self, endpoint_url, user=None, password=None, pool_size=10):
+        if '://' not in endpoint_url:
+            endpoint_url = 'http://' + endpoint_url
+        self.endpoint_url = endpoint_url.rstrip('/')
+        self.auth = (user, password) if user else None
+        self.session = requests.session()
+        if hasattr(requests, 'adapters'):
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                    pool_maxsize=pool_size)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        else:
+            _warn_pool_size()
+
+    def url(self, path):
+        return '%s/%s' % (self.endpoint_url, path.lstrip('/'))
+
+    def request(self, method, path, data=None, params=None, timeout=None):
+        """Make a request and return (status_code, decoded json body).
+        The body is None if the response was not json."""
+        headers = {'Content-Type': 'application/json'}
+        if data is not None:
+            data = json.dumps(data)
+        resp = self.session.request(method, self.url(path), data=data,
+                                    params=params, headers=headers,
+                                    auth=self.auth, timeout=timeout)
+        try:
+            body = json.loads(resp.content)
+        except (TypeError, ValueError):
+            body = None
+        return resp.status_code, body
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, data=None, **kwargs):
+        return self.request('POST', path, data=data, **kwargs)
+
+    def put(self, path, data=None, **kwargs):
+        return self.request('PUT', path, data=data, **kwargs)
@@ -0,0 +1,196 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import threading
+import time
+
+from opencenter.asyncclient import Future, gather
+from opencenter.parallel import run_parallel
+from opencenter.tasks import TERMINAL_STATES, TaskTimeout, task_succeeded
+from opencenter.timeouts import TimeoutPolicy
+
+
+class NodeResult(object):
+    """Outcome of running the rollout adventure on one node."""
+
+    def __init__(self, node, status, duration=0.0, message=''):
+        self.node_id = node.id
+        self.node_name = node.name
+        self.status = status
+        self.duration = duration
+        self.message = message
+
+    @classmethod
+    def from_exception(cls, node, duration, e):
+        if isinstance(e, TaskTimeout):
+            return cls(node, 'timeout', duration, str(e))
+        return cls(node, 'error', duration,
+                   '%s: %s' % (e.__class__.__name__, e))
+
+    @property
+    def ok(self):
+        return self.status == 'done'
+
+    def __repr__(self):
+        return '<NodeResult %s %s %.1fs>' % (self.node_name, self.status,
+                                             self.duration)
+
+
+class FleetRollout(object):
+    """Run one adventure across many nodes with bounded parallelism.
+
+    The first canary_size nodes are run on their own. The rest are run in
+    batches of batch_size (all remaining nodes if batch_size is 0). No more
+    than `workers` executions are in flight at once. Every task is waited
+    on. If the canary or any batch has a failure the remaining nodes are
+    not touched and are reported as skipped.
+
+    Given an AsyncEndpoint, executions and task waits go through it
+    instead of blocking a thread per node, so workers can be raised to
+    hundreds. A task still running after the adventure's timeout from
+    the TimeoutPolicy timeouts is given up on and reported as timeout."""
+
+    # Allowance on top of the task timeout for the execute requests
+    # when collecting a batch's results
+    GRACE = 60.0
+
+    def __init__(self, ep, adventure, workers=10, batch_size=0,
+                 canary_size=0, async_ep=None, timeouts=None,
+                 poll_interval=1.0):
+        self.ep = ep
+        self.adventure = adventure
+        self.workers = workers
+        self.batch_size = batch_size
+        self.canary_size = canary_size
+        self.async_ep = async_ep
+        self.timeouts = timeouts or TimeoutPolicy()
+        self.poll_interval = poll_interval
+
+    @property
+    def timeout(self):
+        """Seconds to wait for the adventure's task on a node."""
+        return self.timeouts.timeout(self.adventure.name)
+
+    def batches(self, nodes):
+        nodes = list(nodes)
+        if self.canary_size:
+            yield nodes[:self.canary_size]
+            nodes = nodes[self.canary_size:]
+        size = self.batch_size or len(nodes)
+        for start in range(0, len(nodes), size):
+            yield nodes[start:start + size]
+
+    def wait_for_task(self, task, timeout):
+        """Poll a client task object until it finishes. Raises
+        TaskTimeout after timeout seconds."""
+        deadline = time.time() + timeout
+        task._request('get')
+        while task.state not in TERMINAL_STATES:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TaskTimeout('task %s still %s after %ds' %
+                                  (task.id, task.state, timeout))
+            time.sleep(min(self.poll_interval, remaining))
+            task._request('get')
+
+    def run_node(self, node):
+        started = time.time()
+        try:
+            resp = self.ep.adventures[self.adventure.id].execute(node=node.id)
+            if resp.status_code != 202:
+                return NodeResult(node, 'error', time.time() - started,
+                                  'execute returned %s' % resp.status_code)
+            task = resp.task
+            self.wait_for_task(task, self.timeout)
+        except Exception as e:
+            return NodeResult.from_exception(node, time.time() - started, e)
+        status = 'done' if task_succeeded(task) else 'failed'
+        return NodeResult(node, status, time.time() - started,
+                          'task %s %s' % (task.id, task.state))
+
+    def start_node(self, node, release):
+        """Execute on node through the AsyncEndpoint. Returns a Future of
+        its NodeResult; release is called once the node is finished,
+        however that happens."""
+        result = Future()
+        started = time.time()
+        timeout = self.timeout
+
+        def finish(node_result):
+            try:
+                result.set_result(node_result)
+            finally:
+                release()
+
+        def fail(e):
+            finish(NodeResult.from_exception(node, time.time() - started, e))
+
+        def completed(task_id, future):
+            try:
+                task = future.result()
+                status = 'done' if task_succeeded(task) else 'failed'
+                message = 'task %s %s' % (task_id, task['state'])
+            except Exception as e:
+                return fail(e)
+            finish(NodeResult(node, status, time.time() - started, message))
+
+        def executed(future):
+            try:
+                status, body = future.result()
+                if status != 202:
+                    raise RuntimeError('execute returned %s' % status)
+                task_id = body['task']['id']
+                wait = self.async_ep.wait_for_task(task_id, timeout)
+            except Exception as e:
+                return fail(e)
+            wait.add_done_callback(lambda future: completed(task_id, future))
+
+        try:
+            execution = self.async_ep.execute(self.adventure.id, node.id)
+        except Exception as e:
+            fail(e)
+        else:
+            execution.add_done_callback(executed)
+        return result
+
+    def run_batch(self, batch):
+        if self.async_ep is None:
+            return run_parallel(self.run_node, batch, self.workers)
+        started = time.time()
+        slots = threading.Semaphore(self.workers)
+        futures = []
+        for node in batch:
+            slots.acquire()
+            futures.append(self.start_node(node, slots.release))
+        # Every task wait gives up within timeout of the last node
+        # starting, so this only trips if a result got lost
+        timeout = self.timeout + self.GRACE
+        try:
+            return gather(futures, timeout)
+        except RuntimeError:
+            return [future.result() if future.done() else
+                    NodeResult(node, 'timeout', time.time() - started,
+                               'no result within %ds' % timeout)
+                    for node, future in zip(batch, futures)]
+
+    def run(self, nodes):
+        """Roll out to nodes and return a NodeResult for every one."""
+        results = []
+        failed = False
+        for batch in self.batches(nodes):
+            if failed:
+                results.extend(NodeResult(node, 'skipped') for node in batch)
+                continue
+            batch_results = self.run_batch(batch)
+            results.extend(batch_results)
+            failed = not all(result.ok for result in batch_results)
+        return results
+
+
+def format_report(results):
+    """One line per node, slowest first, for printing after a rollout."""
+    lines = []
+    for result in sorted(results, key=lambda r: r.duration, reverse=True):
+        lines.append('%-30s %-8s %8.1fs %s' % (
+            result.node_name, result.status, result.duration,
+            result.message))
+    return '\n'.join(lines)
@@ -0,0 +1,215 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import sys
+import threading
+import time
+import traceback
+
+
+class Step(object):
+    """One unit of a deployment: an action plus the names of the steps
+    that have to succeed before it may start. adventure, node and
+    plan_args describe what the action does, for reporting. pool names
+    the Scheduler concurrency limit the step counts against, if any."""
+
+    def __init__(self, name, action, requires=(), adventure=None, node=None,
+                 plan_args=None, pool=None):
+        self.name = name
+        self.action = action
+        self.requires = list(requires)
+        self.pool = pool
+        self.adventure = adventure
+        self.node = node
+        self.plan_args = plan_args
+        self.state = 'waiting'
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+    def __repr__(self):
+        return '<Step %s %s>' % (self.name, self.state)
+
+
+class SchedulerError(Exception):
+    """Raised by Scheduler.run when steps failed or were skipped because
+    something they required failed."""
+
+    def __init__(self, failed, skipped):
+        self.failed = failed
+        self.skipped = skipped
+        super(SchedulerError, self).__init__(
+            '%d steps failed, %d skipped' % (len(failed), len(skipped)))
+
+    def __str__(self):
+        lines = [self.args[0]]
+        for step in self.failed:
+            lines.append('--- %s ---' % step.name)
+            lines.append(step.error.rstrip())
+        if self.skipped:
+            lines.append('skipped: %s' %
+                         ', '.join(s.name for s in self.skipped))
+        return '\n'.join(lines)
+
+
+class Scheduler(object):
+    """Runs a DAG of Steps, up to `workers` at a time.
+
+    A step starts as soon as every step it requires has succeeded. When a
+    step fails, the steps depending on it are skipped but independent
+    branches carry on. limits maps a pool name to the most steps of that
+    pool allowed to run at once. wrap, if given, is applied to each
+    action before it runs in a worker thread (e.g. Timeline.wrap)."""
+
+    def __init__(self, workers=1, limits=None, wrap=None):
+        self.workers = max(1, int(workers))
+        self.limits = limits or {}
+        for pool, limit in self.limits.items():
+            if limit < 1:
+                raise ValueError('Pool %s needs a limit of at least 1, '
+                                 'got %s' % (pool, limit))
+        self.wrap = wrap or (lambda func: func)
+        self._pool_running = {}
+        self.steps = []
+        self._by_name = {}
+
+    def add(self, step):
+        if step.name in self._by_name:
+            raise ValueError('Duplicate step %s' % step.name)
+        self.steps.append(step)
+        self._by_name[step.name] = step
+        return step
+
+    def add_step(self, name, action, requires=(), **kwargs):
+        return self.add(Step(name, action, requires, **kwargs))
+
+    def _validate(self):
+        for step in self.steps:
+            for name in step.requires:
+                if name not in self._by_name:
+                    raise ValueError('Step %s requires unknown step %s' %
+                                     (step.name, name))
+        # depth first search for cycles
+        visiting, visited = set(), set()
+
+        def visit(step):
+            if step.name in visited:
+                return
+            if step.name in visiting:
+                raise ValueError('Dependency cycle through %s' % step.name)
+            visiting.add(step.name)
+            for name in step.requires:
+                visit(self._by_name[name])
+            visiting.discard(step.name)
+            visited.add(step.name)
+
+        for step in self.steps:
+            visit(step)
+
+    def _next_step(self):
+        """Pick a runnable step, skipping any whose prerequisites failed.
+        Must be called with the condition held."""
+        skipped = True
+        while skipped:
+            skipped = False
+            for step in self.steps:
+                if step.state != 'waiting':
+                    continue
+                states = [self._by_name[name].state for name in step.requires]
+                if any(state in ('failed', 'skipped') for state in states):
+                    step.state = 'skipped'
+                    skipped = True
+                    continue
+                if step.pool in self.limits and (
+                        self._pool_running.get(step.pool, 0) >=
+                        self.limits[step.pool]):
+                    continue
+                if all(state == 'done' for state in states):
+                    return step
+        return None
+
+    def run(self):
+        """Run every step and return them. Raises SchedulerError once
+        everything runnable has finished if any step failed."""
+        self._validate()
+        # Wrap here, on the calling thread, so steps inherit its phase
+        actions = dict((step.name, self.wrap(step.action))
+                       for step in self.steps)
+        condition = threading.Condition()
+        running = [0]
+
+        def worker():
+            while True:
+                with condition:
+                    step = self._next_step()
+                    while step is None and running[0]:
+                        condition.wait()
+                        step = self._next_step()
+                    if step is None:
+                        condition.notify_all()
+                        return
+                    step.state = 'running'
+                    step.started = time.time()
+                    running[0] += 1
+                    self._pool_running[step.pool] = (
+                        self._pool_running.get(step.pool, 0) + 1)
+                try:
+                    actions[step.name]()
+                    state, error = 'done', None
+                except Exception:
+                    state = 'failed'
+                    error = ''.join(
+                        traceback.format_exception(*sys.exc_info()))
+                with condition:
+                    step.finished = time.time()
+                    step.state, step.error = state, error
+                    running[0] -= 1
+                    self._pool_running[step.pool] -= 1
+                    condition.notify_all()
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(min(self.workers, len(self.steps)) or 1)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Anything still waiting could never start; report it as skipped
+        for step in self.steps:
+            if step.state == 'waiting':
+                step.state = 'skipped'
+        failed = [s for s in self.steps if s.state == 'failed']
+        skipped = [s for s in self.steps if s.state == 'skipped']
+        if failed or skipped:
+            raise SchedulerError(failed, skipped)
+        return self.steps
+
+    def critical_path(self):
+        """The chain of finished steps that determined the total run
+        time: starting from the step that finished last, repeatedly follow
+        the prerequisite that finished last."""
+        finished = [s for s in self.steps if s.finished is not None]
+        if not finished:
+            return []
+        step = max(finished, key=lambda s: s.finished)
+        path = [step]
+        while step.requires:
+            prerequisites = [self._by_name[name] for name in step.requires
+                             if self._by_name[name].finished is not None]
+            if not prerequisites:
+                break
+            step = max(prerequisites, key=lambda s: s.finished)
+            path.append(step)
+        path.reverse()
+        return path
+
+
+def format_critical_path(path):
+    return '\n'.join('%8.1fs  %s' % (step.duration, step.name)
+                     for step in path)
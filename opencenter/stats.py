@@ -0,0 +1,20 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+"""Summary statistics shared by the load test, history and timeout
+reports, so they agree on the same data."""
+
+import math
+
+
+def percentile(values, pct):
+    """Nearest rank percentile of values: the smallest value with at
+    least pct percent of values at or below it. None if values is empty."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def median(values):
+    return percentile(values, 50)
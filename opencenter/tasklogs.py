@@ -0,0 +1,155 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import collections
+import contextlib
+import hashlib
+import os
+import re
+import threading
+
+import requests
+
+from opencenter.tasks import UNSUPPORTED_STATUS, task_succeeded
+
+
+class TaskLog(object):
+    """The log file of one captured task."""
+
+    def __init__(self, task_id, path):
+        self.task_id = task_id
+        self.path = path
+        self.offset = 0
+        self.task = None
+        self.failed = False
+        self.kept = False
+
+
+class TaskLogTailer(object):
+    """Streams task logs into one file per task while the task runs.
+
+    Only bytes past the last offset are fetched from
+    tasks/<id>/logs?offset=N, and each chunk goes straight to the file,
+    so memory use doesn't grow with the log. Once the task finishes its
+    log is kept if the task failed; logs of successful tasks are
+    dropped, apart from the most recent keep_successful of them.
+
+    Only the captured task's own log is followed, not the tasks it
+    kicks off (such as the chef runs after a reparent). wrap, if given,
+    is applied to the follower before it starts in its own thread
+    (e.g. Timeline.wrap)."""
+
+    # Limits on reading the rest of a log once its task is done, in case
+    # the server keeps answering however far the offset goes
+    FINISH_MAX_READS = 1000
+    FINISH_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, rest, log_dir, keep_successful=0, interval=2.0,
+                 prefix='', wrap=None):
+        self.rest = rest
+        self.log_dir = log_dir
+        self.keep_successful = keep_successful
+        self.interval = interval
+        self.prefix = re.sub(r'[^\w.-]+', '_', prefix)
+        self.wrap = wrap or (lambda func: func)
+        self.supported = True
+        self._successful = collections.deque()
+        self._lock = threading.Lock()
+
+    def path(self, task_id):
+        name = 'task-%s.log' % task_id
+        if self.prefix:
+            name = '%s-%s' % (self.prefix, name)
+        return os.path.join(self.log_dir, name)
+
+    def tail(self, log):
+        """Append whatever the task has logged since the last call."""
+        chunk = self._fetch(log)
+        if chunk:
+            self._append(log, chunk)
+        return len(chunk or '')
+
+    def _fetch(self, log):
+        if not self.supported:
+            return None
+        try:
+            status, body = self.rest.get('tasks/%s/logs' % log.task_id,
+                                         params={'offset': log.offset})
+        except requests.exceptions.RequestException:
+            return None
+        if status in UNSUPPORTED_STATUS:
+            self.supported = False
+            return None
+        chunk = (body or {}).get('log') if status == 200 else None
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        return chunk
+
+    def _append(self, log, chunk):
+        with open(log.path, 'ab') as log_file:
+            log_file.write(chunk)
+        log.offset += len(chunk)
+
+    @contextlib.contextmanager
+    def capture(self, task_id):
+        """Tail task_id's log in the background for the duration of the
+        with block, which is expected to wait for the task. Yields the
+        TaskLog; afterwards failed, kept and path say whether the task
+        failed and where its log is."""
+        if not os.path.isdir(self.log_dir):
+            os.makedirs(self.log_dir)
+        log = TaskLog(task_id, self.path(task_id))
+        stop = threading.Event()
+
+        def follow():
+            while not stop.wait(self.interval):
+                self.tail(log)
+
+        thread = threading.Thread(target=self.wrap(follow))
+        thread.daemon = True
+        thread.start()
+        try:
+            yield log
+        finally:
+            stop.set()
+            thread.join()
+            self.finish(log)
+
+    def finish(self, log):
+        # Pick up the tail end, then decide whether the log is worth it.
+        # A server that ignores or resets the offset sends the same chunk
+        # again, which ends the reading as surely as an empty one.
+        seen = set()
+        started = log.offset
+        for _ in range(self.FINISH_MAX_READS):
+            chunk = self._fetch(log)
+            if not chunk:
+                break
+            digest = hashlib.sha1(chunk).digest()
+            if digest in seen:
+                break
+            seen.add(digest)
+            self._append(log, chunk)
+            if log.offset - started >= self.FINISH_MAX_BYTES:
+                break
+        # Runs from capture()'s finally, so it must not raise over
+        # whatever exception may already be on its way out
+        try:
+            status, body = self.rest.get('tasks/%s' % log.task_id)
+        except requests.exceptions.RequestException:
+            status, body = None, None
+        log.task = body['task'] if status == 200 else None
+        if log.task is None or not task_succeeded(log.task):
+            log.failed = True
+            log.kept = os.path.exists(log.path)
+            return
+        with self._lock:
+            self._successful.append(log.path)
+            while len(self._successful) > self.keep_successful:
+                self._remove(self._successful.popleft())
+        log.kept = os.path.exists(log.path)
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,208 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import time
+
+import requests
+
+
+TERMINAL_STATES = ('done', 'timeout', 'cancelled')
+
+# Status codes meaning the server has no long-poll endpoint for tasks
+UNSUPPORTED_STATUS = (404, 405, 501)
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class TaskUpdateFeed(object):
+    """Waits for the server's tasks to change.
+
+    Long-polls the tasks/updates feed through a RestClient when the
+    server supports it. Without a RestClient, or once the server has
+    shown it has no such endpoint, it simply sleeps."""
+
+    def __init__(self, rest=None, sleep=time.sleep):
+        self.rest = rest
+        self.sleep = sleep
+        self.supported = rest is not None
+
+    def wait(self, txid, wait):
+        """Wait up to `wait` seconds for tasks to change, returning the
+        latest transaction id seen on the update feed."""
+        if not self.supported:
+            self.sleep(wait)
+            return txid
+        try:
+            status, body = self.rest.get('tasks/updates/%s' % txid,
+                                         params={'poll': 1},
+                                         timeout=max(wait, 0.1))
+        except requests.exceptions.Timeout:
+            return txid
+        except requests.exceptions.RequestException:
+            status, body = None, None
+        if status == 200 and body and 'transaction' in body:
+            return body['transaction'].get('txid', txid)
+        if status in UNSUPPORTED_STATUS or status is None:
+            # No usable watch endpoint, fall back to backoff polling
+            self.supported = False
+        self.sleep(wait)
+        return txid
+
+
+class TaskTracker(object):
+    """Waits for the chain of tasks that follows a change to a node.
+
+    A node is considered settled once every one of its tasks is in a
+    terminal state and the set of tasks has not changed for
+    quiet_period seconds. Between checks the tracker long-polls the
+    server's task update feed when a RestClient is given and the server
+    supports it, and otherwise sleeps with exponential backoff between
+    poll_interval and max_poll_interval."""
+
+    def __init__(self, ep, rest=None, quiet_period=5.0, poll_interval=0.5,
+                 max_poll_interval=10.0, backoff=2.0, sleep=time.sleep):
+        self.ep = ep
+        self.feed = TaskUpdateFeed(rest, sleep)
+        self.quiet_period = quiet_period
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+
+    def node_tasks(self, node_id):
+        return list(self.ep.nodes[node_id].tasks)
+
+    def wait_for_quiescence(self, node_id, timeout=None):
+        """Block until node_id's tasks have settled and return them.
+        Raises TaskTimeout if that takes longer than timeout seconds."""
+        started = time.time()
+        interval = self.poll_interval
+        txid = 0
+        last_seen = None
+        changed_at = started
+        while True:
+            tasks = self.node_tasks(node_id)
+            now = time.time()
+            seen = sorted((t.id, t.state) for t in tasks)
+            if seen != last_seen:
+                last_seen = seen
+                changed_at = now
+                interval = self.poll_interval
+            finished = all(t.state in TERMINAL_STATES for t in tasks)
+            quiet_for = now - changed_at
+            if finished and quiet_for >= self.quiet_period:
+                return tasks
+            if timeout is not None and now - started >= timeout:
+                raise TaskTimeout('Tasks on node %s did not settle within '
+                                  '%ss: %s' % (node_id, timeout, seen))
+
+            wait = interval
+            if finished:
+                wait = min(wait, self.quiet_period - quiet_for)
+            if timeout is not None:
+                wait = min(wait, timeout - (now - started))
+            txid = self.feed.wait(txid, max(wait, 0))
+            interval = min(interval * self.backoff, self.max_poll_interval)
+
+
+class TaskGroup(object):
+    """Tasks started together, e.g. by one batch of fact writes, and
+    waited for as one. Tasks are the dicts returned by the REST API.
+    Up to batch_threshold pending tasks are fetched one by one, beyond
+    that a single tasks/filter request for their ids is used per check,
+    and any the filter leaves out are then fetched one by one."""
+
+    def __init__(self, rest, tasks, poll_interval=0.5, max_poll_interval=10.0,
+                 backoff=2.0, batch_threshold=10, sleep=time.sleep):
+        self.rest = rest
+        self.tasks = dict((task['id'], task) for task in tasks)
+        self.started = time.time()
+        # when each task was first seen in a terminal state
+        self.finished_at = {}
+        self.feed = TaskUpdateFeed(rest, sleep)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.batch_threshold = batch_threshold
+
+    def __len__(self):
+        return len(self.tasks)
+
+    @property
+    def node_ids(self):
+        return sorted(set(task['node_id'] for task in self.tasks.values()))
+
+    def pending(self):
+        return [task_id for task_id, task in self.tasks.items()
+                if task['state'] not in TERMINAL_STATES]
+
+    def refresh(self, task_ids):
+        found = {}
+        if len(task_ids) > self.batch_threshold:
+            expr = ' or '.join('id = %s' % task_id
+                               for task_id in sorted(task_ids))
+            status, body = self.rest.post('tasks/filter', {'filter': expr})
+            if status == 200:
+                found = dict((task['id'], task)
+                             for task in (body or {}).get('tasks', [])
+                             if task['id'] in self.tasks)
+        for task_id in task_ids:
+            if task_id not in found:
+                status, body = self.rest.get('tasks/%s' % task_id)
+                if status == 200:
+                    found[task_id] = body['task']
+        now = time.time()
+        for task_id, task in found.items():
+            self.tasks[task_id] = task
+            if task['state'] in TERMINAL_STATES:
+                self.finished_at.setdefault(task_id, now)
+
+    def wait(self, timeout=None):
+        """Block until every task in the group is in a terminal state and
+        return them. Raises TaskTimeout after timeout seconds."""
+        started = time.time()
+        interval = self.poll_interval
+        txid = 0
+        pending = self.pending()
+        while pending:
+            self.refresh(pending)
+            still_pending = self.pending()
+            if not still_pending:
+                break
+            if len(still_pending) < len(pending):
+                interval = self.poll_interval
+            pending = still_pending
+            elapsed = time.time() - started
+            if timeout is not None and elapsed >= timeout:
+                raise TaskTimeout('%d of %d tasks did not finish within %ss: '
+                                  '%s' % (len(pending), len(self.tasks),
+                                          timeout, sorted(pending)))
+            wait = interval
+            if timeout is not None:
+                wait = min(wait, timeout - elapsed)
+            txid = self.feed.wait(txid, max(wait, 0))
+            interval = min(interval * self.backoff, self.max_poll_interval)
+        return [self.tasks[task_id] for task_id in sorted(self.tasks)]
+
+    def durations(self):
+        """{task id: seconds from the group starting until the task was
+        seen to finish} for the finished tasks."""
+        return dict((task_id, finished - self.started)
+                    for task_id, finished in self.finished_at.items())
+
+    def failed(self):
+        return [task for task in self.tasks.values()
+                if task['state'] in TERMINAL_STATES and
+                not task_succeeded(task)]
+
+
+def task_succeeded(task):
+    """True if a finished task completed with a zero result code. Takes
+    either a client task object or a task dict from the REST API."""
+    if isinstance(task, dict):
+        state, result = task.get('state'), task.get('result')
+    else:
+        state, result = task.state, getattr(task, 'result', None)
+    if state != 'done':
+        return False
+    return (result or {}).get('result_code', 0) == 0
@@ -7,89 +7,115 @@ import time
 import unittest2
 import datetime
 
-from opencenter.config import OpenCenterConfiguration
-from opencenterclient.client import OpenCenterEndpoint
-import re
+from opencenter.checkpoint import Checkpoint
+from opencenter.config import get_config
+from opencenter.fixtures import get_session
+from opencenter.history import RunTimings, save_run
+from opencenter.parallel import run_parallel
+from opencenter.scheduler import Scheduler, SchedulerError, \
+    format_critical_path
+from opencenter.tasks import TERMINAL_STATES, TaskTimeout
+from opencenter.timeline import get_timeline
+from opencenter.timeouts import TimeoutPolicy, cancel_task
+from opencenter.topology import DEFAULT_ZONE, placement_from_config, \
+    zone_container
 
 class OpenCenterTestCase(unittest2.TestCase):
     """
     This test case assumes a opencenter-server has been successfully created, and
     at least 3 nodes have opencenter-agent installed.
     """
+    CHEF_SERVER_FACTS = ['chef_server_client_name', 'chef_server_client_pem',
+                         'chef_server_pem', 'chef_server_uri']
+
+    # The step that sets each shared fact steps may depend on
+    FACT_STEPS = {'ha_infra': 'Enable HA Infrastructure'}
+
     @classmethod
-    def setUpClass(self):
-        pass
+    def setUpClass(cls):
+        # Connections and the adventure catalogue are shared per process
+        cls.session = get_session()
+        cls.ep = cls.session.ep
+        cls.admin_ep = cls.session.admin_ep
+        cls.rest = cls.session.rest
+        cls.nodes = cls.session.nodes
+        cls.task_tracker = cls.session.task_tracker
+        cls.fact_writer = cls.session.fact_writer
+        cls.task_logs = cls.session.task_logs
+        cls.timeline = get_timeline()
+        cls.timeline_dir = get_config().opencenter.timeline_dir
+        if cls.timeline_dir:
+            cls.timeline.install_http_hooks()
+
+        # Collect all the adventures we are going to run
+        adventure = cls.session.adventure
+        cls.chef_svr = adventure("Install Chef Server")
+        cls.chef_cli = adventure("Install Chef Client")
+        cls.nova_clus = adventure("Create Nova Cluster")
+        cls.n_api = adventure("Install Nova Controller")
+        cls.n_cpu = adventure("Install Nova Compute")
+        cls.download_cookbooks = adventure("Download Chef Cookbooks")
+        cls.upload_glance_images = adventure("Upload Initial Glance Images")
+        cls.enable_ha = adventure("Enable HA Infrastructure")
+        cls.create_az = adventure("Create Availability Zone")
 
     @classmethod
     def tearDownClass(self):
         pass
 
     def setUp(self):
-        # Gather configuration data
-        config = OpenCenterConfiguration()
-        opencenter_config = config.opencenter_config
-        cluster_data =  config.cluster_data
-        vip_data = config.vip_data
+        # Gather configuration data, resolved once per process
+        config = get_config()
+        opencenter_config = config.opencenter
         self.endpoint_url = opencenter_config.endpoint_url
         self.server_name = opencenter_config.instance_server_hostname
         self.chef_name = opencenter_config.instance_chef_hostname
-        self.compute_name = opencenter_config.instance_compute_hostname
-        self.controller_name = opencenter_config.instance_controller_hostname
         self.user = opencenter_config.user
         self.password = opencenter_config.password
-        self.cluster_data = {
-            'osops_public': cluster_data.osops_public,
-            'osops_mgmt': cluster_data.osops_mgmt,
-            'osops_nova': cluster_data.osops_nova, 
-            'nova_public_if': cluster_data.nova_public_if,
-            'nova_vm_bridge': cluster_data.nova_vm_bridge, 
-            'nova_dmz_cidr': cluster_data.nova_dmz_cidr,
-            'cluster_name': cluster_data.cluster_name,
-            'keystone_admin_pw': cluster_data.keystone_admin_pw,
-            'nova_vm_fixed_if': cluster_data.nova_vm_fixed_if,
-            'nova_vm_fixed_range': cluster_data.nova_vm_fixed_range,
-            'libvirt_type': cluster_data.libvirt_type
-        }
-        self.vip_data = {
-            'nova_rabbitmq_vip': vip_data.nova_rabbitmq_vip,
-            'nova_api_vip': vip_data.nova_api_vip,
-            'nova_mysql_vip': vip_data.nova_mysql_vip
-        }
-        
-        # Establish connections with endpoints
-        if self.user:
-            self.ep = OpenCenterEndpoint(self.endpoint_url, user=self.user, password=self.password)
-        else:
-            self.ep = OpenCenterEndpoint(self.endpoint_url)
-        self.admin_ep = OpenCenterEndpoint(self.endpoint_url + '/admin', user=self.user, password=self.password)
+        self.reparent_workers = opencenter_config.reparent_workers
+        # Replayed runs take no real time, keep them out of the history
+        self.history_db = None
+        if not opencenter_config.replay_cassette:
+            self.history_db = opencenter_config.history_db
+        self.scheduler_workers = opencenter_config.scheduler_workers
+        self.parallel_ha = opencenter_config.parallel_ha
+        self.cluster_data = config.cluster_data.as_dict()
+        self.vip_data = config.vip_data.as_dict()
 
         # Collect all the nodes we need
         self.workspace = self.find_node("workspace")
         self.unprovisioned = self.find_node('unprovisioned')
+        # Which agent plays which role, from [topology] or the host lists
+        self.placement = placement_from_config(opencenter_config,
+                                               config.topology,
+                                               self.nodes)
+        self.wave_size = config.topology.wave_size
+        self.timeline.reset()
+        self.timings = RunTimings()
+        self.timeouts = TimeoutPolicy(
+            default=opencenter_config.task_timeout,
+            factor=opencenter_config.task_timeout_factor,
+            minimum=opencenter_config.task_timeout_min,
+            overrides=config.task_timeouts.overrides,
+            history_db=self.history_db,
+            cluster=self.cluster_data['cluster_name'])
 
-        # Collect all the adventures we are going to run
-        self.chef_svr = self.ep.adventures.filter('name = "Install Chef Server"').first()
-        self.chef_cli = self.ep.adventures.filter('name = "Install Chef Client"').first()
-        self.nova_clus = self.ep.adventures.filter('name = "Create Nova Cluster"').first()
-        self.n_api = self.ep.adventures.filter('name = "Install Nova Controller"').first()
-        self.n_cpu = self.ep.adventures.filter('name = "Install Nova Compute"').first()
-        self.download_cookbooks = self.ep.adventures.filter('name = "Download Chef Cookbooks"').first()
-        self.upload_glance_images = self.ep.adventures.filter('name = "Upload Initial Glance Images"').first()
-        self.enable_ha = self.ep.adventures.filter('name = "Enable HA Infrastructure"').first()
+        # Resume from an earlier run's progress if checkpointing is on
+        self.checkpoint = None
+        if opencenter_config.checkpoint_file:
+            self.checkpoint = Checkpoint(opencenter_config.checkpoint_file,
+                                         self.endpoint_url,
+                                         self.cluster_data['cluster_name'])
 
     def tearDown(self):
-        pass
+        if self.timeline_dir:
+            basename = '%s-%s' % (self.id(), time.strftime('%Y%m%d%H%M%S'))
+            self.timeline.write(os.path.join(self.timeline_dir, basename))
 
     def find_node(self, partial_name):
         """find a node by partial name match.
         Useful for unpredictable jenkins node names."""
-        self.ep._refresh('nodes', 'before_find_node')
-        matches = [n for n in self.ep.nodes if
-                   re.search(partial_name.strip(), n.name)]
-        if matches:
-            return matches[0]
-        else:
-            raise ValueError('No nodes found for pattern %s' % partial_name)
+        return self.nodes.find(partial_name)
 
     def test_opencenter_happy_path(self):
         """Happy path creates a chef server and lays down an openstack 
@@ -98,105 +124,443 @@ class OpenCenterTestCase(unittest2.TestCase):
         
         # Run the install-chef-server adventure on the node
         chef_server = self.find_node(self.chef_name)
-        resp = self.ep.adventures[self.chef_svr.id].execute(
-            node=chef_server.id)
-        self.assertEquals(resp.status_code, 202)
+        successful = False
+        try:
+            with self.timeline.phase('happy_path'):
+                self._happy_path(chef_server)
+            successful = True
+        finally:
+            if self.history_db:
+                save_run(self.history_db, self.id(),
+                         self.cluster_data['cluster_name'], self.endpoint_url,
+                         self.timings, successful)
+        if self.checkpoint:
+            self.checkpoint.clear()
 
-        # adventure is running, go poll
-        task = resp.task
-        task.wait_for_complete()
+    def _happy_path(self, chef_server):
+        scheduler = Scheduler(self.scheduler_workers,
+                              limits={'reparent': self.reparent_workers},
+                              wrap=self.timeline.wrap)
+        self._build_deployment(scheduler, chef_server)
+        try:
+            scheduler.run()
+        except SchedulerError as e:
+            self.fail(str(e))
+        finally:
+            print "critical path:"
+            print format_critical_path(scheduler.critical_path())
 
-        # refresh the server object
-        chef_server._request('get')
-        self._validate_chef_server(chef_server)
+    def _build_deployment(self, scheduler, chef_server):
+        """Add the happy path to scheduler as a DAG of steps built from the
+        placement. Steps only wait for what they need: glance uploads
+        overlap, and computes only wait for their zone's container and
+        the first controller. Computes are reparented in waves of
+        wave_size, one wave after the other, so large clusters don't
+        swamp the server with reparent tasks.
 
-        # Lets check if the root workspace now has the correct adventure
-        self.assertTrue(self.nova_clus.id in self.workspace.adventures.keys())
-        
-        # Create an OpenStack cluster
-        resp = self.ep.adventures[self.nova_clus.id].execute(
-            node=self.workspace.id, plan_args=self.cluster_data)
-        self.assertEquals(resp.status_code, 202)
-        self.assertFalse(resp.requires_input)
-        task = resp.task
-        task.wait_for_complete()
-
-        # make sure test_cluster got created
+        Steps that need a shared fact such as ha_infra name it and
+        depend on the step in FACT_STEPS that sets it. With parallel_ha
+        the other controllers don't need ha_infra, so their reparent and
+        glance upload run alongside Enable HA."""
+        controllers = self.nodes.find_many(self.placement.controllers)
+        computes = dict(zip(self.placement.computes,
+                            self.nodes.find_many(self.placement.computes)))
+
+        print "computes", self.placement.zones
+        print "controllers", controllers
+
+        # filled in by the cluster step, read by the reparent steps
+        containers = {}
+
+        def install_chef_server():
+            # adventure is running, go poll
+            self._run_phase('Install Chef Server',
+                            lambda: self._run_adventure(self.chef_svr,
+                                                        chef_server),
+                            lambda: self._chef_server_ready(chef_server))
+
+            # refresh the server object
+            chef_server._request('get')
+            self._validate_chef_server(chef_server)
+
+            # Lets check if the root workspace now has the correct adventure
+            self.assertTrue(
+                self.nova_clus.id in self.workspace.adventures.keys())
+
+        def create_cluster():
+            self._run_phase('Create Nova Cluster',
+                            lambda: self._run_adventure(self.nova_clus,
+                                                        self.workspace,
+                                                        self.cluster_data),
+                            self._cluster_exists)
+            self.nodes.invalidate()
+            containers.update(self._find_containers())
+            containers[zone_container(DEFAULT_ZONE)] = containers['az']
+
+        def create_zone_step(zone):
+            name = zone_container(zone)
+
+            def create_zone():
+                compute_container = containers['compute']
+                self._run_phase('Create %s' % name,
+                                lambda: self._run_adventure(
+                                    self.create_az, compute_container,
+                                    {'nova_az': zone}),
+                                lambda: self._zone_exists(zone))
+                self.nodes.invalidate()
+                az_container = self.nodes.find_exact(name)
+                self.assertEquals(az_container.facts['parent_id'],
+                                  compute_container.id)
+                containers[name] = az_container
+            return create_zone
+
+        def enable_ha():
+            infra_container = containers['infra']
+            self._run_phase('Enable HA Infrastructure',
+                            lambda: self._run_adventure(
+                                self.enable_ha, infra_container,
+                                self.vip_data),
+                            lambda: self._ha_enabled(infra_container))
+            infra_container._request('get')
+            self.assertTrue(infra_container.facts['ha_infra'])
+
+        scheduler.add_step('Install Chef Server', install_chef_server,
+                           adventure=self.chef_svr, node=chef_server)
+        scheduler.add_step('Create Nova Cluster', create_cluster,
+                           ['Install Chef Server'], adventure=self.nova_clus,
+                           node=self.workspace, plan_args=self.cluster_data)
+
+        def verify_vips():
+            self._verify_vips(containers['infra'])
+
+        def needs(requires, *facts):
+            return requires + [self.FACT_STEPS[fact] for fact in facts]
+
+        # Reparent the controllers under the new infra container. Enable
+        # HA once the first controller is in place; the others join after
+        # it, or alongside it with parallel_ha
+        ha = len(controllers) > 1
+        first_controller = 'reparent %s' % controllers[0].name
+        for index, controller in enumerate(controllers):
+            reparent = 'reparent %s' % controller.name
+            glance = 'glance %s' % controller.name
+            requires = ['Create Nova Cluster']
+            if ha and index > 0:
+                if self.parallel_ha:
+                    requires.append(first_controller)
+                else:
+                    requires = needs(requires, 'ha_infra')
+            scheduler.add_step(reparent,
+                               self._reparent_step(controller, containers,
+                                                   'infra'),
+                               requires, node=controller, pool='reparent')
+
+            #Upload initial glance images
+            scheduler.add_step(glance,
+                               self._glance_step(controller),
+                               [reparent], node=controller,
+                               adventure=self.upload_glance_images,
+                               plan_args=self.cluster_data)
+
+            if ha and index == 0:
+                scheduler.add_step('Enable HA Infrastructure', enable_ha,
+                                   [reparent] if self.parallel_ha
+                                   else [reparent, glance],
+                                   adventure=self.enable_ha,
+                                   plan_args=self.vip_data)
+
+        # Check the VIPs once everything touching the controllers is done
+        if ha:
+            scheduler.add_step('Verify VIPs', verify_vips,
+                               needs([step.name for step in scheduler.steps
+                                      if step.node in controllers],
+                                     'ha_infra'))
+
+        # Zones other than the default one get their own container
+        zone_steps = {}
+        for zone, names in self.placement.zones:
+            if zone == DEFAULT_ZONE or not names:
+                zone_steps[zone] = 'Create Nova Cluster'
+                continue
+            if self.create_az is None:
+                self.fail('Server has no Create Availability Zone adventure '
+                          'for zone %s' % zone)
+            zone_steps[zone] = 'Create %s' % zone_container(zone)
+            scheduler.add_step(zone_steps[zone], create_zone_step(zone),
+                               ['Create Nova Cluster'],
+                               adventure=self.create_az,
+                               plan_args={'nova_az': zone})
+
+        # Reparent the computes under their AZ containers a wave at a
+        # time, each wave in one batch
+        waves = self.placement.compute_waves(self.wave_size)
+        previous = []
+        for index, wave in enumerate(waves):
+            name = 'reparent computes'
+            if len(waves) > 1:
+                name = 'reparent computes wave %d/%d' % (index + 1,
+                                                         len(waves))
+            requires = [first_controller] + previous
+            for zone in sorted(set(zone for zone, _ in wave)):
+                if zone_steps[zone] not in requires:
+                    requires.append(zone_steps[zone])
+            scheduler.add_step(name,
+                               self._reparent_many_step(
+                                   [(computes[node_name],
+                                     zone_container(zone))
+                                    for zone, node_name in wave],
+                                   containers),
+                               requires, pool='reparent')
+            previous = [name]
+
+    def _find_containers(self):
+        """make sure test_cluster got created, and return it along with
+        its Infrastructure, Compute and AZ containers"""
         test_cluster = self.find_node(self.cluster_data['cluster_name'])
         self.assertIsNotNone(test_cluster)
         self.assertEquals(test_cluster.facts['parent_id'], self.workspace.id)
-        infra_container = self.find_node("Infrastructure")
+        infra_container = self.nodes.find_exact("Infrastructure")
         self.assertIsNotNone(infra_container)
         self.assertEquals(infra_container.facts['parent_id'], test_cluster.id)
-        compute_container = self.find_node("Compute")
+        compute_container = self.nodes.find_exact("Compute")
         self.assertIsNotNone(compute_container)
         self.assertEquals(compute_container.facts['parent_id'], test_cluster.id)
-        az_container = self.find_node("AZ nova")
+        az_container = self.nodes.find_exact(zone_container(DEFAULT_ZONE))
         self.assertIsNotNone(az_container)
         self.assertEquals(az_container.facts['parent_id'], compute_container.id)
-        
-        
-        controllers = []
-        for controller_name in self.controller_name.split(","):
-            controllers.append(self.find_node(controller_name))
-        computes = []
-        for compute_name in self.compute_name.split(","):
-            computes.append(self.find_node(compute_name))
-
-        print "computes", computes
-        print "controllers", controllers
-        
-        # Reparent self.controller_name under the new infra container
-        ha_enabled = False
-        for new_controller in controllers:
-            self._reparent(new_controller, infra_container)
-            new_controller._request('get')
-            self.assertEquals(new_controller.facts['parent_id'], infra_container.id)
-            
-            #Upload initial glance images
-            resp = self.ep.adventures[self.upload_glance_images.id].execute(
-                        node=new_controller.id, plan_args=self.cluster_data)
+        return {'cluster': test_cluster, 'infra': infra_container,
+                'compute': compute_container, 'az': az_container}
+
+    def _run_adventure(self, adventure, node, plan_args=None):
+        """Execute adventure on node and wait for its task to finish,
+        timing both under a phase named after the adventure."""
+        with self.timeline.phase('%s on %s' % (adventure.name, node.name)), \
+                self.timings.measure(adventure.name, node.name):
+            with self.timeline.phase('execute'):
+                if plan_args is None:
+                    resp = self.ep.adventures[adventure.id].execute(
+                        node=node.id)
+                else:
+                    resp = self.ep.adventures[adventure.id].execute(
+                        node=node.id, plan_args=plan_args)
             self.assertEquals(resp.status_code, 202)
             self.assertFalse(resp.requires_input)
             task = resp.task
-            task.wait_for_complete()
-
-            # Enable HA if possible
-            if not ha_enabled and len(controllers) > 1:
-                resp = self.ep.adventures[self.enable_ha.id].execute(
-                    node=infra_container.id, plan_args=self.vip_data)
-                self.assertEquals(resp.status_code, 202)
-                self.assertFalse(resp.requires_input)
-                task = resp.task
-                task.wait_for_complete()
-                infra_container._request('get')
-                self.assertTrue(infra_container.facts['ha_infra'])
-                ha_enabled = True
-            
-        # Reparent self.controller_name under the new infra container
-        for new_compute in computes:
-            self._reparent(new_compute, az_container)
-            new_compute._request('get')
-            self.assertEquals(new_compute.facts['parent_id'], az_container.id)
+            self._wait_for_task(task, adventure.name, node)
+        return task
+
+    def _wait_for_task(self, task, name, node):
+        """Wait for task to finish, streaming its log to task_log_dir
+        meanwhile if that is configured. A task still running after the
+        timeout for name is cancelled and the step fails, reporting what
+        it was doing."""
+        with self.timeline.phase('wait_for_complete'):
+            if not self.task_logs:
+                self._wait_with_timeout(task, name, node)
+                return
+            with self.task_logs.capture(task.id) as log:
+                self._wait_with_timeout(task, name, node)
+        if log.failed and log.kept:
+            print "log of failed task %s kept in %s" % (task.id, log.path)
+
+    def _wait_with_timeout(self, task, name, node):
+        timeout = self.timeouts.timeout(name)
+        group = self.session.task_group([{'id': task.id,
+                                          'node_id': node.id,
+                                          'state': task.state}])
+        try:
+            group.wait(timeout)
+        except TaskTimeout:
+            _, report = cancel_task(self.rest, task.id,
+                                    fetch_log=not self.task_logs)
+            self.fail('%s on %s did not finish within %ds\n%s' %
+                      (name, node.name, timeout, report))
+
+    def _wait_for_quiescence(self, node_id):
+        """wait_for_quiescence bounded by the reparent timeout; tasks
+        still running on the node after that are cancelled, and what
+        they were doing goes in the TaskTimeout."""
+        try:
+            self.task_tracker.wait_for_quiescence(
+                node_id, timeout=self.timeouts.timeout('reparent'))
+        except TaskTimeout as e:
+            reports = [cancel_task(self.rest, task.id,
+                                   fetch_log=not self.task_logs)[1]
+                       for task in self.task_tracker.node_tasks(node_id)
+                       if task.state not in TERMINAL_STATES]
+            raise TaskTimeout('\n'.join([str(e)] + reports))
+
+    def _reparent_step(self, child_node, containers, parent_key):
+        """Step action reparenting child_node under containers[parent_key],
+        which is only known once the cluster step has run."""
+        def reparent():
+            parent_node = containers[parent_key]
+            self._run_phase('reparent %s' % child_node.name,
+                            lambda: self._reparent(child_node, parent_node),
+                            lambda: self._is_child(child_node, parent_node))
+            child_node._request('get')
+            self.assertEquals(child_node.facts['parent_id'], parent_node.id)
+        return reparent
+
+    def _reparent_many_step(self, children, containers):
+        """Step action reparenting every (child, parent key) in children
+        under containers[parent key] with a single batch of fact writes."""
+        def reparent():
+            moves = [(child, containers[key]) for child, key in children]
+            todo = [(child, parent) for child, parent in moves
+                    if not self._phase_done(
+                        'reparent %s' % child.name,
+                        lambda child=child, parent=parent:
+                        self._is_child(child, parent))]
+            if todo:
+                self._reparent_many(todo)
+                if self.checkpoint:
+                    for child, parent in todo:
+                        self.checkpoint.mark('reparent %s' % child.name)
+            found = [self.nodes.find_exact(child.name) for child, _ in moves]
+            for child, (_, parent) in zip(found, moves):
+                self.assertEquals(child.facts['parent_id'], parent.id)
+        return reparent
+
+    def _glance_step(self, controller):
+        def upload():
+            self._run_phase('glance %s' % controller.name,
+                            lambda: self._run_adventure(
+                                self.upload_glance_images, controller,
+                                self.cluster_data))
+        return upload
 
     def _reparent(self, child_node, parent_node):
-        new_fact = self.ep.facts.create(node_id=child_node.id, key='parent_id', value=parent_node.id)
-        resp = new_fact.save()
-        self.assertEquals(resp.status_code, 202)
-        task = resp.task
-        task.wait_for_complete()
-        time.sleep(10)
-        #Wait for the chain of adventures that follow to finish 
-        tasks = self.ep.nodes[child_node.id].tasks
-        for task in tasks:
-            task.wait_for_complete()
-            if (tasks != self.ep.nodes[child_node.id].tasks):
-                tasks = self.ep.nodes[child_node.id].tasks
+        with self.timeline.phase('reparent %s' % child_node.name), \
+                self.timings.measure('reparent', child_node.name):
+            with self.timeline.phase('fact_save'):
+                new_fact = self.ep.facts.create(node_id=child_node.id,
+                                                key='parent_id',
+                                                value=parent_node.id)
+                resp = new_fact.save()
+            self.assertEquals(resp.status_code, 202)
+            task = resp.task
+            self._wait_for_task(task, 'reparent', child_node)
+            #Wait for the chain of adventures that follow to finish
+            with self.timeline.phase('wait_for_quiescence'):
+                self._wait_for_quiescence(child_node.id)
+        self.nodes.invalidate()
+
+    def _reparent_many(self, moves):
+        """Reparent every (child, parent) in moves with one batch of fact
+        writes, waiting on the resulting tasks as a group. Each node's
+        'reparent' timing runs from the write until the node is quiet,
+        the same span _reparent measures."""
+        parents = sorted(set(parent.name for _, parent in moves))
+        unattributed = self.timeline.api_calls.get('root', 0)
+        with self.timeline.phase('reparent %d nodes under %s' %
+                                 (len(moves), ', '.join(parents))):
+            started = time.time()
+            with self.timeline.phase('fact_write'):
+                group = self.fact_writer.write(
+                    [(child.id, 'parent_id', parent.id)
+                     for child, parent in moves])
+            self.assertEquals(len(group), len(moves))
+            # Give up only on the tasks that get stuck, the rest carry on
+            stuck = []
+            with self.timeline.phase('wait_for_complete'):
+                try:
+                    group.wait(self.timeouts.timeout('reparent'))
+                except TaskTimeout:
+                    for task_id in group.pending():
+                        stuck.append(cancel_task(
+                            self.rest, task_id,
+                            fetch_log=not self.task_logs))
+            names = dict((child.id, child.name) for child, _ in moves)
+            failed_nodes = set(task['node_id'] for task in group.failed())
+            stuck_nodes = set(task['node_id'] for task, _ in stuck if task)
+            for node_id in stuck_nodes:
+                self.timings.add('reparent', names[node_id],
+                                 time.time() - started, False)
+
+            def quiesce(node_id):
+                ok = False
+                try:
+                    self._wait_for_quiescence(node_id)
+                    ok = node_id not in failed_nodes
+                finally:
+                    self.timings.add('reparent', names[node_id],
+                                     time.time() - started, ok)
+
+            #Wait for the chain of adventures that follow to finish
+            with self.timeline.phase('wait_for_quiescence'):
+                run_parallel(self.timeline.wrap(quiesce),
+                             [node_id for node_id in group.node_ids
+                              if node_id not in stuck_nodes],
+                             self.reparent_workers)
+        self.nodes.invalidate()
+        # Every worker thread should be wrapped, leaving no call unphased
+        self.assertEquals(self.timeline.api_calls.get('root', 0),
+                          unattributed)
+        self.assertEquals([names[node_id] for node_id in stuck_nodes], [],
+                          '\n'.join(report for _, report in stuck))
+        self.assertEquals(group.failed(), [])
+
+    def _phase_done(self, name, satisfied=None):
+        """With checkpointing enabled, True if phase name is already done.
+        satisfied(), checking for the phase's effects on the server,
+        decides when given, so a rebuilt cluster isn't skipped on the
+        word of an old state file; otherwise the state file does."""
+        if not self.checkpoint:
+            return False
+        if satisfied is not None:
+            done = satisfied()
+        else:
+            done = self.checkpoint.done(name)
+        if done:
+            print "skipping completed phase", name
+        return done
+
+    def _run_phase(self, name, func, satisfied=None):
+        """Run func as the checkpointed phase name, unless _phase_done
+        finds it already done."""
+        if self._phase_done(name, satisfied):
+            return
+        func()
+        if self.checkpoint:
+            self.checkpoint.mark(name)
+
+    def _is_child(self, node, parent_node):
+        node._request('get')
+        return node.facts.get('parent_id') == parent_node.id
+
+    def _chef_server_ready(self, node):
+        node._request('get')
+        return ('chef-server' in node.facts.get('backends', []) and
+                all(node.facts.get(key) is not None
+                    for key in self.CHEF_SERVER_FACTS))
+
+    def _cluster_exists(self):
+        try:
+            self.find_node(self.cluster_data['cluster_name'])
+            for name in ("Infrastructure", "Compute",
+                         zone_container(DEFAULT_ZONE)):
+                self.nodes.find_exact(name)
+        except ValueError:
+            return False
+        return True
+
+    def _zone_exists(self, zone):
+        self.nodes.invalidate()
+        return zone_container(zone) in self.nodes.names()
+
+    def _ha_enabled(self, node):
+        node._request('get')
+        return bool(node.facts.get('ha_infra'))
+
+    def _verify_vips(self, infra_container):
+        infra_container._request('get')
+        self.assertTrue(infra_container.facts.get('ha_infra'))
+        for key, value in self.vip_data.items():
+            self.assertEquals(infra_container.facts.get(key), value)
 
     def _validate_chef_server(self, node):
         self.assertTrue('chef-server' in node.facts['backends'])
-        fact_keys = ['chef_server_client_name', 'chef_server_client_pem',
-                     'chef_server_pem', 'chef_server_uri']
-        for key in fact_keys:
+        for key in self.CHEF_SERVER_FACTS:
             self.assertIsNotNone(node.facts.get(key, None))
 
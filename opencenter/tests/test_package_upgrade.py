@@ -6,37 +6,69 @@ import requests
 import time
 import unittest2
 
-from opencenter.config import OpenCenterConfiguration
-from opencenterclient.client import OpenCenterEndpoint
+from opencenter.config import get_config
+from opencenter.fixtures import get_session
+from opencenter.history import RunTimings, save_run
+from opencenter.rollout import FleetRollout, format_report
+from opencenter.timeouts import TimeoutPolicy
 
 class AdventureTest(unittest2.TestCase):
     """
     Test the update agent adventure
     """
+    @classmethod
+    def setUpClass(cls):
+        cls.session = get_session()
+        cls.ep = cls.session.ep
+        cls.admin_ep = cls.session.admin_ep
+        cls.nodes = cls.session.nodes
+
     def setUp(self):
-        config = OpenCenterConfiguration()
-        opencenter_config = config.opencenter_config
-        cluster_data = config.cluster_data
+        config = get_config()
+        opencenter_config = config.opencenter
+        self.cluster_name = config.cluster_data.cluster_name
         
         self.endpoint_url = opencenter_config.endpoint_url
         self.user = opencenter_config.user
         self.password = opencenter_config.password
-
-        if self.user:
-            self.ep = OpenCenterEndpoint(self.endpoint_url, user=self.user, password=self.password)
-        else:
-            self.ep = OpenCenterEndpoint(self.endpoint_url)
-
-        self.ep = OpenCenterEndpoint(self.endpoint_url, user=self.user, password=self.password)
-        self.admin_ep = OpenCenterEndpoint(self.endpoint_url + '/admin', user=self.user, password=self.password)
-        self.workspace = self.ep.nodes.filter('name = "workspace"').first()
+        self.rollout_workers = opencenter_config.rollout_workers
+        self.rollout_batch_size = opencenter_config.rollout_batch_size
+        self.rollout_canary_size = opencenter_config.rollout_canary_size
+        self.poll_interval = opencenter_config.task_poll_interval
+        # Replayed runs take no real time, keep them out of the history
+        self.history_db = None
+        if not opencenter_config.replay_cassette:
+            self.history_db = opencenter_config.history_db
+        self.timeouts = TimeoutPolicy(
+            default=opencenter_config.task_timeout,
+            factor=opencenter_config.task_timeout_factor,
+            minimum=opencenter_config.task_timeout_min,
+            overrides=config.task_timeouts.overrides,
+            history_db=self.history_db,
+            cluster=self.cluster_name)
+        self.workspace = self.nodes.find("workspace")
         
 
     def test_update_adventure(self):
-        update_agent_adventure = self.ep.adventures.filter('name = "Update Agent"').first()
-        for node in self.ep.nodes:
-            if 'agent' in node.facts['backends']:
-                resp = self.ep.adventures[update_agent_adventure.id].execute(node=node.id)
-                self.assertEquals(resp.status_code, 202)
-                # task = resp.task
-                # task.wait_for_complete()
+        update_agent_adventure = self.session.adventure("Update Agent")
+        agents = [node for node in self.ep.nodes
+                  if 'agent' in node.facts['backends']]
+        rollout = FleetRollout(self.ep, update_agent_adventure,
+                               workers=self.rollout_workers,
+                               batch_size=self.rollout_batch_size,
+                               canary_size=self.rollout_canary_size,
+                               async_ep=self.session.async_endpoint,
+                               timeouts=self.timeouts,
+                               poll_interval=self.poll_interval)
+        timings = RunTimings()
+        results = rollout.run(agents)
+        print format_report(results)
+        failed = [result for result in results if not result.ok]
+        if self.history_db:
+            for result in results:
+                if result.status != 'skipped':
+                    timings.add(update_agent_adventure.name,
+                                result.node_name, result.duration, result.ok)
+            save_run(self.history_db, self.id(), self.cluster_name,
+                     self.endpoint_url, timings, not failed)
+        self.assertEquals(failed, [])
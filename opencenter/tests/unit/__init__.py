@@ -0,0 +1,4 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+"""Offline unit tests for the harness itself. Unlike the functional
+tests one level up they need no opencenter-server."""
@@ -0,0 +1,145 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import sys
+import threading
+
+import unittest2
+
+from opencenter.asyncclient import AsyncEndpoint, Future, gather
+from opencenter.tasks import TaskTimeout, TaskUpdateFeed
+
+
+class FutureTest(unittest2.TestCase):
+
+    def test_result(self):
+        future = Future()
+        future.set_result(3)
+        self.assertTrue(future.done())
+        self.assertEquals(future.result(), 3)
+
+    def test_exception(self):
+        future = Future()
+        try:
+            raise KeyError('task')
+        except KeyError:
+            future.set_exception(sys.exc_info())
+        self.assertRaises(KeyError, future.result)
+
+    def test_result_timeout(self):
+        self.assertRaises(RuntimeError, Future().result, 0.01)
+        self.assertRaises(RuntimeError, gather, [Future()], 0.01)
+
+    def test_finishes_once(self):
+        future = Future()
+        future.set_result(1)
+        future.set_exception((RuntimeError, RuntimeError('late'), None))
+        future.set_result(2)
+        self.assertEquals(future.result(), 1)
+
+    def test_failing_callback_is_contained(self):
+        called = []
+
+        def bad(future):
+            raise KeyError('task')
+
+        future = Future()
+        future.add_done_callback(bad)
+        future.add_done_callback(called.append)
+        future.set_result(1)
+        self.assertEquals(future.result(), 1)
+        self.assertEquals(called, [future])
+        # callbacks added afterwards run at once, just as safely
+        future.add_done_callback(bad)
+        future.add_done_callback(called.append)
+        self.assertEquals(called, [future, future])
+
+
+class FakeRest(object):
+    """Tasks advance a state per fetch; the listing leaves out the
+    tasks in unlisted. Has no task update feed."""
+
+    def __init__(self, script, unlisted=()):
+        self.script = script
+        self.unlisted = set(unlisted)
+        self.paths = []
+        self._lock = threading.Lock()
+
+    def _task(self, task_id):
+        states = self.script[task_id]
+        state = states.pop(0) if len(states) > 1 else states[0]
+        return {'id': task_id, 'state': state,
+                'result': {'result_code': 0}}
+
+    def request(self, method, path, data=None, params=None, timeout=None):
+        with self._lock:
+            self.paths.append(path)
+            parts = path.strip('/').split('/')
+            if parts == ['tasks']:
+                return 200, {'tasks': [self._task(task_id)
+                                       for task_id in self.script
+                                       if task_id not in self.unlisted]}
+            if parts[0] == 'tasks' and int(parts[1]) in self.script:
+                return 200, {'task': self._task(int(parts[1]))}
+            return 404, {'message': 'not found'}
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+
+class AsyncEndpointTest(unittest2.TestCase):
+
+    def endpoint(self, script, unlisted=(), **kwargs):
+        ep = AsyncEndpoint('http://127.0.0.1:1', workers=2,
+                           poll_interval=0.01, max_poll_interval=0.02,
+                           batch_threshold=2, **kwargs)
+        ep.rest = FakeRest(script, unlisted)
+        ep._feed = TaskUpdateFeed(None)
+        return ep
+
+    def test_submit(self):
+        ep = self.endpoint({})
+        self.assertEquals(ep.submit(lambda x: x * 2, 4).result(1), 8)
+        self.assertRaises(ZeroDivisionError,
+                          ep.submit(lambda: 1 / 0).result, 1)
+
+    def test_failing_callback_keeps_the_result(self):
+        ep = self.endpoint({1: ['done']})
+        future = ep.task(1)
+
+        def bad(future):
+            raise KeyError('task')
+
+        future.add_done_callback(bad)
+        self.assertEquals(future.result(1)['state'], 'done')
+        # the worker survived and serves the next call
+        self.assertEquals(ep.task(1).result(1)['id'], 1)
+
+    def test_waits_until_done(self):
+        ep = self.endpoint({1: ['pending', 'running', 'done']})
+        self.assertEquals(ep.wait_for_task(1).result(5)['state'], 'done')
+
+    def test_batched_waits(self):
+        script = dict((task_id, ['running', 'done'])
+                      for task_id in range(1, 6))
+        ep = self.endpoint(script, unlisted=[4])
+        tasks = gather(ep.wait_for_tasks(range(1, 6)), 5)
+        self.assertEquals([task['state'] for task in tasks], ['done'] * 5)
+        # only the task the listing left out is fetched on its own
+        self.assertTrue('tasks/' in ep.rest.paths)
+        self.assertTrue('tasks/4' in ep.rest.paths)
+        self.assertFalse('tasks/3' in ep.rest.paths)
+
+    def test_missing_task_fails_only_its_wait(self):
+        ep = self.endpoint({1: ['running', 'done'], 2: ['running', 'done'],
+                            3: ['running', 'done']})
+        futures = ep.wait_for_tasks([1, 2, 3, 99])
+        self.assertRaises(RuntimeError, futures[3].result, 5)
+        self.assertEquals([f.result(5)['state'] for f in futures[:3]],
+                          ['done'] * 3)
+
+    def test_wait_timeout(self):
+        ep = self.endpoint({1: ['running'], 2: ['running', 'done']})
+        stuck = ep.wait_for_task(1, timeout=0.05)
+        finished = ep.wait_for_task(2)
+        self.assertRaises(TaskTimeout, stuck.result, 5)
+        self.assertEquals(finished.result(5)['state'], 'done')
@@ -0,0 +1,80 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from opencenter.cassette import MISS_STATUS, Cassette, CassetteServer, \
+    ReplayServer, request_key
+
+
+def record(cassette, method, path, body, response, status=200):
+    cassette.record(method, path, body, status, 'application/json',
+                    json.dumps(response), 0.01)
+
+
+class CassetteTest(unittest2.TestCase):
+
+    def setUp(self):
+        self.cassette = Cassette('http://server:8080')
+        for state in ('pending', 'running', 'done'):
+            record(self.cassette, 'GET', '/tasks/1', '', {'state': state})
+        record(self.cassette, 'POST', '/facts/', '{"node_id": 2}',
+               {'fact': 2})
+        record(self.cassette, 'POST', '/facts/', '{"node_id": 3}',
+               {'fact': 3})
+
+    def replay(self, method, path, body=''):
+        status, _, data = self.server.handle(method, path, {}, body)
+        return status, json.loads(data)
+
+    def test_nth_request_gets_nth_response(self):
+        self.server = ReplayServer(self.cassette)
+        states = [self.replay('GET', '/tasks/1')[1]['state']
+                  for _ in range(5)]
+        self.assertEquals(states, ['pending', 'running', 'done', 'done',
+                                   'done'])
+
+    def test_matches_on_body(self):
+        self.server = ReplayServer(self.cassette)
+        self.assertEquals(self.replay('POST', '/facts/',
+                                      '{"node_id":3}')[1], {'fact': 3})
+        self.assertEquals(self.replay('POST', '/facts/',
+                                      '{"node_id": 2}')[1], {'fact': 2})
+
+    def test_unknown_body_is_a_miss(self):
+        self.server = ReplayServer(self.cassette)
+        self.assertEquals(self.replay('POST', '/facts/',
+                                      '{"node_id": 9}')[0], MISS_STATUS)
+        self.assertEquals(self.server.misses,
+                          [request_key('POST', '/facts/', '{"node_id": 9}')])
+
+    def test_miss(self):
+        self.server = ReplayServer(self.cassette)
+        self.assertEquals(self.replay('GET', '/nodes/')[0], MISS_STATUS)
+        self.assertEquals(self.replay('PUT', '/tasks/1')[0], MISS_STATUS)
+        self.assertEquals(len(self.server.misses), 2)
+
+    def test_base_is_abstract(self):
+        self.assertRaises(TypeError, CassetteServer)
+
+    def test_key_ignores_json_formatting(self):
+        self.assertEquals(request_key('POST', '/x', '{"a": 1, "b": 2}'),
+                          request_key('POST', '/x', '{"b":2,"a":1}'))
+
+    def test_save_and_load(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'run.cassette')
+            self.cassette.save(path)
+            loaded = Cassette.load(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEquals(loaded.target, 'http://server:8080')
+        self.assertEquals(loaded.index(), self.cassette.index())
+        self.server = ReplayServer(loaded)
+        self.assertEquals(self.replay('GET', '/tasks/1')[1]['state'],
+                          'pending')
@@ -0,0 +1,56 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from opencenter.checkpoint import Checkpoint
+
+
+class CheckpointTest(unittest2.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'progress.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def checkpoint(self, url='http://ocs:8080', cluster='test_cluster'):
+        return Checkpoint(self.path, url, cluster)
+
+    def test_progress_survives_a_restart(self):
+        checkpoint = self.checkpoint()
+        self.assertFalse(checkpoint.done('Install Chef Server'))
+        checkpoint.mark('Install Chef Server')
+        checkpoint.mark('Install Chef Server')
+        self.assertTrue(self.checkpoint().done('Install Chef Server'))
+        with open(self.path) as state_file:
+            self.assertEquals(json.load(state_file)['completed'],
+                              ['Install Chef Server'])
+
+    def test_other_runs_are_ignored(self):
+        self.checkpoint().mark('Install Chef Server')
+        self.assertFalse(self.checkpoint(cluster='other').done(
+            'Install Chef Server'))
+        self.assertFalse(self.checkpoint(url='http://other:8080').done(
+            'Install Chef Server'))
+
+    def test_corrupt_file_is_ignored(self):
+        with open(self.path, 'w') as state_file:
+            state_file.write('{not json')
+        checkpoint = self.checkpoint()
+        self.assertEquals(checkpoint.completed, [])
+        checkpoint.mark('a')
+        self.assertTrue(self.checkpoint().done('a'))
+
+    def test_clear(self):
+        checkpoint = self.checkpoint()
+        checkpoint.mark('a')
+        checkpoint.clear()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(self.checkpoint().done('a'))
+        checkpoint.clear()
@@ -0,0 +1,65 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import ConfigParser
+import os
+import pickle
+
+import unittest2
+
+from opencenter.config import (OpenCenterConfig, Snapshot, build_snapshot,
+                               load_snapshot, validate_cidr)
+
+
+class SnapshotTest(unittest2.TestCase):
+
+    def test_read_only(self):
+        snapshot = Snapshot('opencenter', {'user': 'admin'})
+        self.assertEquals(snapshot.user, 'admin')
+        self.assertRaises(AttributeError, setattr, snapshot, 'user', 'x')
+        self.assertRaises(AttributeError, getattr, snapshot, 'missing')
+
+    def test_pickles(self):
+        snapshot = Snapshot(None, {'opencenter': Snapshot('opencenter',
+                                                          {'user': 'a'})})
+        copy = pickle.loads(pickle.dumps(snapshot))
+        self.assertEquals(copy.opencenter.user, 'a')
+
+
+class ConfigTest(unittest2.TestCase):
+
+    def conf(self, **items):
+        conf = ConfigParser.SafeConfigParser()
+        conf.add_section('opencenter')
+        for key, value in items.items():
+            conf.set('opencenter', key, value)
+        return conf
+
+    def test_list_fields_become_tuples(self):
+        snapshot = OpenCenterConfig(self.conf(
+            instance_compute_hostname='a, b,,c ')).snapshot()
+        self.assertEquals(snapshot.instance_compute_hostname,
+                          ('a', 'b', 'c'))
+
+    def test_environment_overrides_file(self):
+        name = 'OPENCENTER_OPENCENTER_REPARENT_WORKERS'
+        os.environ[name] = '7'
+        try:
+            config = OpenCenterConfig(self.conf(reparent_workers='3'))
+            self.assertEquals(config.reparent_workers, 7)
+        finally:
+            del os.environ[name]
+
+    def test_build_snapshot_sections(self):
+        snapshot = build_snapshot(self.conf(), 'x.conf')
+        self.assertEquals(snapshot.path, 'x.conf')
+        self.assertEquals(snapshot.topology.availability_zones, ('nova', ))
+        self.assertEquals(snapshot.task_timeouts.overrides, {})
+
+    def test_validate_cidr(self):
+        self.assertEquals(validate_cidr('10.0.0.0/8'), '10.0.0.0/8')
+        for bad in ('10.0.0.0', '10.0.0/8', '10.0.0.0/33', 'x/8'):
+            self.assertRaises(ValueError, validate_cidr, bad)
+
+    def test_missing_file(self):
+        self.assertRaises(RuntimeError, load_snapshot,
+                          '/nonexistent/opencenter.conf')
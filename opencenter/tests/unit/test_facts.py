@@ -0,0 +1,62 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import unittest2
+
+from opencenter.facts import FactWriter
+from opencenter.parallel import ParallelError
+from opencenter.timeline import Timeline
+
+
+class FakeRest(object):
+    """Answers facts/ posts with responses[key], counting each post on
+    the timeline, and has no facts/bulk endpoint."""
+
+    def __init__(self, responses, timeline=None):
+        self.responses = responses
+        self.timeline = timeline
+        self.posts = []
+
+    def post(self, path, body):
+        if self.timeline:
+            self.timeline.count_call()
+        self.posts.append(path)
+        if path == FactWriter.BULK_PATH:
+            return 404, None
+        return self.responses[body['key']]
+
+
+def started(task_id, node_id):
+    return 202, {'task': {'id': task_id, 'node_id': node_id,
+                          'state': 'pending'}}
+
+
+class FactWriterTest(unittest2.TestCase):
+
+    def test_falls_back_to_single_writes(self):
+        rest = FakeRest({'parent_id': started(5, 1),
+                         'backup': (201, {'fact': {}})})
+        writer = FactWriter(rest, workers=2)
+        group = writer.write([(1, 'parent_id', 3), (1, 'backup', True)])
+        self.assertFalse(writer.bulk_supported)
+        self.assertEquals(group.tasks.keys(), [5])
+        writer.write([(1, 'backup', False)])
+        self.assertEquals(rest.posts.count(FactWriter.BULK_PATH), 1)
+
+    def test_accepted_without_a_task(self):
+        rest = FakeRest({'parent_id': (202, {'message': 'solving'})})
+        writer = FactWriter(rest)
+        try:
+            writer.write([(7, 'parent_id', 3)])
+        except ParallelError as e:
+            self.assertTrue('parent_id=3 on node 7' in str(e))
+        else:
+            self.fail('ParallelError not raised')
+
+    def test_wrap_attributes_worker_calls(self):
+        timeline = Timeline()
+        rest = FakeRest({'parent_id': started(5, 1)}, timeline)
+        writer = FactWriter(rest, workers=4, wrap=timeline.wrap)
+        with timeline.phase('fact_write'):
+            writer.write([(node_id, 'parent_id', 3)
+                          for node_id in range(8)])
+        self.assertEquals(timeline.api_calls, {'fact_write': 9})
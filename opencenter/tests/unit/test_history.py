@@ -0,0 +1,45 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import unittest2
+
+from opencenter.history import History, RunTimings, find_regressions
+
+
+class HistoryTest(unittest2.TestCase):
+
+    def setUp(self):
+        self.history = History(':memory:')
+
+    def tearDown(self):
+        self.history.close()
+
+    def save(self, durations, successful=True):
+        timings = RunTimings()
+        for node, duration in durations.items():
+            timings.add('reparent', node, duration)
+        return self.history.save_run('happy', 'lab', 'url', timings,
+                                     successful)
+
+    def test_runs_newest_first(self):
+        first = self.save({'a': 1.0})
+        second = self.save({'a': 1.0}, successful=False)
+        self.assertEquals([run['id'] for run in self.history.runs()],
+                          [second, first])
+        self.assertEquals([run['id'] for run in
+                           self.history.runs(successful=True)], [first])
+
+    def test_flags_slower_latest_run(self):
+        for noise in (0, 0.5, 0.2, 0.4, 0.1, 0.3):
+            self.save({'a': 10 + noise, 'b': 10 + noise})
+        self.save({'a': 30, 'b': 30})
+        regressions = find_regressions(self.history, 'happy', 'lab')
+        self.assertEquals([r['key'] for r in regressions], ['reparent'])
+        self.assertEquals(regressions[0]['p50'], 30)
+
+    def test_ignores_noise_and_short_history(self):
+        for noise in (0, 0.5, 0.2, 0.4, 0.1, 0.3):
+            self.save({'a': 10 + noise})
+        self.save({'a': 10.6})
+        self.assertEquals(find_regressions(self.history, 'happy', 'lab'), [])
+        self.assertEquals(find_regressions(self.history, 'happy', 'lab',
+                                           min_runs=10), [])
@@ -0,0 +1,140 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import unittest2
+
+from opencenter.mockserver import MockOpenCenterServer, parse_filter, \
+    parse_filters
+from opencenter.tasks import UNSUPPORTED_STATUS
+
+
+class ParseFilterTest(unittest2.TestCase):
+
+    def test_terms(self):
+        self.assertEquals(parse_filter('name = "workspace"'),
+                          [('name', 'workspace')])
+        self.assertEquals(parse_filter("node_id = 3 and key = 'parent_id'"),
+                          [('node_id', 3), ('key', 'parent_id')])
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, parse_filter, 'name like "x%"')
+
+    def test_alternatives(self):
+        self.assertEquals(parse_filters('id = 1 or id = 2 and key = "x"'),
+                          [[('id', 1)], [('id', 2), ('key', 'x')]])
+
+
+class MockServerTest(unittest2.TestCase):
+    """Drives the request handling directly, without an HTTP server."""
+
+    def setUp(self):
+        self.server = MockOpenCenterServer(node_count=3, task_duration=0,
+                                           followup_tasks=1)
+
+    def call(self, method, path, body=None, query=None):
+        parts = [part for part in path.split('/') if part]
+        return self.server.handle(method, parts, query or {}, body or {})[1:]
+
+    def node_id(self, name):
+        status, body = self.call('POST', 'nodes/filter',
+                                 {'filter': 'name = "%s"' % name})
+        return body['nodes'][0]['id']
+
+    def test_initial_tree(self):
+        status, body = self.call('GET', 'nodes/')
+        self.assertEquals(status, 200)
+        names = [node['name'] for node in body['nodes']]
+        self.assertEquals(len(names), 7)
+        self.assertTrue('opencenter-agent3' in names)
+        agent = self.call('GET', 'nodes/%d' % self.node_id(
+            'opencenter-agent1'))[1]['node']
+        self.assertEquals(agent['facts']['parent_id'],
+                          self.node_id('unprovisioned'))
+
+    def test_plain_fact_is_set_at_once(self):
+        node_id = self.node_id('opencenter-agent1')
+        status, body = self.call('POST', 'facts/', {'node_id': node_id,
+                                                    'key': 'x',
+                                                    'value': 1})
+        self.assertEquals(status, 201)
+        self.call('POST', 'facts/', {'node_id': node_id, 'key': 'x',
+                                     'value': 2})
+        facts = [fact for fact in self.call('GET', 'facts/')[1]['facts']
+                 if fact['node_id'] == node_id and fact['key'] == 'x']
+        self.assertEquals([fact['value'] for fact in facts], [2])
+
+    def test_reparent_runs_a_task_chain(self):
+        node_id = self.node_id('opencenter-agent2')
+        workspace = self.node_id('workspace')
+        status, body = self.call('POST', 'facts/', {'node_id': node_id,
+                                                    'key': 'parent_id',
+                                                    'value': workspace})
+        self.assertEquals(status, 202)
+        task_id = body['task']['id']
+        task = self.call('GET', 'tasks/%d' % task_id)[1]['task']
+        self.assertEquals(task['state'], 'done')
+        tasks = self.call('GET', 'nodes/%d/tasks' % node_id)[1]['tasks']
+        self.assertEquals(len(tasks), 2)
+        self.assertEquals(tasks[1]['parent_id'], task_id)
+        node = self.call('GET', 'nodes/%d' % node_id)[1]['node']
+        self.assertEquals(node['facts']['parent_id'], workspace)
+
+    def test_bulk_facts(self):
+        agents = [self.node_id('opencenter-agent%d' % index)
+                  for index in (1, 2)]
+        status, body = self.call('POST', 'facts/bulk', {'facts': [
+            {'node_id': agents[0], 'key': 'parent_id', 'value': 1},
+            {'node_id': agents[1], 'key': 'color', 'value': 'red'}]})
+        self.assertEquals(status, 202)
+        self.assertEquals([task['node_id'] for task in body['tasks']],
+                          agents[:1])
+        self.assertEquals(len(body['facts']), 1)
+
+    def test_without_bulk_facts(self):
+        self.server.bulk_facts = False
+        status, body = self.call('POST', 'facts/bulk', {'facts': []})
+        self.assertTrue(status in UNSUPPORTED_STATUS)
+
+    def test_task_updates_report_the_transaction(self):
+        status, body = self.call('GET', 'tasks/updates/0')
+        txid = body['transaction']['txid']
+        self.call('POST', 'facts/', {'node_id': 1, 'key': 'parent_id',
+                                     'value': 2})
+        status, body = self.call('GET', 'tasks/updates/%d' % txid,
+                                 query={'poll': ['1']})
+        self.assertTrue(body['transaction']['txid'] > txid)
+
+    def test_task_log_offset(self):
+        body = self.call('POST', 'facts/', {'node_id': 5, 'key': 'parent_id',
+                                            'value': 1})[1]
+        path = 'tasks/%d/logs' % body['task']['id']
+        self.call('GET', 'tasks/')
+        log = self.call('GET', path)[1]['log']
+        self.assertTrue(log.endswith('success\n'))
+        tail = self.call('GET', path, query={'offset': ['10']})[1]['log']
+        self.assertEquals(tail, log[10:])
+
+    def test_unknown_objects(self):
+        self.assertEquals(self.call('GET', 'widgets/')[0], 404)
+        self.assertEquals(self.call('GET', 'nodes/999')[0], 404)
+
+    def test_filter_alternatives(self):
+        def found(expr):
+            body = self.call('POST', 'nodes/filter', {'filter': expr})[1]
+            return [node['id'] for node in body['nodes']]
+        self.assertEquals(found('id = 3 or id = 1 or id = 999'), [1, 3])
+        self.assertEquals(found('id = 1 and name = "support"'), [])
+        self.assertEquals(found('name = "support" or id = 1'), [1, 3])
+
+    def test_cancelled_task_never_completes(self):
+        self.server = MockOpenCenterServer(node_count=1, task_duration=60)
+        node_id = self.node_id('opencenter-agent1')
+        task_id = self.call('POST', 'facts/', {'node_id': node_id,
+                                               'key': 'parent_id',
+                                               'value': 1})[1]['task']['id']
+        self.call('PUT', 'tasks/%d' % task_id, {'state': 'cancelled'})
+        # due now, as though the minute had passed
+        self.server.state.running[0] = (0, task_id)
+        task = self.call('GET', 'tasks/%d' % task_id)[1]['task']
+        self.assertEquals(task['state'], 'cancelled')
+        node = self.call('GET', 'nodes/%d' % node_id)[1]['node']
+        self.assertNotEquals(node['facts']['parent_id'], 1)
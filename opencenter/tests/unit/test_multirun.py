@@ -0,0 +1,137 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from opencenter import multirun
+from opencenter.config import Snapshot
+
+
+def pid_report(args):
+    name = args[0]
+    return {'target': name, 'pid': os.getpid(), 'tests_run': 1,
+            'failures': [], 'errors': [], 'skipped': [],
+            'successful': True}
+
+
+class RunJobsTest(unittest2.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.run_target = multirun.run_target
+        multirun.run_target = pid_report
+
+    def tearDown(self):
+        multirun.run_target = self.run_target
+        shutil.rmtree(self.tmp_dir)
+
+    def config(self, name):
+        path = os.path.join(self.tmp_dir, '%s.conf' % name)
+        with open(path, 'w') as conf:
+            conf.write('[opencenter]\ncheckpoint_file = ck.json\n')
+        return path
+
+    def test_every_target_gets_its_own_process(self):
+        # more jobs than workers, so map would otherwise hand a worker
+        # several targets in one chunk
+        jobs = [('lab%d' % index, self.config('lab%d' % index), ['x'])
+                for index in range(6)]
+        merged = multirun._run_jobs(jobs, processes=1)
+        self.assertEquals([r['target'] for r in merged['targets']],
+                          ['lab%d' % index for index in range(6)])
+        pids = set(r['pid'] for r in merged['targets'])
+        self.assertEquals(len(pids), 6)
+        self.assertEquals(merged['tests_run'], 6)
+
+
+class TargetSnapshotTest(unittest2.TestCase):
+
+    def snapshot(self, checkpoint_file):
+        return Snapshot(None, {
+            'opencenter': Snapshot('opencenter', {
+                'checkpoint_file': checkpoint_file}),
+            'path': 'x.conf'})
+
+    def test_checkpoint_file_per_target(self):
+        snapshot = multirun.target_snapshot('lab a/1',
+                                            self.snapshot('/tmp/ck.json'))
+        self.assertEquals(snapshot.opencenter.checkpoint_file,
+                          '/tmp/ck-lab_a_1.json')
+        self.assertEquals(snapshot.path, 'x.conf')
+
+    def test_without_checkpoint(self):
+        original = self.snapshot(None)
+        self.assertTrue(multirun.target_snapshot('lab', original)
+                        is original)
+
+
+class MergeTest(unittest2.TestCase):
+
+    def test_merge_and_summary(self):
+        reports = [pid_report(('lab1', )),
+                   dict(pid_report(('lab2', )), successful=False,
+                        failures=[('test_x', 'Traceback')], wall_time=1.0)]
+        reports[0]['wall_time'] = 2.0
+        merged = multirun.merge_reports(reports)
+        self.assertEquals(merged['failures'], 1)
+        self.assertFalse(merged['successful'])
+        summary = multirun.format_summary(merged)
+        self.assertTrue('lab2' in summary and 'FAIL' in summary)
+
+
+class ShardTest(unittest2.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.run_jobs = multirun._run_jobs
+        multirun._run_jobs = lambda jobs, processes=None: jobs
+
+    def tearDown(self):
+        multirun._run_jobs = self.run_jobs
+        shutil.rmtree(self.tmp_dir)
+
+    def test_classes_round_robin(self):
+        names = ['opencenter.tests.unit.test_multirun']
+        classes = multirun.test_classes(names)
+        self.assertEquals(len(classes), 5)
+        self.assertTrue('opencenter.tests.unit.test_multirun.ShardTest'
+                        in classes)
+        shards = multirun.shard_tests([('a', 'a.conf'), ('b', 'b.conf')],
+                                      names)
+        self.assertEquals(shards, [('a', 'a.conf', classes[0::2]),
+                                   ('b', 'b.conf', classes[1::2])])
+
+    def test_targets_without_tests_are_left_out(self):
+        names = ['opencenter.tests.unit.test_multirun.MergeTest']
+        shards = multirun.shard_tests([('a', 'a.conf'), ('b', 'b.conf')],
+                                      names)
+        self.assertEquals([shard[0] for shard in shards], ['a'])
+
+    def test_no_jobs(self):
+        merged = self.run_jobs([])
+        self.assertEquals(merged['targets'], [])
+        self.assertTrue(merged['successful'])
+
+
+class DottedNameTest(unittest2.TestCase):
+
+    def test_nose_paths(self):
+        self.assertEquals(
+            multirun.dotted_name('opencenter/tests/test_happy_path.py'),
+            'opencenter.tests.test_happy_path')
+        self.assertEquals(
+            multirun.dotted_name('./opencenter/tests/test_happy_path.py:'
+                                 'OpenCenterTestCase.test_x'),
+            'opencenter.tests.test_happy_path.OpenCenterTestCase.test_x')
+
+    def test_dotted_names_unchanged(self):
+        self.assertEquals(multirun.dotted_name('opencenter.tests'),
+                          'opencenter.tests')
+
+    def test_bad_names(self):
+        for name in ('opencenter/tests', '../elsewhere/test_x.py',
+                     'module:Class'):
+            self.assertRaises(ValueError, multirun.dotted_name, name)
@@ -0,0 +1,93 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import unittest2
+
+from opencenter.nodes import NodeRegistry
+
+
+class FakeNode(object):
+
+    def __init__(self, name, backends=('node', )):
+        self.name = name
+        self.facts = {'backends': list(backends)}
+
+
+class FakeEndpoint(object):
+    """Just enough of OpenCenterEndpoint for a NodeRegistry."""
+
+    def __init__(self, names):
+        self.nodes = [FakeNode(name) for name in names]
+        self.refreshes = 0
+
+    def _refresh(self, what, reason):
+        self.refreshes += 1
+
+
+class NodeRegistryTest(unittest2.TestCase):
+
+    def setUp(self):
+        # server order, deliberately not sorted
+        self.ep = FakeEndpoint(['opencenter-agent10', 'workspace',
+                                'opencenter-agent1', 'AZ nova2',
+                                'AZ nova'])
+        self.nodes = NodeRegistry(self.ep, ttl=60)
+
+    def test_exact_name(self):
+        self.assertEquals(self.nodes.find('workspace').name, 'workspace')
+
+    def test_partial_name(self):
+        self.assertEquals(self.nodes.find('works').name, 'workspace')
+
+    def test_ambiguous_name_is_first_match_in_server_order(self):
+        # like find_node: opencenter-agent10 comes first from the server
+        self.assertEquals(self.nodes.find('opencenter-agent1').name,
+                          'opencenter-agent10')
+        self.assertEquals(self.nodes.find('AZ nova').name, 'AZ nova2')
+
+    def test_anchored_pattern(self):
+        self.assertEquals(self.nodes.find('^AZ nova$').name, 'AZ nova')
+        self.assertEquals(self.nodes.find('agent1$').name,
+                          'opencenter-agent1')
+
+    def test_missing_name_refreshes_then_raises(self):
+        self.nodes.find('workspace')
+        refreshes = self.ep.refreshes
+        self.assertRaises(ValueError, self.nodes.find, 'nothing-like-it')
+        self.assertEquals(self.ep.refreshes, refreshes + 1)
+
+    def test_miss_finds_new_node_after_refresh(self):
+        self.nodes.find('workspace')
+        self.ep.nodes.append(FakeNode('test_cluster'))
+        self.assertEquals(self.nodes.find('test_cluster').name,
+                          'test_cluster')
+
+    def test_listing_is_cached(self):
+        self.nodes.find_many(['workspace', 'AZ nova', 'agent10'])
+        self.nodes.find('workspace')
+        self.assertEquals(self.ep.refreshes, 1)
+        self.nodes.invalidate()
+        self.nodes.find('workspace')
+        self.assertEquals(self.ep.refreshes, 2)
+
+    def test_names_by_backend(self):
+        self.ep.nodes[0].facts['backends'].append('agent')
+        self.assertEquals(self.nodes.names('agent'), ['opencenter-agent10'])
+        self.assertEquals(len(self.nodes.names()), 5)
+
+    def test_exact(self):
+        self.assertEquals(self.nodes.find_exact('AZ nova').name, 'AZ nova')
+        self.assertEquals(self.nodes.find_exact('opencenter-agent1').name,
+                          'opencenter-agent1')
+        self.assertRaises(ValueError, self.nodes.find_exact, 'AZ')
+
+    def test_prefix_is_first_in_name_order(self):
+        self.assertEquals(self.nodes.find_prefix('opencenter-agent').name,
+                          'opencenter-agent1')
+        self.assertEquals(self.nodes.find_prefix('AZ nova').name, 'AZ nova')
+        self.assertRaises(ValueError, self.nodes.find_prefix, 'agent')
+
+    def test_exact_miss_finds_new_node_after_refresh(self):
+        self.nodes.find_exact('workspace')
+        self.ep.nodes.append(FakeNode('AZ nova3'))
+        self.assertEquals(self.nodes.find_exact('AZ nova3').name, 'AZ nova3')
+        self.assertEquals(self.ep.refreshes, 2)
@@ -0,0 +1,58 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import threading
+import time
+
+import unittest2
+
+from opencenter.parallel import ParallelError, run_parallel
+
+
+class RunParallelTest(unittest2.TestCase):
+
+    def test_results_in_item_order(self):
+        def slow_square(item):
+            time.sleep(0.01 * (5 - item))
+            return item * item
+        self.assertEquals(run_parallel(slow_square, range(5), 5),
+                          [0, 1, 4, 9, 16])
+
+    def test_worker_limit(self):
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def work(item):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        run_parallel(work, range(12), 3)
+        self.assertTrue(1 < peak[0] <= 3)
+
+    def test_single_worker_runs_inline(self):
+        threads = run_parallel(lambda item: threading.current_thread(),
+                               range(3), 1)
+        self.assertEquals(threads, [threading.current_thread()] * 3)
+
+    def test_empty(self):
+        self.assertEquals(run_parallel(lambda item: item, [], 4), [])
+
+    def test_failures_reported_together(self):
+        ran = []
+
+        def work(item):
+            ran.append(item)
+            if item % 2:
+                raise RuntimeError('item %d failed' % item)
+
+        try:
+            run_parallel(work, range(6), 3)
+        except ParallelError as e:
+            self.assertEquals([item for item, _ in e.failures], [1, 3, 5])
+            self.assertTrue('item 3 failed' in str(e))
+        else:
+            self.fail('ParallelError not raised')
+        self.assertEquals(sorted(ran), range(6))
@@ -0,0 +1,122 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import unittest2
+
+from opencenter.asyncclient import Future
+from opencenter.rollout import FleetRollout
+from opencenter.tasks import TaskTimeout
+from opencenter.timeouts import TimeoutPolicy
+
+
+class Obj(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def done(value=None, exc=None):
+    future = Future()
+    if exc is not None:
+        future.set_exception((type(exc), exc, None))
+    else:
+        future.set_result(value)
+    return future
+
+
+class FakeAsyncEndpoint(object):
+    """Answers executes from responses, keyed by node id, and finishes
+    every task wait at once."""
+
+    def __init__(self, responses, task_state='done'):
+        self.responses = responses
+        self.task_state = task_state
+        self.timeouts = []
+
+    def execute(self, adventure_id, node_id):
+        return done(self.responses[node_id])
+
+    def wait_for_task(self, task_id, timeout=None):
+        self.timeouts.append(timeout)
+        if self.task_state == 'timeout':
+            return done(exc=TaskTimeout('task %s timed out' % task_id))
+        return done({'id': task_id, 'state': self.task_state,
+                     'result': {'result_code': 0}})
+
+
+def nodes(count):
+    return [Obj(id=index, name='agent%d' % index)
+            for index in range(1, count + 1)]
+
+
+class AsyncRolloutTest(unittest2.TestCase):
+
+    def rollout(self, async_ep, **kwargs):
+        return FleetRollout(None, Obj(id=1, name='Update Agent'),
+                            workers=1, async_ep=async_ep,
+                            timeouts=TimeoutPolicy(default=42), **kwargs)
+
+    def test_all_done(self):
+        async_ep = FakeAsyncEndpoint(dict(
+            (node.id, (202, {'task': {'id': node.id * 10}}))
+            for node in nodes(3)))
+        results = self.rollout(async_ep).run(nodes(3))
+        self.assertEquals([r.status for r in results], ['done'] * 3)
+        self.assertEquals(async_ep.timeouts, [42] * 3)
+
+    def test_bad_response_releases_the_slot(self):
+        # with one worker a leaked slot would hang the second node
+        async_ep = FakeAsyncEndpoint({1: (202, {}),
+                                      2: (202, {'task': {'id': 20}}),
+                                      3: (409, {})})
+        results = self.rollout(async_ep).run(nodes(3))
+        self.assertEquals([r.status for r in results],
+                          ['error', 'done', 'error'])
+        self.assertTrue('KeyError' in results[0].message)
+        self.assertTrue('409' in results[2].message)
+
+    def test_task_timeout(self):
+        async_ep = FakeAsyncEndpoint({1: (202, {'task': {'id': 10}})},
+                                     task_state='timeout')
+        results = self.rollout(async_ep).run(nodes(1))
+        self.assertEquals(results[0].status, 'timeout')
+
+    def test_failed_canary_skips_the_rest(self):
+        async_ep = FakeAsyncEndpoint(dict(
+            (node.id, (202, {'task': {'id': node.id}}))
+            for node in nodes(4)), task_state='cancelled')
+        results = self.rollout(async_ep, canary_size=1).run(nodes(4))
+        self.assertEquals([r.status for r in results],
+                          ['failed', 'skipped', 'skipped', 'skipped'])
+
+
+class FakeTask(object):
+
+    def __init__(self, states):
+        self.id = 5
+        self.states = states
+        self.state = 'pending'
+        self.result = {'result_code': 0}
+
+    def _request(self, method):
+        if self.states:
+            self.state = self.states.pop(0)
+
+
+class SyncRolloutTest(unittest2.TestCase):
+
+    def rollout(self, task, timeout):
+        response = Obj(status_code=202, task=task)
+        ep = Obj(adventures={1: Obj(execute=lambda node: response)})
+        return FleetRollout(ep, Obj(id=1, name='Update Agent'),
+                            timeouts=TimeoutPolicy(default=timeout),
+                            poll_interval=0.01)
+
+    def test_waits_for_the_task(self):
+        rollout = self.rollout(FakeTask(['running', 'running', 'done']), 5)
+        self.assertEquals(rollout.run(nodes(1))[0].status, 'done')
+
+    def test_gives_up_after_the_timeout(self):
+        rollout = self.rollout(FakeTask(['running']), 0.05)
+        result = rollout.run(nodes(1))[0]
+        self.assertEquals(result.status, 'timeout')
+        self.assertTrue(result.duration >= 0.05)
@@ -0,0 +1,96 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import unittest2
+
+from opencenter.scheduler import Scheduler, SchedulerError
+
+
+class SchedulerTest(unittest2.TestCase):
+
+    def test_runs_steps_after_their_requirements(self):
+        order = []
+        scheduler = Scheduler(4)
+        scheduler.add_step('c', lambda: order.append('c'), ['a', 'b'])
+        scheduler.add_step('a', lambda: order.append('a'))
+        scheduler.add_step('b', lambda: order.append('b'), ['a'])
+        scheduler.run()
+        self.assertEquals(order, ['a', 'b', 'c'])
+
+    def test_unknown_requirement(self):
+        scheduler = Scheduler()
+        scheduler.add_step('a', lambda: None, ['missing'])
+        self.assertRaises(ValueError, scheduler.run)
+
+    def test_cycle(self):
+        scheduler = Scheduler()
+        scheduler.add_step('a', lambda: None, ['b'])
+        scheduler.add_step('b', lambda: None, ['a'])
+        self.assertRaises(ValueError, scheduler.run)
+
+    def test_duplicate_step(self):
+        scheduler = Scheduler()
+        scheduler.add_step('a', lambda: None)
+        self.assertRaises(ValueError, scheduler.add_step, 'a', lambda: None)
+
+    def test_failure_skips_dependents_only(self):
+        ran = []
+
+        def fail():
+            raise RuntimeError('boom')
+
+        scheduler = Scheduler(2)
+        scheduler.add_step('bad', fail)
+        scheduler.add_step('after bad', lambda: ran.append('after bad'),
+                           ['bad'])
+        scheduler.add_step('after that', lambda: ran.append('after that'),
+                           ['after bad'])
+        scheduler.add_step('independent', lambda: ran.append('independent'))
+        try:
+            scheduler.run()
+        except SchedulerError as e:
+            self.assertEquals([s.name for s in e.failed], ['bad'])
+            self.assertEquals(sorted(s.name for s in e.skipped),
+                              ['after bad', 'after that'])
+            self.assertTrue('boom' in str(e))
+        else:
+            self.fail('SchedulerError not raised')
+        self.assertEquals(ran, ['independent'])
+
+    def test_pool_limit(self):
+        running, peak = [0], [0]
+
+        def step():
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            running[0] -= 1
+
+        scheduler = Scheduler(8, limits={'reparent': 1})
+        for index in range(6):
+            scheduler.add_step('step %d' % index, step, pool='reparent')
+        scheduler.run()
+        self.assertEquals(peak[0], 1)
+
+    def test_empty_pool_rejected(self):
+        self.assertRaises(ValueError, Scheduler, 2, {'reparent': 0})
+
+    def test_wrap_applied_on_calling_thread(self):
+        import threading
+        wrapped_on = []
+
+        def wrap(func):
+            wrapped_on.append(threading.current_thread())
+            return func
+
+        scheduler = Scheduler(2, wrap=wrap)
+        scheduler.add_step('a', lambda: None)
+        scheduler.add_step('b', lambda: None)
+        scheduler.run()
+        self.assertEquals(wrapped_on, [threading.current_thread()] * 2)
+
+    def test_critical_path(self):
+        scheduler = Scheduler(2)
+        scheduler.add_step('a', lambda: None)
+        scheduler.add_step('b', lambda: None, ['a'])
+        scheduler.run()
+        self.assertEquals([s.name for s in scheduler.critical_path()],
+                          ['a', 'b'])
@@ -0,0 +1,67 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import unittest2
+
+from opencenter import history, loadtest, timeouts
+from opencenter.stats import median, percentile
+
+
+class PercentileTest(unittest2.TestCase):
+
+    def test_nearest_rank(self):
+        values = range(1, 101)
+        self.assertEquals(percentile(values, 50), 50)
+        self.assertEquals(percentile(values, 90), 90)
+        self.assertEquals(percentile(values, 99), 99)
+        self.assertEquals(percentile(values, 100), 100)
+        self.assertEquals(percentile(range(1, 11), 50), 5)
+        self.assertEquals(percentile(range(1, 11), 91), 10)
+
+    def test_unsorted_and_small(self):
+        self.assertEquals(percentile([3, 1, 2], 50), 2)
+        self.assertEquals(percentile([5], 99), 5)
+        self.assertEquals(percentile([5], 0), 5)
+        self.assertEquals(percentile([], 50), None)
+
+    def test_median(self):
+        self.assertEquals(median([4, 1, 3, 2]), 2)
+        self.assertEquals(median([4, 1, 3]), 3)
+
+    def test_reports_share_one_helper(self):
+        self.assertTrue(loadtest.percentile is percentile)
+        self.assertTrue(history.median is median)
+        self.assertTrue(timeouts.percentile is percentile)
+
+
+class LoadStatsTest(unittest2.TestCase):
+
+    def test_report(self):
+        stats = loadtest.LoadStats()
+        for ms in range(1, 101):
+            stats.record('list_nodes', ms / 1000.0)
+        stats.record('execute', 0.5, error='HTTP 500')
+        stats.record_late()
+        report = stats.report()
+        self.assertEquals(report['total'], 101)
+        self.assertEquals(report['errors'], 1)
+        self.assertEquals(report['late'], 1)
+        nodes = report['operations']['list_nodes']
+        self.assertEquals(nodes['count'], 100)
+        self.assertEquals((nodes['p50_ms'], nodes['p99_ms'],
+                           nodes['max_ms']), (50, 99, 100))
+        self.assertEquals(report['operations']['execute']['error_reasons'],
+                          {'HTTP 500': 1})
+
+    def test_sample_is_bounded(self):
+        stats = loadtest.LoadStats(reservoir_size=50)
+        for ms in range(1, 1001):
+            stats.record('list_nodes', ms / 1000.0)
+        self.assertEquals(len(stats.latencies['list_nodes']), 50)
+        nodes = stats.report()['operations']['list_nodes']
+        self.assertEquals(nodes['count'], 1000)
+        self.assertEquals(nodes['max_ms'], 1000)
+        self.assertTrue(0 < nodes['p50_ms'] <= 1000)
+
+    def test_needs_an_actor(self):
+        self.assertRaises(ValueError, loadtest.run_load, 'http://localhost',
+                          agents=0, operators=0)
@@ -0,0 +1,102 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import time
+
+import unittest2
+
+from opencenter.tasks import TaskTimeout, TaskTracker, TaskUpdateFeed
+
+
+class FakeTask(object):
+
+    def __init__(self, task_id, state):
+        self.id = task_id
+        self.state = state
+
+
+class FakeNode(object):
+    """Each read of tasks gives the next scripted list, then the last."""
+
+    def __init__(self, script):
+        self.script = script
+        self.reads = 0
+
+    @property
+    def tasks(self):
+        self.reads += 1
+        states = self.script.pop(0) if len(self.script) > 1 \
+            else self.script[0]
+        return [FakeTask(task_id, state) for task_id, state in states]
+
+
+class FakeEndpoint(object):
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+
+class TaskTrackerTest(unittest2.TestCase):
+
+    def tracker(self, script, **kwargs):
+        self.node = FakeNode(script)
+        self.sleeps = []
+        kwargs.setdefault('quiet_period', 0)
+        return TaskTracker(FakeEndpoint({7: self.node}), poll_interval=1,
+                           max_poll_interval=4, sleep=self.sleeps.append,
+                           **kwargs)
+
+    def test_waits_for_the_chain_to_finish(self):
+        tracker = self.tracker([[(1, 'running')],
+                                [(1, 'done'), (2, 'pending')],
+                                [(1, 'done'), (2, 'running')],
+                                [(1, 'done'), (2, 'done')]])
+        tasks = tracker.wait_for_quiescence(7)
+        self.assertEquals([(t.id, t.state) for t in tasks],
+                          [(1, 'done'), (2, 'done')])
+        self.assertEquals(self.node.reads, 4)
+
+    def test_backs_off_while_nothing_changes(self):
+        tracker = self.tracker([[(1, 'running')]] * 5 + [[(1, 'done')]])
+        tracker.wait_for_quiescence(7)
+        self.assertEquals(self.sleeps, [1, 2, 4, 4, 4])
+
+    def test_quiet_period(self):
+        tracker = self.tracker([[(1, 'done')]], quiet_period=0.05)
+        tracker.feed.sleep = time.sleep
+        started = time.time()
+        tracker.wait_for_quiescence(7)
+        self.assertTrue(time.time() - started >= 0.05)
+
+    def test_timeout(self):
+        tracker = self.tracker([[(1, 'running')]])
+        self.assertRaises(TaskTimeout, tracker.wait_for_quiescence, 7, 0)
+
+
+class FakeRest(object):
+
+    def __init__(self, status, body=None):
+        self.status = status
+        self.body = body
+        self.calls = 0
+
+    def get(self, path, **kwargs):
+        self.calls += 1
+        return self.status, self.body
+
+
+class TaskUpdateFeedTest(unittest2.TestCase):
+
+    def test_returns_the_new_transaction(self):
+        feed = TaskUpdateFeed(FakeRest(200, {'transaction': {'txid': 9}}),
+                              sleep=self.fail)
+        self.assertEquals(feed.wait(3, 1), 9)
+
+    def test_falls_back_to_sleeping(self):
+        sleeps = []
+        rest = FakeRest(404)
+        feed = TaskUpdateFeed(rest, sleep=sleeps.append)
+        self.assertEquals(feed.wait(3, 1), 3)
+        self.assertFalse(feed.supported)
+        feed.wait(3, 2)
+        self.assertEquals(rest.calls, 1)
+        self.assertEquals(sleeps, [1, 2])
@@ -0,0 +1,99 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from opencenter.tasklogs import TaskLogTailer
+
+
+class FakeRest(object):
+    """Serves each task's log from the requested offset in chunks of
+    chunk_size, or from the start whatever the offset with
+    ignore_offset, and reports the task as done with result_code."""
+
+    def __init__(self, logs, result_code=0, chunk_size=4,
+                 ignore_offset=False, logs_status=200):
+        self.logs = logs
+        self.result_code = result_code
+        self.chunk_size = chunk_size
+        self.ignore_offset = ignore_offset
+        self.logs_status = logs_status
+        self.log_gets = 0
+
+    def get(self, path, params=None):
+        parts = path.strip('/').split('/')
+        task_id = int(parts[1])
+        if parts[2:] == ['logs']:
+            self.log_gets += 1
+            if self.logs_status != 200:
+                return self.logs_status, None
+            offset = 0 if self.ignore_offset else params['offset']
+            return 200, {'log': self.logs[task_id][
+                offset:offset + self.chunk_size]}
+        return 200, {'task': {'id': task_id, 'state': 'done',
+                              'result': {'result_code': self.result_code}}}
+
+
+class TaskLogTailerTest(unittest2.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def capture(self, rest, task_id=1, **kwargs):
+        tailer = TaskLogTailer(rest, self.log_dir, interval=60, **kwargs)
+        with tailer.capture(task_id) as log:
+            pass
+        return tailer, log
+
+    def read(self, log):
+        with open(log.path) as log_file:
+            return log_file.read()
+
+    def test_failed_task_log_kept(self):
+        rest = FakeRest({1: 'line one\nline two\n'}, result_code=1)
+        tailer, log = self.capture(rest, prefix='http://server:8443')
+        self.assertTrue(log.failed)
+        self.assertTrue(log.kept)
+        self.assertEquals(self.read(log), 'line one\nline two\n')
+        self.assertEquals(os.path.basename(log.path),
+                          'http_server_8443-task-1.log')
+
+    def test_successful_logs_dropped_beyond_keep(self):
+        rest = FakeRest({1: 'one\n', 2: 'two\n'})
+        tailer = TaskLogTailer(rest, self.log_dir, keep_successful=1)
+        logs = []
+        for task_id in (1, 2):
+            with tailer.capture(task_id) as log:
+                logs.append(log)
+        self.assertEquals([log.failed for log in logs], [False, False])
+        self.assertEquals(os.listdir(self.log_dir), ['task-2.log'])
+
+    def test_finish_stops_when_the_offset_is_ignored(self):
+        rest = FakeRest({1: 'the same chunk'}, result_code=1,
+                        ignore_offset=True, chunk_size=100)
+        tailer, log = self.capture(rest)
+        self.assertEquals(self.read(log), 'the same chunk')
+        self.assertEquals(rest.log_gets, 2)
+
+    def test_finish_read_limit(self):
+        rest = FakeRest({1: ''.join('%04d' % i for i in range(100))},
+                        result_code=1)
+        tailer = TaskLogTailer(rest, self.log_dir)
+        tailer.FINISH_MAX_READS = 3
+        with tailer.capture(1) as log:
+            pass
+        self.assertEquals(log.offset, 12)
+
+    def test_no_log_endpoint(self):
+        rest = FakeRest({1: 'never read'}, logs_status=404)
+        tailer, log = self.capture(rest)
+        self.assertFalse(tailer.supported)
+        self.assertEquals(rest.log_gets, 1)
+        self.assertFalse(log.failed)
+        self.assertFalse(log.kept)
@@ -0,0 +1,102 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import re
+
+import unittest2
+
+from opencenter.tasks import TaskGroup, TaskTimeout
+
+
+def task(task_id, state, node_id=None, result_code=0):
+    return {'id': task_id, 'node_id': node_id or task_id, 'state': state,
+            'result': {'result_code': result_code}}
+
+
+class FakeRest(object):
+    """Serves each task's scripted states in turn, the last one for
+    good, and has no task update feed. Tasks in unlisted are left out
+    of tasks/filter results."""
+
+    def __init__(self, script, unlisted=()):
+        self.script = script
+        self.unlisted = set(unlisted)
+        self.gets = []
+        self.filters = []
+
+    def post(self, path, body):
+        ids = [int(task_id) for task_id in
+               re.findall(r'id = (\d+)', body['filter'])]
+        self.filters.append(ids)
+        return 200, {'tasks': [self._next(task_id) for task_id in ids
+                               if task_id not in self.unlisted]}
+
+    def get(self, path, **kwargs):
+        self.gets.append(path)
+        parts = path.strip('/').split('/')
+        if parts[:2] == ['tasks', 'updates']:
+            return 404, None
+        return 200, {'task': self._next(int(parts[1]))}
+
+    def _next(self, task_id):
+        states = self.script[task_id]
+        return states.pop(0) if len(states) > 1 else states[0]
+
+
+class TaskGroupTest(unittest2.TestCase):
+
+    def group(self, script, unlisted=(), **kwargs):
+        self.rest = FakeRest(script, unlisted)
+        return TaskGroup(self.rest, [task(task_id, 'pending')
+                                     for task_id in script],
+                         poll_interval=0, sleep=lambda seconds: None,
+                         **kwargs)
+
+    def test_waits_until_all_finished(self):
+        group = self.group({1: [task(1, 'running'), task(1, 'done')],
+                            2: [task(2, 'done')]})
+        tasks = group.wait()
+        self.assertEquals([t['state'] for t in tasks], ['done', 'done'])
+        self.assertEquals(group.pending(), [])
+        self.assertEquals(group.failed(), [])
+        self.assertEquals(group.node_ids, [1, 2])
+
+    def test_durations_for_finished_tasks_only(self):
+        group = self.group({1: [task(1, 'done')],
+                            2: [task(2, 'running')]})
+        self.assertRaises(TaskTimeout, group.wait, 0)
+        durations = group.durations()
+        self.assertEquals(durations.keys(), [1])
+        self.assertTrue(durations[1] >= 0)
+        self.assertEquals(group.pending(), [2])
+
+    def test_failed(self):
+        group = self.group({1: [task(1, 'done', result_code=1)],
+                            2: [task(2, 'cancelled')],
+                            3: [task(3, 'done')]})
+        group.wait()
+        self.assertEquals(sorted(t['id'] for t in group.failed()), [1, 2])
+
+    def test_timeout_names_pending_tasks(self):
+        group = self.group({7: [task(7, 'running')]})
+        try:
+            group.wait(0)
+        except TaskTimeout as e:
+            self.assertTrue('[7]' in str(e))
+        else:
+            self.fail('TaskTimeout not raised')
+
+    def test_large_groups_use_one_filter(self):
+        script = dict((task_id, [task(task_id, 'done')])
+                      for task_id in range(1, 21))
+        group = self.group(script, batch_threshold=10)
+        group.wait()
+        self.assertEquals(self.rest.filters, [range(1, 21)])
+        self.assertEquals(self.rest.gets, [])
+
+    def test_tasks_left_out_of_the_filter_fetched_singly(self):
+        script = dict((task_id, [task(task_id, 'done')])
+                      for task_id in range(1, 21))
+        group = self.group(script, unlisted=[4, 9], batch_threshold=10)
+        group.wait()
+        self.assertEquals(group.pending(), [])
+        self.assertEquals(self.rest.gets, ['tasks/4', 'tasks/9'])
@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import unittest2
+
+from opencenter.timeline import Timeline
+
+
+class TimelineTest(unittest2.TestCase):
+
+    def setUp(self):
+        self.timeline = Timeline()
+
+    def test_nested_phases(self):
+        with self.timeline.phase('happy_path'):
+            with self.timeline.phase('reparent'):
+                self.assertEquals(self.timeline.current(),
+                                  ['happy_path', 'reparent'])
+        self.assertEquals(self.timeline.current(), [])
+        paths = [event['path'] for event in self.timeline.events]
+        self.assertEquals(paths, [['happy_path', 'reparent'],
+                                  ['happy_path']])
+
+    def test_phase_closed_on_error(self):
+        try:
+            with self.timeline.phase('broken'):
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEquals(self.timeline.current(), [])
+        self.assertEquals(len(self.timeline.events), 1)
+
+    def test_calls_counted_per_phase(self):
+        self.timeline.count_call()
+        with self.timeline.phase('a'):
+            self.timeline.count_call()
+            self.timeline.count_call()
+        self.assertEquals(self.timeline.api_calls, {'root': 1, 'a': 2})
+
+    def call_in_thread(self, func):
+        thread = threading.Thread(target=func)
+        thread.start()
+        thread.join()
+
+    def test_threads_start_at_root(self):
+        with self.timeline.phase('a'):
+            self.call_in_thread(self.timeline.count_call)
+        self.assertEquals(self.timeline.api_calls, {'root': 1})
+
+    def test_wrap_carries_the_phase_into_threads(self):
+        with self.timeline.phase('a'):
+            with self.timeline.phase('b'):
+                wrapped = self.timeline.wrap(self.timeline.count_call)
+            self.call_in_thread(wrapped)
+        self.assertEquals(self.timeline.api_calls, {'a;b': 1})
+
+    def test_sleep(self):
+        with self.timeline.phase('a'):
+            self.timeline.sleep(0.01)
+        self.assertTrue(self.timeline.sleeps['a'] >= 0.01)
+        self.assertTrue(self.timeline.to_dict()['sleep_time'] >= 0.01)
+
+    def test_folded_gives_self_time(self):
+        self.timeline.events = [
+            {'path': ['a'], 'start': 0, 'duration': 3.0, 'thread': 't'},
+            {'path': ['a', 'b'], 'start': 0, 'duration': 1.0, 'thread': 't'},
+            {'path': ['a', 'b'], 'start': 1, 'duration': 0.5, 'thread': 't'},
+        ]
+        self.assertEquals(self.timeline.folded(), 'a 1500\na;b 1500\n')
+
+    def test_write(self):
+        with self.timeline.phase('a'):
+            pass
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            basename = os.path.join(tmp_dir, 'run')
+            self.timeline.write(basename)
+            with open(basename + '.json') as json_file:
+                data = json.load(json_file)
+            self.assertTrue(os.path.exists(basename + '.folded'))
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEquals([event['path'] for event in data['events']],
+                          [['a']])
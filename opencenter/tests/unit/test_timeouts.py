@@ -0,0 +1,84 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from opencenter.history import History, RunTimings
+from opencenter.timeouts import TimeoutPolicy, cancel_task
+
+
+class TimeoutPolicyTest(unittest2.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, 'history.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def save(self, adventure, durations, ok=True):
+        history = History(self.db)
+        try:
+            for duration in durations:
+                timings = RunTimings()
+                timings.add(adventure, 'node1', duration, ok)
+                history.save_run('happy', 'lab', 'url', timings, ok)
+        finally:
+            history.close()
+
+    def policy(self, **kwargs):
+        return TimeoutPolicy(default=600, factor=3, minimum=60,
+                             history_db=self.db, cluster='lab', **kwargs)
+
+    def test_default_without_history(self):
+        self.assertEquals(TimeoutPolicy(default=600).timeout('reparent'), 600)
+        self.save('reparent', [10, 20])
+        self.assertEquals(self.policy().timeout('reparent'), 600)
+
+    def test_learned_from_history(self):
+        self.save('Install Chef Server', [100, 110, 120, 130, 200])
+        self.assertEquals(self.policy().timeout('Install Chef Server'), 600)
+        self.save('reparent', [5, 6, 7, 8, 9])
+        self.assertEquals(self.policy().timeout('reparent'), 60)
+
+    def test_failed_attempts_ignored(self):
+        self.save('reparent', [100] * 5, ok=False)
+        self.assertEquals(self.policy().timeout('reparent'), 600)
+
+    def test_override_wins(self):
+        self.save('reparent', [100] * 5)
+        policy = self.policy(overrides={'Reparent': '45'})
+        self.assertEquals(policy.timeout('reparent'), 45)
+
+
+class FakeRest(object):
+
+    def __init__(self):
+        self.puts = []
+
+    def put(self, path, body):
+        self.puts.append((path, body))
+        return 200, {}
+
+    def get(self, path, params=None):
+        if path.endswith('/logs'):
+            return 200, {'log': '\n'.join('line %d' % i for i in range(50))}
+        return 200, {'task': {'id': 3, 'state': 'cancelled'}}
+
+
+class CancelTaskTest(unittest2.TestCase):
+
+    def test_report(self):
+        rest = FakeRest()
+        task, report = cancel_task(rest, 3, log_lines=2)
+        self.assertEquals(rest.puts, [('tasks/3', {'state': 'cancelled'})])
+        self.assertEquals(task['state'], 'cancelled')
+        self.assertTrue(report.startswith('cancelled stuck task 3:'))
+        self.assertTrue(report.endswith('line 48\nline 49'))
+
+    def test_without_log(self):
+        task, report = cancel_task(FakeRest(), 3, fetch_log=False)
+        self.assertFalse('line' in report)
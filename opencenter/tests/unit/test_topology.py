@@ -0,0 +1,98 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import unittest2
+
+from opencenter.config import Snapshot
+from opencenter.topology import (Placement, Topology, natural_key,
+                                 placement_from_config, reserved_names)
+
+
+def agents(count, prefix='opencenter-agent'):
+    return ['%s%d' % (prefix, index) for index in range(1, count + 1)]
+
+
+class FakeRegistry(object):
+    """NodeRegistry stand in: partial names match the first name that
+    contains them."""
+
+    def __init__(self, names):
+        self._names = names
+
+    def names(self, backend=None):
+        return list(self._names)
+
+    def find(self, partial_name):
+        for name in self._names:
+            if partial_name in name:
+                return Snapshot('node', {'name': name})
+        raise ValueError(partial_name)
+
+
+def configs(server, chef, pattern=None, controllers=1, computes=2):
+    opencenter = Snapshot('opencenter', {
+        'instance_server_hostname': server,
+        'instance_chef_hostname': chef,
+        'instance_controller_hostname': ('c1', ),
+        'instance_compute_hostname': ('n1', 'n2')})
+    topology = Snapshot('topology', {
+        'controllers': controllers, 'availability_zones': ('nova', 'az2'),
+        'computes_per_az': computes, 'agent_pattern': pattern,
+        'wave_size': 0})
+    return opencenter, topology
+
+
+class TopologyTest(unittest2.TestCase):
+
+    def test_natural_order(self):
+        self.assertEquals(sorted(['a10', 'a9', 'a1'], key=natural_key),
+                          ['a1', 'a9', 'a10'])
+
+    def test_place(self):
+        placement = Topology(2, ['nova', 'az2'], 2).place(agents(8))
+        self.assertEquals(placement.controllers,
+                          ['opencenter-agent1', 'opencenter-agent2'])
+        self.assertEquals(placement.zones, [
+            ('nova', ['opencenter-agent3', 'opencenter-agent4']),
+            ('az2', ['opencenter-agent5', 'opencenter-agent6'])])
+        self.assertEquals(len(placement), 6)
+
+    def test_too_few_agents(self):
+        self.assertRaises(ValueError, Topology(3, ['nova'], 10).place,
+                          agents(12))
+
+    def test_compute_waves(self):
+        placement = Placement(['c'], [('nova', ['a', 'b', 'c']),
+                                      ('az2', ['d', 'e'])])
+        self.assertEquals(placement.compute_waves(2), [
+            [('nova', 'a'), ('nova', 'b')],
+            [('nova', 'c'), ('az2', 'd')],
+            [('az2', 'e')]])
+        self.assertEquals(len(placement.compute_waves(0)), 1)
+        self.assertEquals(len(placement.compute_waves(0)[0]), 5)
+        self.assertEquals(Placement(['c'], []).compute_waves(0), [])
+
+
+class PlacementFromConfigTest(unittest2.TestCase):
+
+    def test_host_lists_without_topology(self):
+        opencenter, topology = configs('server', 'agent1', controllers=None)
+        placement = placement_from_config(opencenter, topology, None)
+        self.assertEquals(placement.controllers, ['c1'])
+        self.assertEquals(placement.zones, [('nova', ['n1', 'n2'])])
+
+    def test_reserved_names_resolved_like_find_node(self):
+        names = ['jenkins-123-opencenter-server', 'jenkins-123-agent1',
+                 'jenkins-123-agent2']
+        opencenter, _ = configs('opencenter-server', 'agent1')
+        self.assertEquals(reserved_names(opencenter, FakeRegistry(names)),
+                          set(names[:2]))
+
+    def test_reserved_nodes_get_no_role(self):
+        names = ['jenkins-7-agent%d' % index for index in range(1, 7)]
+        opencenter, topology = configs('server', 'agent1', pattern='agent',
+                                       controllers=1, computes=2)
+        placement = placement_from_config(opencenter, topology,
+                                          FakeRegistry(names))
+        self.assertEquals(placement.controllers, ['jenkins-7-agent2'])
+        self.assertFalse('jenkins-7-agent1' in placement.computes)
+        self.assertEquals(len(placement.computes), 4)
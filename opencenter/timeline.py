@@ -0,0 +1,155 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import contextlib
+import json
+import threading
+import time
+
+import requests
+
+
+class Timeline(object):
+    """Records how long each phase of a run takes.
+
+    Phases nest: the path of a phase is the list of phase names open in
+    the calling thread. Besides the duration of every phase, the timeline
+    counts HTTP requests made while a phase is open (once
+    install_http_hooks has been called) and time spent in sleep()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.events = []
+            self.api_calls = {}
+            self.sleeps = {}
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        return list(self._stack())
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stack = self._stack()
+        stack.append(name)
+        path = list(stack)
+        started = time.time()
+        try:
+            yield
+        finally:
+            ended = time.time()
+            stack.pop()
+            with self._lock:
+                self.events.append({
+                    'path': path,
+                    'start': round(started - self.started, 6),
+                    'duration': round(ended - started, 6),
+                    'thread': threading.current_thread().name,
+                })
+
+    def wrap(self, func):
+        """Return func bound to the caller's current phase, so calls made
+        from worker threads are attributed to the phase that started
+        them."""
+        path = self.current()
+
+        def wrapped(*args, **kwargs):
+            saved = self._stack()[:]
+            self._local.stack = list(path)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.stack = saved
+        return wrapped
+
+    def sleep(self, seconds):
+        started = time.time()
+        time.sleep(seconds)
+        key = ';'.join(self._stack()) or 'root'
+        with self._lock:
+            self.sleeps[key] = self.sleeps.get(key, 0) + time.time() - started
+
+    def count_call(self):
+        key = ';'.join(self._stack()) or 'root'
+        with self._lock:
+            self.api_calls[key] = self.api_calls.get(key, 0) + 1
+
+    def install_http_hooks(self):
+        """Count every request made through the requests library."""
+        install_http_hook(self.count_call)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'events': sorted(self.events, key=lambda e: e['start']),
+                'api_calls': dict(self.api_calls),
+                'sleeps': dict((k, round(v, 6))
+                               for k, v in self.sleeps.items()),
+                'sleep_time': round(sum(self.sleeps.values()), 6),
+            }
+
+    def folded(self):
+        """Return the timeline in the folded stack format read by
+        flamegraph.pl: one `phase;subphase self_time_ms` line per path."""
+        totals = {}
+        with self._lock:
+            for event in self.events:
+                key = tuple(event['path'])
+                totals[key] = totals.get(key, 0) + event['duration']
+        lines = []
+        for path, total in sorted(totals.items()):
+            children = sum(duration for child, duration in totals.items()
+                           if len(child) == len(path) + 1 and
+                           child[:len(path)] == path)
+            self_ms = int(max(total - children, 0) * 1000)
+            if self_ms:
+                lines.append('%s %d' % (';'.join(path), self_ms))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, basename):
+        """Write basename.json and basename.folded."""
+        with open(basename + '.json', 'w') as json_file:
+            json.dump(self.to_dict(), json_file, indent=2, sort_keys=True)
+        with open(basename + '.folded', 'w') as folded_file:
+            folded_file.write(self.folded())
+
+
+_hooks = []
+
+
+def install_http_hook(callback):
+    """Call callback() before every HTTP request sent by requests.
+
+    Patches Session.send on requests >= 1.0 and Request.send on the 0.x
+    series the client is pinned to."""
+    if not _hooks:
+        if hasattr(requests.sessions.Session, 'send'):
+            owner = requests.sessions.Session
+        else:
+            owner = requests.models.Request
+        original = owner.send
+
+        def send(*args, **kwargs):
+            for hook in _hooks:
+                hook()
+            return original(*args, **kwargs)
+        owner.send = send
+    if callback not in _hooks:
+        _hooks.append(callback)
+
+
+_timeline = Timeline()
+
+
+def get_timeline():
+    """The process wide timeline used by the test cases."""
+    return _timeline
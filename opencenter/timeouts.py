@@ -0,0 +1,71 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+import json
+import threading
+
+from opencenter.history import History
+from opencenter.stats import percentile
+
+
+class TimeoutPolicy(object):
+    """How long to wait for an adventure's task before giving up on it.
+
+    An override for the adventure (the [task_timeouts] config section,
+    keyed by lower cased adventure name) wins. Otherwise, with at least
+    min_samples successful durations of the adventure on this cluster in
+    the history database, the timeout is their p99 times factor, but no
+    less than minimum. Without history it is `default`."""
+
+    def __init__(self, default=3600.0, factor=3.0, minimum=60.0,
+                 min_samples=5, overrides=None, history_db=None,
+                 cluster=None):
+        self.default = default
+        self.factor = factor
+        self.minimum = minimum
+        self.min_samples = min_samples
+        self.overrides = dict((name.lower(), float(value))
+                              for name, value in (overrides or {}).items())
+        self.history_db = history_db
+        self.cluster = cluster
+        self._learned = {}
+        self._lock = threading.Lock()
+
+    def timeout(self, adventure):
+        if adventure.lower() in self.overrides:
+            return self.overrides[adventure.lower()]
+        with self._lock:
+            if adventure not in self._learned:
+                self._learned[adventure] = self._learn(adventure)
+            return self._learned[adventure]
+
+    def _learn(self, adventure):
+        if not (self.history_db and self.cluster):
+            return self.default
+        # sqlite connections are per thread, open one for the lookup
+        history = History(self.history_db)
+        try:
+            durations = history.durations(self.cluster, adventure)
+        finally:
+            history.close()
+        if len(durations) < self.min_samples:
+            return self.default
+        return max(percentile(durations, 99) * self.factor, self.minimum)
+
+
+def cancel_task(rest, task_id, fetch_log=True, log_lines=40):
+    """Cancel a stuck task. Returns the task dict and a report of its
+    state, and unless fetch_log is False the end of its log, to go in
+    the failure message."""
+    rest.put('tasks/%s' % task_id, {'state': 'cancelled'})
+    status, body = rest.get('tasks/%s' % task_id)
+    task = (body or {}).get('task') if status == 200 else None
+    lines = ['cancelled stuck task %s:' % task_id,
+             json.dumps(task, indent=2, sort_keys=True)]
+    if fetch_log:
+        status, body = rest.get('tasks/%s/logs' % task_id,
+                                params={'offset': 0})
+        log = (body or {}).get('log') if status == 200 else None
+        if log:
+            lines.append('last %d lines of its log:' % log_lines)
+            lines.extend(log.splitlines()[-log_lines:])
+    return task, '\n'.join(lines)
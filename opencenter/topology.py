@@ -0,0 +1,117 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+"""
+Cluster topologies for the happy path.
+
+A Topology asks for a number of controllers and a number of computes in
+each availability zone. place() expands it over the agents the server
+knows about into a Placement: which agent becomes a controller and
+which a compute in which zone. Without a [topology] section the
+controller and compute hostname lists from [opencenter] are used as
+before, with every compute in AZ nova.
+"""
+
+import re
+
+
+DEFAULT_ZONE = 'nova'
+
+
+def natural_key(name):
+    """Sort key putting opencenter-agent9 before opencenter-agent10."""
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', name)]
+
+
+def zone_container(zone):
+    """Name of the container node holding zone's computes."""
+    return 'AZ %s' % zone
+
+
+class Placement(object):
+    """Node names by role: controllers, and computes per zone as a list
+    of (zone, [names]) in zone order."""
+
+    def __init__(self, controllers, zones):
+        self.controllers = list(controllers)
+        self.zones = [(zone, list(names)) for zone, names in zones]
+
+    @property
+    def computes(self):
+        return [name for zone, names in self.zones for name in names]
+
+    def __len__(self):
+        return len(self.controllers) + len(self.computes)
+
+    def compute_waves(self, size):
+        """The computes in waves of at most size (all in one wave if size
+        is 0), each a list of (zone, name). Zones are filled one after
+        the other so a wave spans as few containers as possible."""
+        computes = [(zone, name) for zone, names in self.zones
+                    for name in names]
+        if not size:
+            return [computes] if computes else []
+        return [computes[start:start + size]
+                for start in range(0, len(computes), size)]
+
+
+class Topology(object):
+
+    def __init__(self, controllers=1, zones=(DEFAULT_ZONE, ),
+                 computes_per_zone=0):
+        if controllers < 1:
+            raise ValueError('a topology needs at least one controller')
+        if not zones:
+            raise ValueError('a topology needs at least one zone')
+        self.controllers = controllers
+        self.zones = list(zones)
+        self.computes_per_zone = computes_per_zone
+
+    def __len__(self):
+        return self.controllers + len(self.zones) * self.computes_per_zone
+
+    def place(self, agents):
+        """Assign agent names to roles in natural name order, so the same
+        agents get the same roles on every run. Raises ValueError when
+        there are too few agents."""
+        agents = sorted(agents, key=natural_key)
+        if len(agents) < len(self):
+            raise ValueError('topology needs %d agents, only %d available' %
+                             (len(self), len(agents)))
+        controllers = agents[:self.controllers]
+        computes = agents[self.controllers:len(self)]
+        per_zone = self.computes_per_zone
+        zones = [(zone, computes[index * per_zone:(index + 1) * per_zone])
+                 for index, zone in enumerate(self.zones)]
+        return Placement(controllers, zones)
+
+
+def reserved_names(opencenter_config, nodes):
+    """Names of the server and chef server nodes, resolved like every
+    other partial hostname through the NodeRegistry nodes."""
+    reserved = set()
+    for partial_name in (opencenter_config.instance_server_hostname,
+                         opencenter_config.instance_chef_hostname):
+        try:
+            reserved.add(nodes.find(partial_name).name)
+        except ValueError:
+            pass
+    return reserved
+
+
+def placement_from_config(opencenter_config, topology_config, nodes):
+    """The Placement for the config: topology_config expanded over the
+    agents in NodeRegistry nodes matching its agent_pattern if it sets
+    controllers, otherwise the configured hostname lists. The server
+    and chef server are never given a role."""
+    if not topology_config.controllers:
+        return Placement(opencenter_config.instance_controller_hostname,
+                         [(DEFAULT_ZONE,
+                           opencenter_config.instance_compute_hostname)])
+    reserved = reserved_names(opencenter_config, nodes)
+    pattern = re.compile(topology_config.agent_pattern or '')
+    agents = [name for name in nodes.names('agent')
+              if name not in reserved and pattern.search(name)]
+    return Topology(topology_config.controllers,
+                    topology_config.availability_zones,
+                    topology_config.computes_per_az).place(agents)
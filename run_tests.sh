@@ -6,10 +6,13 @@ function usage {
   echo ""
   echo "  -V, --virtual-env        Always use virtualenv.  Install automatically if not present"
   echo "  -N, --no-virtual-env     Don't use virtualenv.  Run tests in local environment"
-  echo "  -f, --force              Force a clean re-build of the virtual environment. Useful when dependencies have been added."
+  echo "  -f, --force              Force a clean re-build of the virtual environment. Not needed when dependencies have been added."
+  echo "  -O, --offline            Install the virtual environment from the local wheel cache only"
   echo "  -p, --pep8               Just run pep8"
   echo "  -c, --coverage           Generate coverage report"
   echo "  -H, --html               Generate coverage report html, if -c"
+  echo "  -P, --parallel           Split the test classes across the targets in etc/opencenter-targets.conf"
+  echo "  -u, --unit               Just run the offline unit tests, no opencenter-server needed"
   echo "  -h, --help               Print this usage message"
   echo ""
   echo "Note: with no options specified, the script will try to run the tests in a virtual environment,"
@@ -24,9 +27,12 @@ function process_option {
     -V|--virtual-env) always_venv=1; never_venv=0;;
     -N|--no-virtual-env) always_venv=0; never_venv=1;;
     -f|--force) force=1;;
+    -O|--offline) installvenvopts="$installvenvopts --offline";;
     -p|--pep8) just_pep8=1;;
     -c|--coverage) coverage=1;;
     -H|--html) html=1;;
+    -P|--parallel) parallel=1;;
+    -u|--unit) unit=1;;
 
     -*) noseopts="$noseopts $1";;
     *) noseargs="$noseargs $1"
@@ -39,13 +45,15 @@ always_venv=0
 never_venv=0
 force=0
 #no_site_packages=0
-# installvenvopts=
+installvenvopts=
 noseargs=
 noseopts="-v"
 wrapper=""
 just_pep8=0
 coverage=0
 html=0
+parallel=0
+unit=0
 
 
 for arg in "$@"; do
@@ -59,8 +67,12 @@ if [ $coverage -eq 1 ]; then
 fi
 
 function run_tests {
-  # Cleanup *pyc
-  ${wrapper} find . -type f -name "*.pyc" -delete
+  # Cleanup *pyc left behind by removed or renamed modules; the rest are
+  # still valid and save recompiling everything on every run
+  ${wrapper} find . -path ./${venv} -prune -o -type f -name "*.pyc" -print |
+    while read pyc; do
+      [ -e "${pyc%c}" ] || rm -f "$pyc"
+    done
   # Just run the test suites in current environment
   ${wrapper} $NOSETESTS
   RESULT=$?
@@ -76,6 +88,16 @@ function run_tests {
   return $RESULT
 }
 
+function venv_is_current {
+  # install_venv.py stamps every environment it finishes with this, so
+  # an up to date one is recognised without starting python on it
+  requires=`(sha1sum tools/pip-requires 2>/dev/null ||
+             shasum tools/pip-requires) | cut -d' ' -f1`
+  [ -f ${venv}/requirements.id ] &&
+    [ "`cat ${venv}/requirements.id`" = \
+      "$requires `python -V 2>&1` `uname -m`" ]
+}
+
 function run_pep8 {
   echo "Running pep8 ..."
   PEP8_EXCLUDE=".venv"
@@ -86,29 +108,32 @@ function run_pep8 {
 
 
 NOSETESTS="nosetests $noseopts $noseargs opencenter/tests/*.py"
+if [ $parallel -eq 1 ]; then
+  NOSETESTS="python test_runner.py --parallel --xunit nosetests.xml $noseargs"
+fi
+if [ $unit -eq 1 ]; then
+  NOSETESTS="nosetests $noseopts $noseargs opencenter/tests/unit"
+fi
 
 if [ $never_venv -eq 0 ]
 then
-  # Remove the virtual environment if --force used
+  # Rebuild the virtual environment if --force used
   if [ $force -eq 1 ]; then
-    echo "Cleaning virtualenv..."
-    rm -rf ${venv}
+    installvenvopts="$installvenvopts --force"
   fi
-  if [ -e ${venv} ]; then
+  if [ -e ${venv} -o $always_venv -eq 1 ]; then
+    # Picks up changes to tools/pip-requires, skipped when there are none
+    if [ $force -eq 1 ] || ! venv_is_current; then
+      env python tools/install_venv.py $installvenvopts || exit 1
+    fi
     wrapper="${with_venv}"
   else
-    if [ $always_venv -eq 1 ]; then
-      # Automatically install the virtualenv
-      env python tools/install_venv.py
-      wrapper="${with_venv}"
-    else
-      echo -e "No virtual environment found...create one? (Y/n) \c"
-      read use_ve
-      if [ "x$use_ve" = "xY" -o "x$use_ve" = "x" -o "x$use_ve" = "xy" ]; then
-        # Install the virtualenv and run the test suite in it
-        env python tools/install_venv.py
-        wrapper=${with_venv}
-      fi
+    echo -e "No virtual environment found...create one? (Y/n) \c"
+    read use_ve
+    if [ "x$use_ve" = "xY" -o "x$use_ve" = "x" -o "x$use_ve" = "xy" ]; then
+      # Install the virtualenv and run the test suite in it
+      env python tools/install_venv.py $installvenvopts || exit 1
+      wrapper=${with_venv}
     fi
   fi
 fi
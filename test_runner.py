@@ -1,11 +1,50 @@
 #!/usr/bin/env python
 # vim: tabstop=4 shiftwidth=4 softtabstop=4
 
+import json
+import optparse
 import unittest2
 import sys
 
 
 if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options] [test names]')
+    parser.add_option('-T', '--targets', action='store_true',
+                      help='run the tests against every configured target '
+                           'in parallel worker processes')
+    parser.add_option('--targets-file', metavar='FILE',
+                      help='targets file (default OPENCENTER_TARGETS or '
+                           'etc/opencenter-targets.conf)')
+    parser.add_option('-P', '--parallel', action='store_true',
+                      help='split the test classes across the configured '
+                           'targets instead of running all of them on each')
+    parser.add_option('--report', metavar='FILE',
+                      help='write the merged json report to FILE')
+    parser.add_option('--xunit', metavar='FILE',
+                      help='write a combined xunit report to FILE')
+    options, args = parser.parse_args()
+
+    if options.targets or options.targets_file or options.parallel:
+        from opencenter.config import load_targets
+        from opencenter import multirun
+        targets = load_targets(options.targets_file)
+        # run_tests.sh passes nose style file paths through
+        try:
+            args = [multirun.dotted_name(arg) for arg in args]
+        except ValueError as e:
+            parser.error(str(e))
+        if options.parallel:
+            merged = multirun.shard_tests(targets, args or None)
+        else:
+            merged = multirun.run_targets(targets, args or None)
+        print multirun.format_summary(merged)
+        if options.report:
+            with open(options.report, 'w') as report:
+                json.dump(merged, report, indent=2, sort_keys=True)
+        if options.xunit:
+            multirun.write_xunit(merged, options.xunit)
+        sys.exit(not merged['successful'])
+
     loader = unittest2.TestLoader()
     tests = loader.discover('tests')
     testRunner = unittest2.runner.TextTestRunner(stream=sys.stdout,
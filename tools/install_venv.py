@@ -20,9 +20,19 @@
 
 """
 virtualenv installation script
+
+Environments are built once per combination of tools/pip-requires and
+Python version and kept in a cache directory; .venv is a link to the
+matching one, so an unchanged checkout reuses it without running pip at
+all. Packages go through a local wheelhouse, which --offline installs
+from without touching the network.
 """
 
+import hashlib
+import optparse
 import os
+import platform
+import shutil
 import subprocess
 import sys
 
@@ -31,6 +41,12 @@ ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 VENV = os.path.join(ROOT, '.venv')
 PIP_REQUIRES = os.path.join(ROOT, 'tools', 'pip-requires')
 PY_VERSION = "python%s.%s" % (sys.version_info[0], sys.version_info[1])
+CACHE_DIR = os.environ.get(
+    'OPENCENTER_VENV_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'opencenter-testerator'))
+STAMP_FILE = 'requirements.sha1'
+# The same, in a form run_tests.sh can check without starting python
+SHELL_STAMP_FILE = 'requirements.id'
 
 
 def die(message, *args):
@@ -38,6 +54,17 @@ def die(message, *args):
     sys.exit(1)
 
 
+def env_flag(name):
+    """The boolean value of environment variable name: 1, true, yes
+    and on are true, 0, false, no, off and unset are false."""
+    value = os.environ.get(name, '').strip().lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return True
+    if value in ('', '0', 'false', 'no', 'off'):
+        return False
+    die("%s should be true or false, not %r", name, os.environ[name])
+
+
 def check_python_version():
     if sys.version_info < (2, 6):
         die("Need Python Version >= 2.6")
@@ -84,25 +111,82 @@ def check_dependencies():
     print 'done.'
 
 
+def requirements_hash():
+    """Identifies an environment: the requirements and the interpreter
+    they are installed for."""
+    digest = hashlib.sha1()
+    with open(PIP_REQUIRES) as requires:
+        digest.update(requires.read())
+    digest.update(sys.version)
+    digest.update(platform.machine())
+    return digest.hexdigest()
+
+
+def read_stamp(venv):
+    try:
+        with open(os.path.join(venv, STAMP_FILE)) as stamp:
+            return stamp.read().strip()
+    except IOError:
+        return None
+
+
+def shell_stamp():
+    """What run_tests.sh compares with: the sha1sum of pip-requires,
+    `python -V` and `uname -m`."""
+    with open(PIP_REQUIRES) as requires:
+        requires_sha1 = hashlib.sha1(requires.read()).hexdigest()
+    return '%s Python %s %s' % (requires_sha1, platform.python_version(),
+                                platform.machine())
+
+
+def write_stamp(venv, digest):
+    with open(os.path.join(venv, STAMP_FILE), 'w') as stamp:
+        stamp.write(digest + '\n')
+    with open(os.path.join(venv, SHELL_STAMP_FILE), 'w') as stamp:
+        stamp.write(shell_stamp() + '\n')
+
+
+def remove_venv(venv=VENV):
+    if os.path.islink(venv):
+        os.unlink(venv)
+    elif os.path.exists(venv):
+        shutil.rmtree(venv)
+
+
 def create_virtualenv(venv=VENV):
     """Creates the virtual environment and installs PIP only into the
     virtual environment
     """
     print 'Creating venv...',
-    run_command(['virtualenv', '-q', '--system-site-packages', VENV])
+    run_command(['virtualenv', '-q', '--system-site-packages',
+                 '-p', sys.executable, venv])
     print 'done.'
     print 'Installing pip in virtualenv...',
-    if not run_command(['tools/with_venv.sh', 'easy_install', 'pip']).strip():
+    easy_install = os.path.join(venv, 'bin', 'easy_install')
+    if not run_command([easy_install, 'pip']).strip():
         die("Failed to install pip.")
     print 'done.'
 
 
-def install_dependencies(venv=VENV):
-    print 'Installing dependencies with pip (this can take a while)...'
-    # run_command(['tools/with_venv.sh', 'pip', 'install', '-q', '--upgrade',
-    #             '-r', PIP_REQUIRES], redirect_output=False)
-    run_command(['tools/with_venv.sh', 'pip', 'install', '--upgrade',
-                '-r', PIP_REQUIRES], redirect_output=False)
+def install_dependencies(venv=VENV, wheelhouse=None, offline=False):
+    """Install whatever pip-requires lists that venv doesn't have yet,
+    through the wheelhouse so later environments needn't download or
+    build anything."""
+    pip = os.path.join(venv, 'bin', 'pip')
+    wheelhouse = wheelhouse or os.path.join(CACHE_DIR, 'wheelhouse')
+    if not os.path.isdir(wheelhouse):
+        if offline:
+            die("No wheelhouse at %s to install from offline.", wheelhouse)
+        os.makedirs(wheelhouse)
+    if not offline:
+        print 'Updating wheelhouse %s...' % wheelhouse
+        run_command([pip, 'install', '-q', 'wheel'])
+        run_command([pip, 'wheel', '--wheel-dir', wheelhouse,
+                     '--find-links', wheelhouse, '-r', PIP_REQUIRES],
+                    redirect_output=False)
+    print 'Installing dependencies with pip...'
+    run_command([pip, 'install', '--no-index', '--find-links', wheelhouse,
+                 '-r', PIP_REQUIRES], redirect_output=False)
 
 
 def print_help():
@@ -124,10 +208,53 @@ def print_help():
 
 
 def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('-f', '--force', action='store_true',
+                      help='rebuild the environment even if it is current')
+    parser.add_option('--offline', action='store_true',
+                      default=env_flag('OPENCENTER_VENV_OFFLINE'),
+                      help='install only from the local wheelhouse '
+                           '(default OPENCENTER_VENV_OFFLINE)')
+    parser.add_option('--cache-dir', default=CACHE_DIR,
+                      help='where environments are kept [%default]')
+    parser.add_option('--wheelhouse',
+                      help='wheel cache [CACHE_DIR/wheelhouse]')
+    options, args = parser.parse_args(argv[1:])
+
     check_python_version()
+    digest = requirements_hash()
+    wheelhouse = options.wheelhouse or os.path.join(options.cache_dir,
+                                                    'wheelhouse')
+    cached = os.path.join(options.cache_dir, 'venvs', digest)
+    if options.force:
+        remove_venv(VENV)
+        remove_venv(cached)
+    if read_stamp(VENV) == digest:
+        # Restamped so environments from before requirements.id existed
+        # get one, and run_tests.sh can skip this script next time
+        write_stamp(VENV, digest)
+        print 'Virtual environment is up to date.'
+        return
+
     check_dependencies()
-    create_virtualenv()
-    install_dependencies()
+    if os.path.isdir(VENV) and not os.path.islink(VENV):
+        # An environment of this checkout's own: bring it up to date in
+        # place, which installs only what pip-requires added or changed
+        install_dependencies(VENV, wheelhouse, options.offline)
+        write_stamp(VENV, digest)
+    else:
+        if read_stamp(cached) != digest:
+            # Anything here without a stamp is a half built leftover
+            remove_venv(cached)
+            if not os.path.isdir(os.path.dirname(cached)):
+                os.makedirs(os.path.dirname(cached))
+            create_virtualenv(cached)
+            install_dependencies(cached, wheelhouse, options.offline)
+            write_stamp(cached, digest)
+        else:
+            print 'Reusing cached environment %s' % cached
+        remove_venv(VENV)
+        os.symlink(cached, VENV)
     print_help()
 
 if __name__ == '__main__':